@@ -115,6 +115,220 @@ class IReferralControlPanel(Interface):
         required=False,
     )
 
+    connection_pool_size = schema.Int(
+        title=_(
+            u"label_referral_connection_pool_size",
+            u"Maximum number of connections per remote laboratory"
+        ),
+        description=_(
+            u"description_referral_connection_pool_size",
+            u"Number of HTTP connections kept alive for each remote "
+            u"laboratory. Connections are reused across notifications, so "
+            u"the cost of the connection handshake is only paid once"
+        ),
+        default=10,
+        min=1,
+        required=False,
+    )
+
+    connection_idle_timeout = schema.Int(
+        title=_(
+            u"label_referral_connection_idle_timeout",
+            u"Idle timeout of connections to remote laboratories (seconds)"
+        ),
+        description=_(
+            u"description_referral_connection_idle_timeout",
+            u"Connections to a remote laboratory that have not been used "
+            u"for longer than this number of seconds are closed"
+        ),
+        default=300,
+        min=0,
+        required=False,
+    )
+
+    notification_batch_size = schema.Int(
+        title=_(
+            u"label_referral_notification_batch_size",
+            u"Maximum number of samples per results notification"
+        ),
+        description=_(
+            u"description_referral_notification_batch_size",
+            u"Results of samples verified within a same transaction are "
+            u"notified to the referring laboratory all together, in batches "
+            u"of up to this number of samples. Set to 1 to notify the "
+            u"results of each sample separately"
+        ),
+        default=50,
+        min=1,
+        required=False,
+    )
+
+    notification_max_attempts = schema.Int(
+        title=_(
+            u"label_referral_notification_max_attempts",
+            u"Maximum number of attempts per notification"
+        ),
+        description=_(
+            u"description_referral_notification_max_attempts",
+            u"Notifications that cannot be delivered to the remote "
+            u"laboratory are sent again automatically, waiting longer "
+            u"between consecutive attempts. After this number of attempts, "
+            u"the notification is only sent again if manually requested. "
+            u"Set to 0 to retry forever"
+        ),
+        default=10,
+        min=0,
+        required=False,
+    )
+
+    notification_retry_delay = schema.Int(
+        title=_(
+            u"label_referral_notification_retry_delay",
+            u"Delay before the first retry of a notification (seconds)"
+        ),
+        description=_(
+            u"description_referral_notification_retry_delay",
+            u"Number of seconds to wait before sending again a notification "
+            u"that failed. This delay is doubled on each failed attempt"
+        ),
+        default=60,
+        min=0,
+        required=False,
+    )
+
+    notification_max_retry_delay = schema.Int(
+        title=_(
+            u"label_referral_notification_max_retry_delay",
+            u"Maximum delay between retries of a notification (seconds)"
+        ),
+        description=_(
+            u"description_referral_notification_max_retry_delay",
+            u"Maximum number of seconds to wait before sending again a "
+            u"notification that failed"
+        ),
+        default=3600,
+        min=0,
+        required=False,
+    )
+
+    circuit_breaker_threshold = schema.Int(
+        title=_(
+            u"label_referral_circuit_breaker_threshold",
+            u"Consecutive failures before a remote laboratory is considered "
+            u"unavailable"
+        ),
+        description=_(
+            u"description_referral_circuit_breaker_threshold",
+            u"Number of consecutive failed notifications after which a "
+            u"remote laboratory is considered unavailable. No notifications "
+            u"are sent to an unavailable laboratory, but deferred until it "
+            u"responds again. Set to 0 to disable"
+        ),
+        default=5,
+        min=0,
+        required=False,
+    )
+
+    circuit_breaker_reset_timeout = schema.Int(
+        title=_(
+            u"label_referral_circuit_breaker_reset_timeout",
+            u"Delay before checking an unavailable remote laboratory again "
+            u"(seconds)"
+        ),
+        description=_(
+            u"description_referral_circuit_breaker_reset_timeout",
+            u"Number of seconds to wait before a notification is sent again "
+            u"to a remote laboratory that was considered unavailable"
+        ),
+        default=60,
+        min=0,
+        required=False,
+    )
+
+    compress_notifications = schema.Bool(
+        title=_(
+            u"label_referral_compress_notifications",
+            u"Compress notifications"
+        ),
+        description=_(
+            u"description_referral_compress_notifications",
+            u"Send notifications compressed to the remote laboratories that "
+            u"support it"
+        ),
+        default=True,
+        required=False,
+    )
+
+    max_payload_size = schema.Int(
+        title=_(
+            u"label_referral_max_payload_size",
+            u"Maximum size of notifications (KB)"
+        ),
+        description=_(
+            u"description_referral_max_payload_size",
+            u"Notifications for multiple objects are split in several "
+            u"notifications so none of them exceeds this size. Set to 0 for "
+            u"no limit"
+        ),
+        default=1024,
+        min=0,
+        required=False,
+    )
+
+    notification_concurrency = schema.Int(
+        title=_(
+            u"label_referral_notification_concurrency",
+            u"Maximum number of simultaneous notifications per remote "
+            u"laboratory"
+        ),
+        description=_(
+            u"description_referral_notification_concurrency",
+            u"Notifications to different remote laboratories are sent in "
+            u"parallel. This is the maximum number of notifications that are "
+            u"sent at once to a same remote laboratory"
+        ),
+        default=4,
+        min=1,
+        required=False,
+    )
+
+    inbound_shipment_async_threshold = schema.Int(
+        title=_(
+            u"label_referral_inbound_shipment_async_threshold",
+            u"Maximum number of samples of inbound shipments imported "
+            u"straight-away"
+        ),
+        description=_(
+            u"description_referral_inbound_shipment_async_threshold",
+            u"Inbound shipments with more samples than this number are "
+            u"acknowledged to the referring laboratory immediately and their "
+            u"samples are imported in the background. Set to 0 to always "
+            u"import the samples straight-away"
+        ),
+        default=50,
+        min=0,
+        required=False,
+    )
+
+    consumer_async_threshold = schema.Int(
+        title=_(
+            u"label_referral_consumer_async_threshold",
+            u"Maximum number of items of notifications processed "
+            u"straight-away"
+        ),
+        description=_(
+            u"description_referral_consumer_async_threshold",
+            u"Notifications from remote laboratories with more items than "
+            u"this number (e.g. the rejection of many samples) are "
+            u"acknowledged immediately and their items are processed in the "
+            u"background, in chunks of the size set for each action. Set to "
+            u"0 to always process the items straight-away"
+        ),
+        default=20,
+        min=0,
+        required=False,
+    )
+
 
 class ReferralControlPanelForm(RegistryEditForm):
     schema = IReferralControlPanel
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from Products.Five.browser import BrowserView
+from senaite.referral.worker import wake_worker
+
+from bika.lims import api
+
+
+class DispatchOutboxView(BrowserView):
+    """Wakes up the background worker so the notifications waiting in the
+    outbox are sent to the remote laboratories. Suitable to be called by a
+    clock-server, so notifications are sent even after a restart
+    """
+
+    def __call__(self):
+        portal = api.get_portal()
+        wake_worker(api.get_path(portal))
+        return "OK"
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from senaite.referral import circuitbreaker
+from senaite.referral import messageFactory as _
+from senaite.referral.browser import BaseView
+from senaite.referral.outbox import retry
+
+from bika.lims import api
+
+
+class RetryNotificationsView(BaseView):
+    """Sends again all the notifications for the current external laboratory
+    that are waiting in the outbox or that failed permanently. Notifications
+    are sent by the background worker, so this view returns immediately
+    """
+
+    def __call__(self):
+        form = self.request.form
+
+        # Form submit toggle
+        form_submitted = form.get("submitted", False)
+        form_retry = form.get("retry", False)
+
+        if form_submitted and form_retry:
+            # Give the remote laboratory another chance
+            circuitbreaker.record_success(api.get_uid(self.context))
+            num = retry(self.context)
+            if not num:
+                message = _("No notifications to retry")
+                return self.redirect(message=message, level="error")
+
+            message = _("${num} notifications queued for delivery",
+                        mapping={"num": num})
+            return self.redirect(message=message)
+
+        return self.redirect()
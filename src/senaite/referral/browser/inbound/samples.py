@@ -19,17 +19,17 @@
 # Some rights reserved, see README and LICENSE.
 
 import collections
+from plone.memoize import view
 from senaite.core.listing import ListingView
 from senaite.referral import messageFactory as _
 from senaite.referral.catalog import INBOUND_SAMPLE_CATALOG
-from senaite.referral.notifications import get_last_post
 from senaite.referral.utils import get_image_url
 from senaite.referral.utils import translate
 
 from bika.lims import api
 from bika.lims import PRIORITIES
 from bika.lims.utils import get_image
-from bika.lims.utils import get_link_for
+from bika.lims.utils import get_link
 
 
 class SamplesListingView(ListingView):
@@ -174,54 +174,57 @@ class SamplesListingView(ListingView):
         super(SamplesListingView, self).before_render()
 
     def folderitem(self, obj, item, index):
-        obj = api.get_object(obj)
-        sample = obj.getSample()
-        if api.is_object(sample):
+        """Renders the item from the catalog brain, without waking up neither
+        the inbound sample nor its sample counterpart
+        """
+        sample_uid = self.get_first(obj.sample_uid)
+        if sample_uid:
             # There is a sample counterpart for this inbound sample
-            date_sampled = sample.getDateSampled()
-            sample_type = sample.getSampleType()
-            client = sample.getClient()
-            analyses = map(lambda an: an.getKeyword, sample.getAnalyses())
-            analyses = list(collections.OrderedDict.fromkeys(analyses))
+            sample_id = self.get_first(obj.sample_id)
+            date_sampled = obj.sample_date_sampled
             item.update({
-                "uid": api.get_uid(sample),
-                "getReferringID": obj.getReferringID(),
-                "getSampleID": api.get_id(sample),
-                "client": api.get_title(client),
-                "priority": sample.getPriority(),
-                "sample_type": api.get_id(sample_type),
+                "uid": sample_uid,
+                "getReferringID": obj.referring_id,
+                "getSampleID": sample_id,
+                "client": obj.client_title,
+                "priority": obj.priority,
+                "sample_type": obj.sample_type_id,
                 "date_sampled": date_sampled.strftime("%Y-%m-%d"),
-                "analyses": ", ".join(analyses),
+                "analyses": ", ".join(obj.analyses_keywords or []),
             })
 
-            st_link = get_link_for(sample_type)
-            original_st = obj.getSampleType()
+            st_url = self.get_url(obj.sample_type_uid)
+            st_link = get_link(st_url, value=obj.sample_type_title)
+            original_st = obj.referring_sample_type
             if original_st:
                 st_link = "{} &rarr; {}".format(original_st, st_link)
 
-            item["replace"]["getSampleID"] = get_link_for(sample)
+            sample_url = self.get_url(sample_uid)
+            client_url = self.get_url(obj.client_uid)
+            item["replace"]["getSampleID"] = get_link(sample_url, sample_id)
             item["replace"]["sample_type"] = st_link
-            item["replace"]["client"] = get_link_for(client)
-            state_title = self.get_sample_state_title(sample)
+            item["replace"]["client"] = get_link(client_url, obj.client_title)
+            state_title = self.get_sample_state_title(obj.sample_review_state)
             item["replace"]["state_title"] = state_title
 
             # Add an icon if last POST notification for this Sample failed
-            if self.is_failed_notification(sample):
+            post = obj.last_notification
+            if post and not post.get("success"):
                 msg = _("Notification to remote lab failed")
                 img = get_image("exclamation.png", title=msg)
                 item["after"]["sample_id"] = img
 
         else:
             # This inbound sample does not have a sample counterpart yet
-            date_sampled = obj.getDateSampled()
+            date_sampled = obj.date_sampled
             item.update({
-                "getReferringID": obj.getReferringID(),
+                "getReferringID": obj.referring_id,
                 "getSampleID": "",
                 "client": "",
-                "priority": obj.getPriority(),
-                "sample_type": obj.getSampleType(),
+                "priority": obj.priority,
+                "sample_type": obj.referring_sample_type,
                 "date_sampled": date_sampled.strftime("%Y-%m-%d"),
-                "analyses": ", ".join(obj.getAnalyses()),
+                "analyses": ", ".join(obj.analyses_keywords or []),
             })
 
         priority = item.get("priority")
@@ -235,32 +238,36 @@ class SamplesListingView(ListingView):
 
         return item
 
-    def get_state_title(self, obj):
-        """Translates the review state of the object to the current language
+    def get_first(self, value):
+        """Returns the first element of the keyword index value passed-in
+        """
+        if not value:
+            return None
+        return value[0]
+
+    @view.memoize
+    def get_url(self, uid):
+        """Returns the url of the object with the given UID, without waking up
+        the object
+        """
+        brain = api.get_brain_by_uid(uid, default=None)
+        if not brain:
+            return ""
+        return api.get_url(brain)
+
+    def get_state_title(self, state, portal_type):
+        """Translates the review state of the given type to current language
         """
-        state = api.get_review_status(obj)
         ts = api.get_tool("translation_service")
         wf = api.get_tool("portal_workflow")
-        portal_type = api.get_portal_type(obj)
         state_title = wf.getTitleForStateOnType(state, portal_type)
         return ts.translate(_(state_title or state), context=self.request)
 
-    def get_sample_state_title(self, obj):
+    def get_sample_state_title(self, state):
         """Returns the state of the sample translated, along with information
         regarding to the reception of the shipment if necessary
         """
-        title = self.get_state_title(obj)
-        state = api.get_review_status(obj)
+        title = self.get_state_title(state, "AnalysisRequest")
         if state in ["sample_received"]:
             return title
         return translate("Received (${status})", mapping={"status": title})
-
-    def is_failed_notification(self, obj):
-        """Returns whether the last notification POST for the given object
-        failed or not
-        """
-        post = get_last_post(obj)
-        if not post:
-            return False
-        success = post.get("success", False)
-        return not success
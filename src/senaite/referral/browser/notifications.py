@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import json
+
+from plone.memoize import view
+from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+from senaite.referral.browser import BaseView
+from senaite.referral.catalog import INBOUND_SAMPLE_CATALOG
+from senaite.referral.catalog import SHIPMENT_CATALOG
+from senaite.referral.notifications import STATUS_DEFERRED
+from senaite.referral.notifications import STATUS_ERROR
+from senaite.referral.notifications import STATUS_PENDING
+from senaite.referral.notifications import STATUS_SUCCESS
+
+from bika.lims import api
+from bika.lims.browser import ulocalized_time
+
+# Statuses of notifications that are not in sync with the remote laboratory
+UNSYNCED_STATUSES = [STATUS_ERROR, STATUS_DEFERRED, STATUS_PENDING]
+
+# All statuses of notifications
+STATUSES = UNSYNCED_STATUSES + [STATUS_SUCCESS]
+
+# Tuples of (type of object, catalog) with notification indexes
+CATALOGS = [
+    ("shipment", SHIPMENT_CATALOG),
+    ("sample", INBOUND_SAMPLE_CATALOG),
+]
+
+# Default maximum number of items to return
+DEFAULT_LIMIT = 50
+
+
+class NotificationsView(BaseView):
+    """Dashboard with the status of the notifications sent to the remote
+    laboratories for shipments and samples. Relies on catalog queries only
+    """
+    template = ViewPageTemplateFile("templates/notifications.pt")
+
+    def __call__(self):
+        return self.template()
+
+    def get_statuses(self):
+        return STATUSES
+
+    def get_unsynced_statuses(self):
+        return UNSYNCED_STATUSES
+
+    def get_types(self):
+        return [obj_type for obj_type, catalog in CATALOGS]
+
+    def get_catalog(self, obj_type):
+        return dict(CATALOGS).get(obj_type)
+
+    def search(self, obj_type, status=None, lab_uid=None, limit=None):
+        """Returns the brains of the objects of the given type with a last
+        notification of the given status, sorted from newest to oldest
+        """
+        query = {"notification_status": status or STATUSES}
+        if lab_uid:
+            query["notification_lab"] = lab_uid
+        if limit:
+            query.update({
+                "sort_on": "notification_date",
+                "sort_order": "descending",
+                "sort_limit": limit,
+            })
+        catalog = self.get_catalog(obj_type)
+        brains = api.search(query, catalog)
+        return brains[:limit] if limit else brains
+
+    def count(self, obj_type, status, lab_uid=None):
+        """Returns the number of objects of the given type with a last
+        notification of the given status
+        """
+        return len(self.search(obj_type, status=status, lab_uid=lab_uid))
+
+    def get_counts(self, lab_uid=None):
+        """Returns a dict of type of object -> status -> number of objects
+        """
+        counts = {}
+        for obj_type in self.get_types():
+            counts[obj_type] = dict([
+                (status, self.count(obj_type, status, lab_uid=lab_uid))
+                for status in self.get_statuses()])
+        return counts
+
+    @view.memoize
+    def get_laboratories(self):
+        """Returns a list of dicts with the uid and title of the laboratories
+        notifications were sent to, sorted by title
+        """
+        uids = set()
+        for obj_type, catalog_id in CATALOGS:
+            catalog = api.get_tool(catalog_id)
+            uids.update(catalog.uniqueValuesFor("notification_lab"))
+
+        labs = []
+        for uid in filter(None, uids):
+            lab = api.get_object_by_uid(uid, default=None)
+            title = api.get_title(lab) if lab else uid
+            labs.append({"uid": uid, "title": title})
+        return sorted(labs, key=lambda lab: lab["title"])
+
+    def get_laboratories_counts(self):
+        """Returns a list of dicts with the uid, title and the number of
+        objects by type and status of each laboratory
+        """
+        labs = []
+        for lab in self.get_laboratories():
+            counts = self.get_counts(lab_uid=lab["uid"])
+            labs.append(dict(lab, counts=counts))
+        return labs
+
+    def get_items(self, obj_type, status=None, lab_uid=None,
+                  limit=DEFAULT_LIMIT):
+        """Returns a list of dicts with the information of the objects of the
+        given type with a last notification of the given status
+        """
+        brains = self.search(obj_type, status=status, lab_uid=lab_uid,
+                             limit=limit)
+        return map(self.get_item_info, brains)
+
+    def get_item_info(self, brain):
+        """Returns a dict with the information of the brain passed-in
+        """
+        date = brain.notification_date
+        return {
+            "uid": api.get_uid(brain),
+            "id": api.get_id(brain),
+            "url": api.get_url(brain),
+            "title": api.get_title(brain),
+            "status": brain.notification_status,
+            "datetime": date and date.ISO8601() or None,
+            "date": date and ulocalized_time(date, long_format=True) or "",
+        }
+
+
+class NotificationsJSONView(NotificationsView):
+    """Returns the counts and the objects with the status of the notifications
+    sent to the remote laboratories as JSON. Accepts the following parameters:
+    - type: 'shipment' or 'sample'. Both by default
+    - status: list of statuses. Not in sync statuses by default
+    - lab: UID of the remote laboratory
+    - limit: maximum number of objects to return per type
+    """
+
+    def __call__(self):
+        form = self.request.form
+        obj_types = self.get_list(form.get("type")) or self.get_types()
+        statuses = self.get_list(form.get("status")) or UNSYNCED_STATUSES
+        lab_uid = form.get("lab") or None
+        limit = api.to_int(form.get("limit"), DEFAULT_LIMIT)
+
+        items = {}
+        for obj_type in filter(self.get_catalog, obj_types):
+            items[obj_type] = self.get_items(obj_type, status=statuses,
+                                             lab_uid=lab_uid, limit=limit)
+
+        data = {
+            "counts": self.get_counts(lab_uid=lab_uid),
+            "items": items,
+        }
+        self.request.response.setHeader("Content-Type", "application/json")
+        return json.dumps(data)
+
+    def get_list(self, value):
+        """Returns the value passed-in as a list
+        """
+        if not value:
+            return []
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        return filter(None, value.split(","))
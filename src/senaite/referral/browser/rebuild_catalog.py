@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from Products.Five.browser import BrowserView
+from senaite.referral.catalog import INBOUND_SAMPLE_CATALOG
+from senaite.referral.catalog import SHIPMENT_CATALOG
+from senaite.referral.core.catalog.rebuild import rebuild
+
+from bika.lims import api
+
+CATALOGS = [SHIPMENT_CATALOG, INBOUND_SAMPLE_CATALOG]
+
+
+class RebuildCatalogView(BrowserView):
+    """Rebuilds a referral catalog. The rebuild can be split across several
+    ZEO clients by calling this view on each of them with a different worker
+    number and same number of workers, e.g:
+
+        @@referral_rebuild_catalog?catalog=<catalog_id>&worker=0&workers=4
+
+    An interrupted rebuild is resumed when the view is called again with the
+    same parameters
+    """
+
+    def __call__(self):
+        form = self.request.form
+        catalog_id = form.get("catalog")
+        if catalog_id not in CATALOGS:
+            raise ValueError("Catalog must be one of: {}"
+                             .format(", ".join(CATALOGS)))
+
+        worker = api.to_int(form.get("worker"), default=0)
+        workers = api.to_int(form.get("workers"), default=1)
+        catalog = api.get_tool(catalog_id)
+        count = rebuild(catalog, worker=worker, workers=workers,
+                        resume=True)
+        return "{} objects cataloged".format(count)
@@ -54,6 +54,9 @@ class RetryNotificationView(BaseView):
                 if err_msg:
                     return self.redirect(message=err_msg, level="error")
 
+            message = _("Notifications queued for delivery")
+            return self.redirect(message=message)
+
         return self.redirect()
 
     def get_objects(self):
@@ -81,7 +84,7 @@ class RetryNotificationView(BaseView):
         """Returns a dict with the information about the POST notification
         for the given object
         """
-        post = get_last_post(obj)
+        post = get_last_post(obj, payload=True)
         if not post:
             return None
 
@@ -112,7 +115,7 @@ class RetryNotificationView(BaseView):
                 "URL is valid and remote user credentials are not empty"
             )
 
-        # Do the re-POST
+        # Queue the re-POST
         obj = post.get("obj")
         connection.notify(obj, payload)
 
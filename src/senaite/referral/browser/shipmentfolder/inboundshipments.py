@@ -28,7 +28,6 @@ from senaite.referral.utils import get_image_url
 from bika.lims import api
 from bika.lims.browser import ulocalized_time
 from bika.lims.utils import get_link
-from bika.lims.utils import get_link_for
 
 
 class InboundSampleShipmentFolderView(ListingView):
@@ -121,33 +120,35 @@ class InboundSampleShipmentFolderView(ListingView):
     def folderitem(self, obj, item, index):
         """Service triggered each time an item is iterated in folderitems.
         The use of this service prevents the extra-loops in child objects.
+        The item is rendered from the catalog brain, without waking up the
+        shipment or its referring laboratory
         :obj: the instance of the class to be foldered
         :item: dict containing the properties of the object to be used by
             the template
         :index: current index of the item
         """
-        obj = api.get_object(obj)
         href = api.get_url(obj)
-        shipment_id = obj.getShipmentID()
+        shipment_id = obj.shipment_id
         item["shipment_id"] = shipment_id
         item["replace"]["shipment_id"] = get_link(href, shipment_id)
-        item["num_samples"] = len(obj.getInboundSamples())
-        item["created_by"] = self.get_creator_fullname(obj)
+        item["num_samples"] = obj.num_samples
+        item["created_by"] = obj.creator_fullname or obj.Creator
 
-        referring = obj.getReferringLaboratory()
-        item["referring_laboratory"] = api.get_title(referring)
-        item["replace"]["referring_laboratory"] = get_link_for(referring)
+        # the referring laboratory is the parent of the shipment
+        lab_url = href.rsplit("/", 1)[0]
+        lab_title = obj.laboratory_title
+        item["referring_laboratory"] = lab_title
+        item["replace"]["referring_laboratory"] = get_link(lab_url, lab_title)
 
-        lab_code = referring.getCode()
-        lab_url = api.get_url(referring)
+        lab_code = obj.laboratory_code
         item["lab_code"] = lab_code
         item["replace"]["lab_code"] = get_link(lab_url, value=lab_code)
 
         # dispatched, received, rejected, cancelled
-        dispatched = obj.getDispatchedDateTime()
-        received = obj.getReceivedDateTime()
-        rejected = obj.getRejectedDateTime()
-        cancelled = obj.getCancelledDateTime()
+        dispatched = obj.dispatched_date
+        received = obj.received_date
+        rejected = obj.rejected_date
+        cancelled = obj.cancelled_date
         item.update({
             "dispatched": self.get_localized_date(dispatched, show_time=True),
             "received": self.get_localized_date(received, show_time=True),
@@ -164,10 +165,3 @@ class InboundSampleShipmentFolderView(ListingView):
     @view.memoize
     def get_object(self, uid):
         return api.get_object_by_uid(uid)
-
-    def get_creator_fullname(self, shipment):
-        """Returns the fullname of the user who created the shipment
-        """
-        creator = shipment.Creator()
-        properties = api.get_user_properties(creator)
-        return properties.get("fullname", creator)
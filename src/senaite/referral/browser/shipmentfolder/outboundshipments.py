@@ -22,8 +22,6 @@ import collections
 from senaite.core.listing import ListingView
 from senaite.referral import messageFactory as _
 from senaite.referral.catalog import SHIPMENT_CATALOG
-from senaite.referral.notifications import get_last_post
-from senaite.referral.notifications import is_error
 from senaite.referral.utils import get_image_url
 from senaite.referral.utils import translate as t
 
@@ -31,7 +29,6 @@ from bika.lims import api
 from bika.lims.browser import ulocalized_time
 from bika.lims.utils import get_image
 from bika.lims.utils import get_link
-from bika.lims.utils import get_link_for
 
 
 class OutboundSampleShipmentFolderView(ListingView):
@@ -153,35 +150,37 @@ class OutboundSampleShipmentFolderView(ListingView):
     def folderitem(self, obj, item, index):
         """Service triggered each time an item is iterated in folderitems.
         The use of this service prevents the extra-loops in child objects.
+        The item is rendered from the catalog brain, without waking up the
+        shipment or its reference laboratory
         :obj: the instance of the class to be foldered
         :item: dict containing the properties of the object to be used by
             the template
         :index: current index of the item
         """
-        obj = api.get_object(obj)
         href = api.get_url(obj)
-        shipment_id = obj.getShipmentID()
+        shipment_id = obj.shipment_id
         item["shipment_id"] = shipment_id
         item["replace"]["shipment_id"] = get_link(href, shipment_id)
 
-        reference = obj.getReferenceLaboratory()
-        item["reference_laboratory"] = api.get_title(reference)
-        item["replace"]["reference_laboratory"] = get_link_for(reference)
+        # the reference laboratory is the parent of the shipment
+        lab_url = href.rsplit("/", 1)[0]
+        lab_title = obj.laboratory_title
+        item["reference_laboratory"] = lab_title
+        item["replace"]["reference_laboratory"] = get_link(lab_url, lab_title)
 
-        lab_code = reference.getCode()
-        lab_url = api.get_url(reference)
+        lab_code = obj.laboratory_code
         item["lab_code"] = lab_code
         item["replace"]["lab_code"] = get_link(lab_url, value=lab_code)
 
-        item["num_samples"] = len(obj.getRawSamples())
-        item["created_by"] = self.get_creator_fullname(obj)
+        item["num_samples"] = obj.num_samples
+        item["created_by"] = obj.creator_fullname or obj.Creator
 
         # dispatched, received, rejected, cancelled
-        dispatched = obj.getDispatchedDateTime()
-        delivered = obj.getDeliveredDateTime()
-        rejected = obj.getRejectedDateTime()
-        lost = obj.getLostDateTime()
-        cancelled = obj.getCancelledDateTime()
+        dispatched = obj.dispatched_date
+        delivered = obj.delivered_date
+        rejected = obj.rejected_date
+        lost = obj.lost_date
+        cancelled = obj.cancelled_date
         item.update({
             "dispatched": self.get_localized_date(dispatched, show_time=True),
             "delivered": self.get_localized_date(delivered, show_time=True),
@@ -191,14 +190,14 @@ class OutboundSampleShipmentFolderView(ListingView):
         })
 
         # If the notification errored, then add an icon
-        post = get_last_post(obj)
+        post = obj.last_notification
         if not post:
             # Not notified to the reference lab
             msg = t(_("Reference lab not notified"))
             icon = get_image("warning.png", title=msg)
             self._append_html_element(item, "shipment_id", icon)
 
-        elif is_error(post):
+        elif not post.get("success"):
             # Notification to the reference lab errored
             msg = t(_("The notification to reference lab errored: {}"))
             message = "[{}] {}".format(post.get("status"), post.get("message"))
@@ -230,10 +229,3 @@ class OutboundSampleShipmentFolderView(ListingView):
         if not date_value:
             return default
         return ulocalized_time(date_value, long_format=show_time)
-
-    def get_creator_fullname(self, shipment):
-        """Returns the fullname of the user who created the shipment
-        """
-        creator = shipment.Creator()
-        properties = api.get_user_properties(creator)
-        return properties.get("fullname", creator)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from datetime import datetime
+
+from plone.app.layout.viewlets import ViewletBase
+from plone.memoize import view
+from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+from senaite.referral import check_installed
+from senaite.referral import circuitbreaker
+
+from bika.lims import api
+
+
+class CircuitBreakerViewlet(ViewletBase):
+    """Viewlet that notifies the user that current external laboratory is
+    considered unavailable and notifications are deferred
+    """
+    index = ViewPageTemplateFile("templates/circuit_breaker.pt")
+
+    @check_installed(False)
+    def is_visible(self):
+        """Returns whether the viewlet must be visible or not
+        """
+        return self.get_state() != circuitbreaker.CLOSED
+
+    @view.memoize
+    def get_circuit(self):
+        return circuitbreaker.get_circuit(api.get_uid(self.context))
+
+    @view.memoize
+    def get_state(self):
+        return circuitbreaker.get_state(api.get_uid(self.context))
+
+    def is_half_open(self):
+        return self.get_state() == circuitbreaker.HALF_OPEN
+
+    def get_failures(self):
+        return self.get_circuit().get("failures")
+
+    def get_opened(self):
+        """Returns the date time when the circuit was opened in ISO format
+        """
+        opened = self.get_circuit().get("opened")
+        if not opened:
+            return None
+        return datetime.fromtimestamp(opened).isoformat()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from plone.app.layout.viewlets import ViewletBase
+from plone.memoize import view
+from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+from senaite.referral import check_installed
+from senaite.referral.outbox import get_entries
+
+
+class OutboxViewlet(ViewletBase):
+    """Viewlet that displays the number of notifications for the current
+    external laboratory that are waiting to be sent or that failed
+    """
+    index = ViewPageTemplateFile("templates/outbox.pt")
+
+    @check_installed(False)
+    def is_visible(self):
+        """Returns whether the viewlet must be visible or not
+        """
+        return len(self.get_entries()) > 0
+
+    @view.memoize
+    def get_entries(self):
+        return get_entries(self.context)
+
+    def get_num_pending(self):
+        entries = self.get_entries()
+        return len(filter(lambda entry: not entry.get("failed"), entries))
+
+    def get_num_failed(self):
+        entries = self.get_entries()
+        return len(filter(lambda entry: entry.get("failed"), entries))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from plone.app.layout.viewlets import ViewletBase
+from plone.memoize import view
+from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+from senaite.referral import check_installed
+from senaite.referral.notifications import get_received
+from senaite.referral.tasks import get_context_tasks
+
+
+class ReceivedNotificationsViewlet(ViewletBase):
+    """Viewlet that displays the notifications received from the current
+    external laboratory that are being processed in the background, as well
+    as the items that could not be processed
+    """
+    index = ViewPageTemplateFile("templates/received_notifications.pt")
+
+    @check_installed(False)
+    def is_visible(self):
+        """Returns whether the viewlet must be visible or not
+        """
+        return self.get_num_queued() > 0 or len(self.get_failed_items()) > 0
+
+    @view.memoize
+    def get_num_queued(self):
+        tasks = get_context_tasks(self.context)
+        return len(filter(lambda task: not task.get("failed"), tasks))
+
+    @view.memoize
+    def get_failed_items(self):
+        """Returns the outcomes of the items that could not be processed from
+        the most recent notifications received, sorted from newest to oldest
+        """
+        failed = []
+        for received in reversed(get_received(self.context)):
+            outcomes = received.get("outcomes") or []
+            for outcome in outcomes:
+                if outcome.get("success"):
+                    continue
+                failed.append(dict(outcome, datetime=received.get("datetime")))
+        return failed
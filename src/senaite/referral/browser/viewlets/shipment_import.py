@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from plone.app.layout.viewlets import ViewletBase
+from plone.memoize import view
+from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+from senaite.referral import check_installed
+from senaite.referral.tasks import get_context_tasks
+
+
+class ShipmentImportViewlet(ViewletBase):
+    """Viewlet that notifies the user that the samples of current inbound
+    shipment are being imported in the background, or that the import failed
+    """
+    index = ViewPageTemplateFile("templates/shipment_import.pt")
+
+    @check_installed(False)
+    def is_visible(self):
+        """Returns whether the viewlet must be visible or not
+        """
+        return len(self.get_tasks()) > 0
+
+    @view.memoize
+    def get_tasks(self):
+        return get_context_tasks(self.context)
+
+    def is_failed(self):
+        """Returns whether the import of the samples failed
+        """
+        return any(map(lambda task: task.get("failed"), self.get_tasks()))
+
+    def get_error(self):
+        """Returns the error of the last failed import
+        """
+        errors = [task.get("error") for task in self.get_tasks()]
+        errors = filter(None, errors)
+        return errors and errors[-1] or ""
@@ -21,9 +21,22 @@
 from plone.app.layout.viewlets import ViewletBase
 from plone.memoize import view
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+from senaite.referral.catalog import INBOUND_SAMPLE_CATALOG
 from senaite.referral.notifications import get_last_post
+from senaite.referral.notifications import STATUS_DEFERRED
+from senaite.referral.notifications import STATUS_ERROR
+from senaite.referral.notifications import STATUS_PENDING
+from senaite.referral.notifications import STATUS_SUCCESS
 
 from bika.lims import api
+from bika.lims.browser import ulocalized_time
+
+NOTIFICATION_STATUSES = [
+    STATUS_DEFERRED,
+    STATUS_ERROR,
+    STATUS_PENDING,
+    STATUS_SUCCESS,
+]
 
 
 class ShipmentNotificationViewlet(ViewletBase):
@@ -63,15 +76,43 @@ class ShipmentNotificationViewlet(ViewletBase):
         """Returns a list of dicts with information about the POST notifications
         for all samples from this current shipment
         """
-        samples = self.context.getSamples()
-        return filter(None, [self.get_post_info(sample) for sample in samples])
+        query = {
+            "portal_type": "InboundSample",
+            "shipment_uid": api.get_uid(self.context),
+            "notification_status": NOTIFICATION_STATUSES,
+        }
+        brains = api.search(query, INBOUND_SAMPLE_CATALOG)
+        return map(self.get_brain_post_info, brains)
+
+    def get_brain_post_info(self, brain):
+        """Returns a dict with the information about the POST notification
+        for the sample the inbound sample brain passed-in refers to
+        """
+        sample_ids = filter(None, brain.sample_id or [])
+        sample_uids = filter(None, brain.sample_uid or [])
+        return {
+            "id": sample_ids and sample_ids[0] or None,
+            "uid": sample_uids and sample_uids[0] or None,
+            "success": brain.notification_status == STATUS_SUCCESS,
+            "pending": brain.notification_status == STATUS_PENDING,
+            "datetime": brain.notification_date,
+        }
 
     def get_failed_samples_posts(self):
         """Return a list of dicts with information about the POST notifications
-        that failed for samples from this current shipment
+        that failed for samples from this current shipment. Notifications that
+        are still waiting in the outbox are not considered as failed
         """
         samples = self.get_samples_posts()
-        return filter(lambda post: not post.get("success", False), samples)
+        return filter(lambda post: not post.get("success", False)
+                      and not post.get("pending", False), samples)
+
+    def get_pending_samples_posts(self):
+        """Return a list of dicts with information about the POST notifications
+        for samples from this current shipment that are waiting to be sent
+        """
+        samples = self.get_samples_posts()
+        return filter(lambda post: post.get("pending", False), samples)
 
     def get_failed_uids(self):
         """Returns a list of UIDs of Samples from this Shipment for which the
@@ -114,9 +155,14 @@ class ShipmentNotificationViewlet(ViewletBase):
         sent for either the Shipment or any of the samples
         """
         shipment_post = self.get_shipment_post()
-        last = shipment_post.get("datetime")
-        for post in self.get_samples_posts():
-            sent = post.get("datetime")
-            if sent and sent > last:
-                last = sent
-        return last
+        dates = [api.to_date(shipment_post.get("datetime"), default=None)]
+        posts = self.get_samples_posts()
+        dates.extend([post.get("datetime") for post in posts])
+        dates = filter(None, dates)
+        if not dates:
+            return None
+        return max(dates)
+
+    def ulocalized_time(self, time, long_format=None, time_only=None):
+        return ulocalized_time(time, long_format, time_only,
+                               context=self.context, request=self.request)
@@ -18,6 +18,7 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+from senaite.referral.content.analysisrequest import reindex_inbound_sample
 from zope.component.interfaces import implements
 
 from bika.lims.browser.workflow import RequestContextAware
@@ -42,6 +43,15 @@ class WorkflowActionShipAdapter(RequestContextAware):
 
 class SaveAnalysesAdapter(WorkflowActionSaveAnalysesAdapter):
 
+    def __call__(self, action, uids):
+        """Saves the analyses and updates the metadata of the inbound sample
+        the sample comes from, if any
+        """
+        response = super(SaveAnalysesAdapter, self).__call__(action, uids)
+        if IAnalysisRequest.providedBy(self.context):
+            reindex_inbound_sample(self.context)
+        return response
+
     def get_uids_from_request(self):
         """Returns the UIDs from the request plus those from the analyses from
         the inound shipment that were once requested, if any
@@ -33,6 +33,9 @@ INDEXES = BASE_INDEXES + [
     # id, indexed attribute, type
     ("laboratory_code", "", "FieldIndex"),
     ("laboratory_uid", "", "FieldIndex"),
+    ("notification_date", "", "DateIndex"),
+    ("notification_lab", "", "FieldIndex"),
+    ("notification_status", "", "FieldIndex"),
     ("referring_id", "", "FieldIndex"),
     ("sample_id", "", "KeywordIndex"),
     ("sample_uid", "", "KeywordIndex"),
@@ -43,11 +46,25 @@ INDEXES = BASE_INDEXES + [
 
 COLUMNS = BASE_COLUMNS + [
     # attribute name
+    "analyses_keywords",
+    "client_title",
+    "client_uid",
     "date_sampled",
     "laboratory_code",
     "laboratory_title",
+    "last_notification",
+    "notification_date",
+    "notification_status",
+    "priority",
     "referring_id",
+    "referring_sample_type",
+    "sample_date_sampled",
     "sample_id",
+    "sample_review_state",
+    "sample_type_id",
+    "sample_type_title",
+    "sample_type_uid",
+    "sample_uid",
     "shipment_id",
 ]
 
@@ -18,13 +18,56 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import collections
+
 from plone.indexer import indexer
+from senaite.referral.core.catalog.indexing import get_cached
 from senaite.referral.interfaces import IInboundSample
 from senaite.referral.interfaces import IInboundSampleCatalog
+from senaite.referral.notifications import get_last_notification
+from senaite.referral.notifications import get_notification_date
+from senaite.referral.notifications import get_notification_lab
+from senaite.referral.notifications import get_notification_status
 
 from bika.lims import api
 
 
+def get_sample(instance):
+    """Returns the sample created on the reception of the inbound sample, if
+    any, resolved once per indexing
+    """
+    return get_cached(instance, "sample", instance.getSample)
+
+
+def get_shipment(instance):
+    """Returns the shipment of the inbound sample, resolved once per indexing
+    """
+    return get_cached(instance, "shipment", instance.getInboundShipment)
+
+
+def get_laboratory(instance):
+    """Returns the laboratory that referred the inbound sample, resolved once
+    per indexing
+    """
+    def getter():
+        return get_shipment(instance).getReferringLaboratory()
+    return get_cached(instance, "laboratory", getter)
+
+
+def get_client(instance, sample):
+    """Returns the client of the sample created on the reception of the
+    inbound sample, resolved once per indexing
+    """
+    return get_cached(instance, "client", sample.getClient)
+
+
+def get_sample_type(instance, sample):
+    """Returns the sample type of the sample created on the reception of the
+    inbound sample, resolved once per indexing
+    """
+    return get_cached(instance, "sample_type", sample.getSampleType)
+
+
 @indexer(IInboundSample, IInboundSampleCatalog)
 def date_sampled(instance):
     """Returns the date when the inbound sample was originally collected
@@ -36,7 +79,7 @@ def date_sampled(instance):
 def laboratory_code(instance):
     """Returns the code of the lab referring the inbound sample
     """
-    referring_laboratory = instance.getReferringLaboratory()
+    referring_laboratory = get_laboratory(instance)
     return referring_laboratory.getCode()
 
 
@@ -44,7 +87,7 @@ def laboratory_code(instance):
 def laboratory_title(instance):
     """Returns the code of the lab referring the inbound sample
     """
-    referring_laboratory = instance.getReferringLaboratory()
+    referring_laboratory = get_laboratory(instance)
     return api.get_title(referring_laboratory)
 
 
@@ -52,7 +95,7 @@ def laboratory_title(instance):
 def laboratory_uid(instance):
     """Returns the UID of the lab referring the inbound sample
     """
-    referring_laboratory = instance.getReferringLaboratory()
+    referring_laboratory = get_laboratory(instance)
     return api.get_uid(referring_laboratory)
 
 
@@ -71,7 +114,7 @@ def sample_id(instance):
     If the instance has no available sample assigned, it returns a tuple with
     a None value. This allows searches for `MissingValue` entries too.
     """
-    sample = instance.getSample()
+    sample = get_sample(instance)
     if sample:
         return (api.get_id(sample),)
     return (None, )
@@ -85,7 +128,7 @@ def sample_uid(instance):
     If the instance has no available sample assigned, it returns a tuple with
     a None value. This allows searches for `MissingValue` entries too.
     """
-    uid = instance.getRawSample()
+    uid = get_cached(instance, "sample_uid", instance.getRawSample)
     if api.is_uid(uid):
         return (uid,)
     return (None, )
@@ -95,7 +138,7 @@ def sample_uid(instance):
 def shipment_id(instance):
     """Returns the id of the shipment the inbound sample belongs to
     """
-    shipment = instance.getInboundShipment()
+    shipment = get_shipment(instance)
     return api.get_id(shipment)
 
 
@@ -103,7 +146,7 @@ def shipment_id(instance):
 def shipment_uid(instance):
     """Returns the id of the shipment the inbound sample belongs to
     """
-    shipment = instance.getInboundShipment()
+    shipment = get_shipment(instance)
     return api.get_uid(shipment)
 
 
@@ -111,12 +154,12 @@ def shipment_uid(instance):
 def inbound_sample_searchable_text(instance):
     """Index for searchable text queries
     """
-    laboratory = instance.getReferringLaboratory()
-    sample = instance.getSample()
+    laboratory = get_laboratory(instance)
+    sample = get_sample(instance)
     if sample:
         sample = api.get_id(sample)
 
-    shipment = instance.getInboundShipment()
+    shipment = get_shipment(instance)
     searchable_text_tokens = [
         laboratory.getCode(),
         api.get_title(laboratory),
@@ -131,3 +174,155 @@ def inbound_sample_searchable_text(instance):
     ]
     searchable_text_tokens = filter(None, searchable_text_tokens)
     return u" ".join(searchable_text_tokens)
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def notification_date(instance):
+    """Returns the date time of the last notification about the sample
+    created on the reception of this inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return get_notification_date(sample)
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def notification_lab(instance):
+    """Returns the UID of the laboratory the last notification about the
+    sample created on the reception of this inbound sample was addressed to
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return get_notification_lab(sample)
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def notification_status(instance):
+    """Returns the status of the last notification about the sample created
+    on the reception of this inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return get_notification_status(sample)
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def referring_sample_type(instance):
+    """Returns the name of the sample type provided by the referring laboratory
+    """
+    return instance.getSampleType()
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def priority(instance):
+    """Returns the priority of the sample created on the reception of this
+    inbound sample or the priority provided by the referring laboratory
+    """
+    sample = get_sample(instance)
+    if sample:
+        return sample.getPriority()
+    return instance.getPriority()
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def analyses_keywords(instance):
+    """Returns the keywords of the analyses from the sample created on the
+    reception of this inbound sample or the names of the analyses provided by
+    the referring laboratory
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return instance.getAnalyses()
+    keywords = map(lambda an: an.getKeyword, sample.getAnalyses())
+    return list(collections.OrderedDict.fromkeys(keywords))
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def sample_date_sampled(instance):
+    """Returns the date when the sample created on the reception of this
+    inbound sample was collected, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return sample.getDateSampled()
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def sample_review_state(instance):
+    """Returns the status of the sample created on the reception of this
+    inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return api.get_review_status(sample)
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def client_uid(instance):
+    """Returns the UID of the client of the sample created on the reception of
+    this inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return sample.getClientUID()
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def client_title(instance):
+    """Returns the title of the client of the sample created on the reception
+    of this inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return api.get_title(get_client(instance, sample))
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def sample_type_uid(instance):
+    """Returns the UID of the sample type of the sample created on the
+    reception of this inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return sample.getSampleTypeUID()
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def sample_type_id(instance):
+    """Returns the id of the sample type of the sample created on the
+    reception of this inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return api.get_id(get_sample_type(instance, sample))
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def sample_type_title(instance):
+    """Returns the title of the sample type of the sample created on the
+    reception of this inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return api.get_title(get_sample_type(instance, sample))
+
+
+@indexer(IInboundSample, IInboundSampleCatalog)
+def last_notification(instance):
+    """Returns the success, status and message of the last notification about
+    the sample created on the reception of this inbound sample, if any
+    """
+    sample = get_sample(instance)
+    if not sample:
+        return None
+    return get_last_notification(sample)
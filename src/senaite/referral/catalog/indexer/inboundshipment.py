@@ -21,6 +21,10 @@
 from plone.indexer import indexer
 from senaite.referral.interfaces import IInboundSampleShipment
 from senaite.referral.interfaces import IShipmentCatalog
+from senaite.referral.notifications import get_last_notification
+from senaite.referral.notifications import get_notification_date
+from senaite.referral.notifications import get_notification_lab
+from senaite.referral.notifications import get_notification_status
 
 from bika.lims import api
 
@@ -56,3 +60,94 @@ def shipment_searchable_text(instance):
     ]
     searchable_text_tokens = filter(None, searchable_text_tokens)
     return u" ".join(searchable_text_tokens)
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def notification_date(instance):
+    """Returns the date time of the last notification about this shipment
+    """
+    return get_notification_date(instance)
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def notification_lab(instance):
+    """Returns the UID of the laboratory the last notification about this
+    shipment was addressed to
+    """
+    return get_notification_lab(instance)
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def notification_status(instance):
+    """Returns the status of the last notification about this shipment
+    """
+    return get_notification_status(instance)
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def laboratory_code(instance):
+    """Returns the code of the referring laboratory of this shipment
+    """
+    laboratory = instance.getReferringLaboratory()
+    return laboratory.getCode()
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def laboratory_title(instance):
+    """Returns the title of the referring laboratory of this shipment
+    """
+    laboratory = instance.getReferringLaboratory()
+    return api.get_title(laboratory)
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def num_samples(instance):
+    """Returns the number of samples of this shipment
+    """
+    return len(instance.objectIds())
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def creator_fullname(instance):
+    """Returns the fullname of the user who created this shipment
+    """
+    creator = instance.Creator()
+    properties = api.get_user_properties(creator)
+    return properties.get("fullname", creator)
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def dispatched_date(instance):
+    """Returns the date when this shipment was dispatched from the referring
+    laboratory
+    """
+    return instance.getDispatchedDateTime()
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def received_date(instance):
+    """Returns the date when this shipment was received, if any
+    """
+    return instance.getReceivedDateTime()
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def rejected_date(instance):
+    """Returns the date when this shipment was rejected, if any
+    """
+    return instance.getRejectedDateTime()
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def cancelled_date(instance):
+    """Returns the date when this shipment was cancelled, if any
+    """
+    return instance.getCancelledDateTime()
+
+
+@indexer(IInboundSampleShipment, IShipmentCatalog)
+def last_notification(instance):
+    """Returns the success, status and message of the last notification
+    about this shipment
+    """
+    return get_last_notification(instance)
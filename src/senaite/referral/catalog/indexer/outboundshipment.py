@@ -21,6 +21,10 @@
 from plone.indexer import indexer
 from senaite.referral.interfaces import IOutboundSampleShipment
 from senaite.referral.interfaces import IShipmentCatalog
+from senaite.referral.notifications import get_last_notification
+from senaite.referral.notifications import get_notification_date
+from senaite.referral.notifications import get_notification_lab
+from senaite.referral.notifications import get_notification_status
 
 from bika.lims import api
 
@@ -52,3 +56,100 @@ def shipment_searchable_text(instance):
     ]
     searchable_text_tokens = filter(None, searchable_text_tokens)
     return u" ".join(searchable_text_tokens)
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def notification_date(instance):
+    """Returns the date time of the last notification about this shipment
+    """
+    return get_notification_date(instance)
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def notification_lab(instance):
+    """Returns the UID of the laboratory the last notification about this
+    shipment was addressed to
+    """
+    return get_notification_lab(instance)
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def notification_status(instance):
+    """Returns the status of the last notification about this shipment
+    """
+    return get_notification_status(instance)
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def laboratory_code(instance):
+    """Returns the code of the reference laboratory of this shipment
+    """
+    laboratory = instance.getReferenceLaboratory()
+    return laboratory.getCode()
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def laboratory_title(instance):
+    """Returns the title of the reference laboratory of this shipment
+    """
+    laboratory = instance.getReferenceLaboratory()
+    return api.get_title(laboratory)
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def num_samples(instance):
+    """Returns the number of samples of this shipment
+    """
+    return len(instance.getRawSamples())
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def creator_fullname(instance):
+    """Returns the fullname of the user who created this shipment
+    """
+    creator = instance.Creator()
+    properties = api.get_user_properties(creator)
+    return properties.get("fullname", creator)
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def dispatched_date(instance):
+    """Returns the date when this shipment was dispatched, if any
+    """
+    return instance.getDispatchedDateTime()
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def delivered_date(instance):
+    """Returns the date when this shipment was delivered, if any
+    """
+    return instance.getDeliveredDateTime()
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def lost_date(instance):
+    """Returns the date when this shipment was labeled as lost, if any
+    """
+    return instance.getLostDateTime()
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def rejected_date(instance):
+    """Returns the date when this shipment was rejected, if any
+    """
+    return instance.getRejectedDateTime()
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def cancelled_date(instance):
+    """Returns the date when this shipment was cancelled, if any
+    """
+    return instance.getCancelledDateTime()
+
+
+@indexer(IOutboundSampleShipment, IShipmentCatalog)
+def last_notification(instance):
+    """Returns the success, status and message of the last notification
+    about this shipment
+    """
+    return get_last_notification(instance)
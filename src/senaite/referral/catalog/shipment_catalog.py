@@ -32,6 +32,9 @@ CATALOG_TITLE = "Senaite Shipment Catalog"
 INDEXES = BASE_INDEXES + [
     # id, indexed attribute, type
     ("laboratory_uid", "", "FieldIndex"),
+    ("notification_date", "", "DateIndex"),
+    ("notification_lab", "", "FieldIndex"),
+    ("notification_status", "", "FieldIndex"),
     ("shipment_id", "", "FieldIndex"),
     ("shipment_searchable_text", "", "ZCTextIndex"),
     ("sortable_title", "", "FieldIndex"),
@@ -39,7 +42,20 @@ INDEXES = BASE_INDEXES + [
 
 COLUMNS = BASE_COLUMNS + [
     # attribute name
+    "cancelled_date",
+    "creator_fullname",
+    "delivered_date",
+    "dispatched_date",
+    "laboratory_code",
+    "laboratory_title",
     "laboratory_uid",
+    "last_notification",
+    "lost_date",
+    "notification_date",
+    "notification_status",
+    "num_samples",
+    "received_date",
+    "rejected_date",
     "shipment_id",
 ]
 
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import threading
+import time
+
+from senaite.referral import logger
+from senaite.referral.utils import get_circuit_breaker_reset_timeout
+from senaite.referral.utils import get_circuit_breaker_threshold
+
+# The circuit is closed. Requests to the remote laboratory are allowed
+CLOSED = "closed"
+
+# The circuit is open. Requests to the remote laboratory are not allowed
+OPEN = "open"
+
+# The circuit is half-open. A single request to the remote laboratory is
+# allowed to check whether it is available again
+HALF_OPEN = "half_open"
+
+# Circuits per remote laboratory UID. This is a per-process state, so each
+# ZEO client decides on its own whether a remote laboratory is available
+_circuits = {}
+_lock = threading.Lock()
+
+
+def get_circuit(lab_uid):
+    """Returns a copy of the circuit for the remote laboratory with the given
+    UID, as a dict with keys 'state', 'failures', 'opened' and 'trial'
+    """
+    with _lock:
+        return dict(_get_circuit(lab_uid))
+
+
+def _get_circuit(lab_uid):
+    circuit = _circuits.get(lab_uid)
+    if circuit is None:
+        circuit = {"state": CLOSED, "failures": 0, "opened": 0, "trial": 0}
+        _circuits[lab_uid] = circuit
+    return circuit
+
+
+def get_state(lab_uid, now=None):
+    """Returns the state of the circuit for the remote laboratory with the
+    given UID. An open circuit is reported as half-open once the reset
+    timeout has passed, even if no request has been tried yet
+    """
+    circuit = get_circuit(lab_uid)
+    if circuit["state"] == OPEN:
+        now = now or time.time()
+        if now - circuit["opened"] >= get_circuit_breaker_reset_timeout():
+            return HALF_OPEN
+    return circuit["state"]
+
+
+def is_open(lab_uid, now=None):
+    """Returns whether requests to the remote laboratory with the given UID
+    are not allowed at this moment
+    """
+    return get_state(lab_uid, now=now) == OPEN
+
+
+def allow_request(lab_uid):
+    """Returns whether a request to the remote laboratory with the given UID
+    can be sent. When the reset timeout of an open circuit has passed, only
+    one request (the trial) is allowed until its outcome is recorded
+    """
+    if not get_circuit_breaker_threshold():
+        # Circuit breaker is disabled
+        return True
+
+    now = time.time()
+    reset_timeout = get_circuit_breaker_reset_timeout()
+    with _lock:
+        circuit = _get_circuit(lab_uid)
+        if circuit["state"] == CLOSED:
+            return True
+
+        # Allow a single trial once the reset timeout has passed. Allow
+        # another one if the outcome of the previous was never recorded
+        since = circuit["trial"] or circuit["opened"]
+        if now - since < reset_timeout:
+            return False
+
+        circuit.update({"state": HALF_OPEN, "trial": now})
+        return True
+
+
+def record_success(lab_uid):
+    """Closes the circuit for the remote laboratory with the given UID
+    """
+    with _lock:
+        circuit = _get_circuit(lab_uid)
+        if circuit["state"] != CLOSED:
+            logger.info("Circuit closed for {}".format(lab_uid))
+        circuit.update({"state": CLOSED, "failures": 0, "opened": 0,
+                        "trial": 0})
+
+
+def record_failure(lab_uid):
+    """Registers a failed request to the remote laboratory with the given UID
+    and opens the circuit if the number of consecutive failures reaches the
+    threshold or if the request was the trial of a half-open circuit
+    """
+    threshold = get_circuit_breaker_threshold()
+    with _lock:
+        circuit = _get_circuit(lab_uid)
+        circuit["failures"] += 1
+        if not threshold:
+            return
+        if circuit["state"] == HALF_OPEN or circuit["failures"] >= threshold:
+            if circuit["state"] == CLOSED:
+                logger.warn("Circuit opened for {} after {} failures".format(
+                    lab_uid, circuit["failures"]))
+            circuit.update({"state": OPEN, "opened": time.time(), "trial": 0})
+
+
+def reset():
+    """Closes the circuits for all remote laboratories
+    """
+    with _lock:
+        _circuits.clear()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import threading
+from collections import OrderedDict
+
+from six.moves.queue import Empty
+from six.moves.queue import Queue
+
+# Default maximum number of tasks that run at once for a same key
+DEFAULT_LIMIT = 4
+
+
+def run_concurrently(tasks, limit=DEFAULT_LIMIT):
+    """Runs the tasks passed-in in threads and returns their results in the
+    same order. Tasks with a same key are run in no more than `limit` threads
+    at once, while tasks with different keys are run in parallel. The
+    result of a task that raised an exception is the exception itself.
+    Tasks must not access the database
+    :param tasks: list of tuples (key, function, args)
+    :param limit: maximum number of tasks with a same key running at once
+    :returns: list with the result of each task
+    """
+    results = [None] * len(tasks)
+
+    # Group the tasks by key
+    queues = OrderedDict()
+    for idx, task in enumerate(tasks):
+        key, func, args = task
+        queues.setdefault(key, Queue()).put((idx, func, args))
+
+    def consume(queue):
+        while True:
+            try:
+                idx, func, args = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[idx] = func(*args)
+            except Exception as e:
+                results[idx] = e
+
+    threads = []
+    for queue in queues.values():
+        for num in range(min(max(limit, 1), queue.qsize())):
+            thread = threading.Thread(target=consume, args=(queue,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+    return results
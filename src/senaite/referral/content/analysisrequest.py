@@ -18,16 +18,20 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import transaction
 from archetypes.schemaextender.interfaces import IBrowserLayerAwareExtender
 from archetypes.schemaextender.interfaces import ISchemaExtender
 from Products.CMFCore.permissions import View
 from senaite.referral import ISenaiteReferralLayer
 from senaite.referral import messageFactory as _
+from senaite.referral.catalog import INBOUND_SAMPLE_CATALOG
 from senaite.referral.catalog import SHIPMENT_CATALOG
 from senaite.referral.fields import ExtUIDReferenceField
+from senaite.referral.utils import reindex_metadata
 from zope.component import adapter
 from zope.interface import implementer
 
+from bika.lims import api
 from bika.lims.browser.widgets import ReferenceWidget
 from bika.lims.interfaces import IAnalysisRequest
 
@@ -74,3 +78,36 @@ class AnalysisRequestSchemaExtender(object):
 
     def getFields(self):
         return self.custom_fields
+
+
+def reindex_inbound_sample(sample):
+    """Updates the catalog metadata of the inbound sample the sample passed-in
+    was created from, if any, before the current transaction is committed.
+    The inbound samples are reindexed only once per transaction, no matter
+    how many times the sample is modified or transitioned
+    """
+    if not sample.hasInboundShipment():
+        return
+    uid = api.get_uid(sample)
+    txn = transaction.get()
+    for hook, args, kwargs in txn.getBeforeCommitHooks():
+        if hook == _reindex_before_commit:
+            args[0].add(uid)
+            return
+    txn.addBeforeCommitHook(_reindex_before_commit, args=(set([uid]), ))
+
+
+def _reindex_before_commit(uids):
+    """Updates the catalog metadata of the inbound samples the samples with
+    the given UIDs were created from. The inbound samples are looked up
+    through the catalog only, so nothing is done while not associated yet
+    """
+    query = {"portal_type": "InboundSample", "sample_uid": list(uids)}
+    for brain in api.search(query, INBOUND_SAMPLE_CATALOG):
+        reindex_metadata(api.get_object(brain))
+
+
+def ObjectModifiedEventHandler(sample, event):
+    """Event handler when a sample is modified
+    """
+    reindex_inbound_sample(sample)
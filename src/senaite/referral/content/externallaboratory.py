@@ -24,6 +24,8 @@ from plone.dexterity.content import Container
 from plone.supermodel import model
 from Products.CMFCore import permissions
 from senaite.referral import messageFactory as _
+from senaite.referral.catalog import INBOUND_SAMPLE_CATALOG
+from senaite.referral.catalog import SHIPMENT_CATALOG
 from senaite.referral.content import get_bool_value
 from senaite.referral.content import get_string_value
 from senaite.referral.content import get_uids_field_value
@@ -31,17 +33,42 @@ from senaite.referral.content import set_bool_value
 from senaite.referral.content import set_string_value
 from senaite.referral.content import set_uids_field_value
 from senaite.referral.interfaces import IExternalLaboratory
+from senaite.referral.tasks import add_task
+from senaite.referral.tasks import get_context_tasks
+from senaite.referral.tasks import register_task
 from senaite.referral.utils import get_by_code
+from senaite.referral.utils import invalidate_codes_cache
 from senaite.referral.utils import is_valid_code
 from senaite.referral.utils import is_valid_url
 from zope import schema
+from zope.annotation.interfaces import IAnnotations
 from zope.interface import implementer
 from zope.interface import Invalid
 from zope.interface import invariant
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
 
 from bika.lims import api
 from bika.lims.interfaces import IDeactivable
 
+# Name of the task that reindexes the shipments and inbound samples that
+# depend on the code or title of a laboratory
+REINDEX_DEPENDENTS_TASK = "senaite.referral.reindex_laboratory_dependents"
+
+# Annotation key where the code and title of the laboratory are stored the
+# last time the reindex of its dependents was checked
+DEPENDENTS_LABELS_STORAGE = "senaite.referral.dependents_labels"
+
+# Tuples of (catalog id, indexes) that depend on the code or title of the
+# laboratory. Metadata is always updated on reindex
+DEPENDENT_INDEXES = [
+    (SHIPMENT_CATALOG, ["shipment_searchable_text"]),
+    (INBOUND_SAMPLE_CATALOG, ["laboratory_code",
+                              "inbound_sample_searchable_text"]),
+]
+
+# Number of objects reindexed by the background worker on each task
+REINDEX_DEPENDENTS_BATCH_SIZE = 500
+
 
 class IExternalLaboratorySchema(model.Schema):
     """ExternalLaboratory content schema
@@ -332,3 +359,85 @@ class ExternalLaboratory(Container):
         requests
         """
         return get_string_value(self, "password")
+
+
+def get_outdated_dependents(laboratory, catalog_id):
+    """Returns a generator of the brains from the catalog passed-in that
+    belong to the laboratory and were indexed with a code or title other than
+    the current ones of the laboratory
+    """
+    code = laboratory.getCode()
+    title = api.get_title(laboratory)
+    query = {"laboratory_uid": api.get_uid(laboratory)}
+    for brain in api.search(query, catalog_id):
+        if brain.laboratory_code != code or brain.laboratory_title != title:
+            yield brain
+
+
+def has_outdated_dependents(laboratory):
+    """Returns whether there are objects that belong to the laboratory indexed
+    with a code or title other than the current ones of the laboratory
+    """
+    for catalog_id, idxs in DEPENDENT_INDEXES:
+        for brain in get_outdated_dependents(laboratory, catalog_id):
+            return True
+    return False
+
+
+def update_dependents_labels(laboratory):
+    """Stores the current code and title of the laboratory and returns whether
+    they differ from the ones stored the last time
+    """
+    labels = (laboratory.getCode(), api.get_title(laboratory))
+    annotation = IAnnotations(laboratory)
+    if annotation.get(DEPENDENTS_LABELS_STORAGE) == labels:
+        return False
+    annotation[DEPENDENTS_LABELS_STORAGE] = labels
+    return True
+
+
+def is_reindex_queued(laboratory):
+    """Returns whether the reindex of the dependents of the laboratory is
+    waiting to be processed by the background worker
+    """
+    tasks = get_context_tasks(laboratory)
+    tasks = filter(lambda task: task.get("name") == REINDEX_DEPENDENTS_TASK,
+                   tasks)
+    return any(map(lambda task: not task.get("failed"), tasks))
+
+
+@register_task(REINDEX_DEPENDENTS_TASK)
+def reindex_dependents(laboratory, task):
+    """Reindexes the indexes that depend on the code or title of the
+    laboratory for a batch of the shipments and inbound samples that are
+    outdated. Another task is added if there are more objects to reindex
+    """
+    count = 0
+    for catalog_id, idxs in DEPENDENT_INDEXES:
+        for brain in get_outdated_dependents(laboratory, catalog_id):
+            if count >= REINDEX_DEPENDENTS_BATCH_SIZE:
+                add_task(REINDEX_DEPENDENTS_TASK, laboratory)
+                return
+            obj = api.get_object(brain)
+            obj.reindexObject(idxs=idxs)
+            obj._p_deactivate()
+            count += 1
+
+
+def ObjectModifiedEventHandler(laboratory, event):
+    """Event handler when an external laboratory is modified or removed
+    """
+    # The code might have changed
+    invalidate_codes_cache()
+
+    if IObjectRemovedEvent.providedBy(event):
+        return
+
+    # Reindex the shipments and inbound samples in the background if the code
+    # or the title of the laboratory changed
+    if not update_dependents_labels(laboratory):
+        return
+    if is_reindex_queued(laboratory):
+        return
+    if has_outdated_dependents(laboratory):
+        add_task(REINDEX_DEPENDENTS_TASK, laboratory)
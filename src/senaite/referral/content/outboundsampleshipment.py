@@ -34,6 +34,7 @@ from senaite.referral.content import set_string_value
 from senaite.referral.content import set_uids_field_value
 from senaite.referral.interfaces import IOutboundSampleShipment
 from senaite.referral.utils import get_action_date
+from senaite.referral.utils import reindex_metadata
 from zope import schema
 from zope.interface import implementer
 
@@ -200,6 +201,9 @@ class OutboundSampleShipment(Container):
         uids.append(sample_uid)
         self.setSamples(uids)
 
+        # Update the number of samples from catalog metadata
+        reindex_metadata(self)
+
     def removeSample(self, value):
         """Removes a sample from this shipment
         """
@@ -214,6 +218,9 @@ class OutboundSampleShipment(Container):
         uids.remove(sample_uid)
         self.setSamples(uids)
 
+        # Update the number of samples from catalog metadata
+        reindex_metadata(self)
+
     def in_preparation(self):
         """Return whether the status of the shipment is "preparation"
         """
@@ -18,19 +18,18 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
-import transaction
 from AccessControl import ClassSecurityInfo
 from AccessControl.Permissions import \
     manage_zcatalog_entries as ManageZCatalogEntries
-from Acquisition import aq_inner
-from Acquisition import aq_parent
 from App.class_init import InitializeClass
 from bika.lims import api
-from senaite.referral import logger
 from Products.CMFPlone.CatalogTool import CatalogTool
 from Products.CMFPlone.utils import base_hasattr
 from Products.CMFPlone.utils import safe_callable
 from Products.ZCatalog.ZCatalog import ZCatalog
+from senaite.referral.core.catalog import deferred
+from senaite.referral.core.catalog import rebuild
+from senaite.referral.core.catalog.indexing import indexing_context
 from senaite.referral.core.interfaces import ISenaiteCatalog
 from zope.interface import implementer
 
@@ -122,62 +121,36 @@ class BaseCatalog(CatalogTool):
         mapped_at_types = self.get_mapped_at_types()
         return mapped_catalog_types + mapped_at_types
 
+    def catalog_object(self, object, uid=None, idxs=None, update_metadata=1,
+                       pghandler=None):
+        """Defers the indexing of the object if deferred indexing is enabled.
+        Otherwise, indexes the object within an indexing context, so the
+        values resolved by indexers are shared
+        """
+        if deferred.is_deferred():
+            if uid is None:
+                uid = api.get_path(object)
+            deferred.defer(self, object, uid, idxs=idxs,
+                           update_metadata=update_metadata)
+            return
+        with indexing_context(object):
+            return super(BaseCatalog, self).catalog_object(
+                object, uid=uid, idxs=idxs, update_metadata=update_metadata,
+                pghandler=pghandler)
+
+    def uncatalog_object(self, uid):
+        """Discards the deferred indexing of the object, if any
+        """
+        if deferred.is_deferred():
+            deferred.discard(self, uid)
+        return super(BaseCatalog, self).uncatalog_object(uid)
+
     @security.protected(ManageZCatalogEntries)
     def clearFindAndRebuild(self):
-        """Considers only mapped types when reindexing the whole catalog
+        """Considers only mapped types when reindexing the whole catalog. The
+        rebuild runs from scratch within the current transaction
         """
-        idxs = list(self.indexes())
-
-        # porta types to consider for this catalog
-        mapped_types = self.get_mapped_types()
-
-        def indexObject(obj, path):
-            __traceback_info__ = path
-
-            # skip non-indexable types
-            if not self.is_indexable(obj):
-                return
-
-            # get the porta type of this object
-            portal_type = self.get_portal_type(obj)
-
-            try:
-                # only consider mapped types if we have them set
-                if mapped_types and portal_type in mapped_types:
-                    # NOTE: This method indexes only the object in this
-                    #       catalog, but does not take DX multiplexing into
-                    #       consideration.
-                    self._reindexObject(obj, idxs=idxs)  # bypass queue
-                    self.counter += 1
-                elif api.is_dexterity_content(obj):
-                    # NOTE: Catalog multiplexing is only available for DX types
-                    #       and stores the catalogs in a variable `_catalogs`.
-                    multiplex_catalogs = getattr(obj, "_catalogs", [])
-                    if self.id in multiplex_catalogs:
-                        self._reindexObject(obj, idxs=idxs)  # bypass queue
-                        self.counter += 1
-                else:
-                    return
-            except TypeError:
-                # Catalogs have 'indexObject' as well, but they
-                # take different args, and will fail
-                pass
-
-            if self.counter and self.counter % 100 == 0:
-                logger.info("Progress: {} objects have been cataloged for {}."
-                            .format(self.counter, self.id))
-                transaction.savepoint(optimistic=True)
-
-        logger.info("Cleaning and rebuilding catalog '%s'..." % self.id)
-        self.counter = 0
-        self.manage_catalogClear()
-        portal = aq_parent(aq_inner(self))
-        portal.ZopeFindAndApply(
-            portal,
-            search_sub=True,
-            apply_func=indexObject
-        )
-        logger.info("Catalog '%s' cleaned and rebuilt" % self.id)
+        rebuild.rebuild(self)
 
 
 InitializeClass(BaseCatalog)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import transaction
+from senaite.referral import logger
+
+# Number of deferred objects indexed between savepoints
+DEFERRED_BATCH_SIZE = 100
+
+_local = threading.local()
+
+
+def is_deferred():
+    """Returns whether the indexing of objects is deferred in current thread
+    """
+    return getattr(_local, "pending", None) is not None
+
+
+def defer(catalog, obj, uid, idxs=None, update_metadata=1):
+    """Keeps the object to be indexed in the catalog when the deferred
+    indexing context is left. An object deferred more than once is only
+    indexed once, with all the indexes requested
+    """
+    key = (catalog.id, uid)
+    idxs = list(idxs or [])
+    existing = _local.pending.get(key)
+    if existing:
+        # an empty list of indexes means all indexes
+        if existing["idxs"] and idxs:
+            idxs = list(set(existing["idxs"] + idxs))
+        else:
+            idxs = []
+        update_metadata = existing["update_metadata"] or update_metadata
+    _local.pending[key] = {
+        "catalog": catalog,
+        "obj": obj,
+        "uid": uid,
+        "idxs": idxs,
+        "update_metadata": update_metadata,
+    }
+
+
+def discard(catalog, uid):
+    """Discards the deferred indexing of the object with the given uid
+    """
+    _local.pending.pop((catalog.id, uid), None)
+
+
+def flush(pending, batch_size=DEFERRED_BATCH_SIZE):
+    """Indexes the deferred objects, in batches of batch_size
+    """
+    for num, item in enumerate(pending.values(), start=1):
+        catalog = item["catalog"]
+        catalog.catalog_object(item["obj"], uid=item["uid"],
+                               idxs=item["idxs"],
+                               update_metadata=item["update_metadata"])
+        if num % batch_size == 0:
+            logger.info("Indexed {}/{} deferred objects"
+                        .format(num, len(pending)))
+            transaction.savepoint(optimistic=True)
+
+
+@contextmanager
+def deferred_indexing(batch_size=DEFERRED_BATCH_SIZE):
+    """Defers the indexing of objects in senaite.referral catalogs until the
+    context is left. Objects are indexed only once, in batches. Note catalog
+    searches made inside the context do not return the deferred objects
+    """
+    if is_deferred():
+        # nested, the outermost context does the indexing
+        yield
+        return
+
+    _local.pending = OrderedDict()
+    try:
+        yield
+        pending = _local.pending
+    finally:
+        _local.pending = None
+    flush(pending, batch_size=batch_size)
+
+
+@contextmanager
+def immediate_indexing():
+    """Indexes the objects right away while inside the context, even if it is
+    nested within a deferred indexing context. Useful for objects that have
+    to be searched through the catalog before the deferred context is left
+    """
+    pending = getattr(_local, "pending", None)
+    _local.pending = None
+    try:
+        yield
+    finally:
+        _local.pending = pending
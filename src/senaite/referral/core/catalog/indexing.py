@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import threading
+from contextlib import contextmanager
+
+from Acquisition import aq_base
+
+_local = threading.local()
+
+
+@contextmanager
+def indexing_context(obj):
+    """Keeps the values resolved by the indexers of the object passed-in while
+    the context is active, so they are shared across indexers and metadata
+    columns instead of being resolved once per indexer
+    """
+    previous = getattr(_local, "context", None)
+    _local.context = (aq_base(obj), {})
+    try:
+        yield
+    finally:
+        _local.context = previous
+
+
+def get_cached(obj, key, getter):
+    """Returns the value for the given key, resolved with the getter only
+    once while the object is being indexed. The getter is always called if
+    the object is not being indexed
+    """
+    context = getattr(_local, "context", None)
+    if not context or context[0] is not aq_base(obj):
+        return getter()
+    cache = context[1]
+    if key not in cache:
+        cache[key] = getter()
+    return cache[key]
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import transaction
+from BTrees.OOBTree import OOBTree
+from senaite.referral import logger
+from zope.annotation.interfaces import IAnnotations
+from zope.dottedname.resolve import resolve
+from ZODB.POSException import ConflictError
+
+from bika.lims import api
+
+REBUILD_STORAGE = "senaite.referral.rebuild"
+
+# Number of objects indexed between commits (and checkpoints)
+REBUILD_BATCH_SIZE = 500
+
+# Maximum number of times a rebuild resumes after a conflict error
+MAX_CONFLICT_RETRIES = 5
+
+
+def get_checkpoints(portal=None):
+    """Returns the persistent storage of the rebuild checkpoints, keyed by
+    catalog id, worker and number of workers
+    :returns: OOBTree
+    """
+    portal = portal or api.get_portal()
+    annotation = IAnnotations(portal)
+    if annotation.get(REBUILD_STORAGE) is None:
+        annotation[REBUILD_STORAGE] = OOBTree()
+    return annotation[REBUILD_STORAGE]
+
+
+def get_checkpoint(catalog, worker=0, workers=1):
+    """Returns the path of the last object indexed by the rebuild of the
+    catalog for the given worker, an empty string if the rebuild started but
+    no object has been indexed yet, or None if there is no rebuild in progress
+    """
+    key = (catalog.id, worker, workers)
+    return get_checkpoints().get(key)
+
+
+def set_checkpoint(catalog, path, worker=0, workers=1):
+    """Stores the path of the last object indexed by the rebuild of the
+    catalog for the given worker. The rebuild is marked as done if None
+    """
+    key = (catalog.id, worker, workers)
+    checkpoints = get_checkpoints()
+    if path is None:
+        checkpoints.pop(key, None)
+    else:
+        checkpoints[key] = path
+
+
+def get_container_types(portal_types):
+    """Returns the portal types that can contain objects from the given types,
+    either directly or through their children, according to their type
+    information
+    """
+    allowed = {}
+    for fti in api.get_tool("portal_types").listTypeInfo():
+        if not getattr(fti, "filter_content_types", True):
+            # type can contain any type
+            allowed[fti.getId()] = None
+            continue
+        allowed[fti.getId()] = set(fti.allowed_content_types or [])
+
+    containers = set()
+    targets = set(portal_types)
+    while True:
+        found = filter(lambda pt: allowed[pt] is None or allowed[pt] & targets,
+                       set(allowed.keys()) - containers)
+        if not found:
+            break
+        containers.update(found)
+        targets.update(found)
+    return containers
+
+
+def get_multiplexed_types(catalog):
+    """Returns the Dexterity portal types whose objects are indexed in the
+    catalog through catalog multiplexing, according to the `_catalogs` of
+    their class
+    """
+    portal_types = []
+    for fti in api.get_tool("portal_types").listTypeInfo():
+        klass = getattr(fti, "klass", None)
+        if not klass:
+            # not a Dexterity type
+            continue
+        try:
+            klass = resolve(klass)
+        except (ImportError, AttributeError):
+            continue
+        if catalog.id in getattr(klass, "_catalogs", []):
+            portal_types.append(fti.getId())
+    return portal_types
+
+
+def is_multiplexed(catalog, obj):
+    """Returns whether the object is a Dexterity object that is indexed in the
+    catalog through catalog multiplexing
+    """
+    if not api.is_dexterity_content(obj):
+        return False
+    # NOTE: Catalog multiplexing is only available for DX types and stores
+    #       the catalogs in a variable `_catalogs`
+    return catalog.id in getattr(obj, "_catalogs", [])
+
+
+def in_partition(uid, worker=0, workers=1):
+    """Returns whether the UID passed-in falls within the range of UIDs the
+    worker is responsible of, when the UID space is evenly split across the
+    given number of workers
+    """
+    if workers <= 1:
+        return True
+    try:
+        value = int(uid[:8], 16)
+    except (TypeError, ValueError):
+        # not an hexadecimal UID, first worker takes care of it
+        return worker == 0
+    return value * workers // 0x100000000 == worker
+
+
+def get_path_key(path):
+    """Returns a tuple with the elements of the path, suitable for sorting
+    paths in the same order they are walked
+    """
+    return tuple(path.split("/"))
+
+
+def walk(container, portal_types, containers, checkpoint=None):
+    """Yields the objects from inside the container that are from any of the
+    portal types passed-in, in order of path. Only the objects from the
+    container types are walked through. Objects with a path before the
+    checkpoint are skipped, so a walk can be resumed
+    """
+    for obj_id in sorted(container.objectIds()):
+        obj = container._getOb(obj_id, None)
+        if obj is None:
+            continue
+
+        key = get_path_key(api.get_path(obj))
+        ancestor = checkpoint and checkpoint[:len(key)] == key
+        if checkpoint and key < checkpoint and not ancestor:
+            # the object and its children were walked already
+            continue
+
+        portal_type = getattr(obj, "portal_type", None)
+        if portal_type in portal_types and not ancestor:
+            yield obj
+
+        if portal_type in containers:
+            for child in walk(obj, portal_types, containers, checkpoint):
+                yield child
+            obj._p_deactivate()
+
+
+def clear(catalog, worker=0, workers=1):
+    """Removes the catalog entries the worker is responsible of
+    """
+    if workers <= 1:
+        catalog.manage_catalogClear()
+        return
+
+    brains = catalog.unrestrictedSearchResults()
+    paths = [brain.getPath() for brain in brains
+             if in_partition(brain.UID, worker, workers)]
+    for path in paths:
+        catalog.uncatalog_object(path)
+
+
+def rebuild(catalog, worker=0, workers=1, batch_size=REBUILD_BATCH_SIZE,
+            resume=False):
+    """Clears and rebuilds the catalog, walking through the containers of the
+    types mapped to the catalog only. If the number of workers is greater than
+    one, only the objects with a UID within the range of the worker are
+    rebuilt, so the work can be split across several ZEO clients.
+
+    If resume is False, the rebuild starts from scratch and runs within the
+    current transaction, with a savepoint after each batch. Stale checkpoints
+    of a previous rebuild with same worker arguments are removed.
+
+    If resume is True, a checkpoint is committed after each batch, so an
+    interrupted rebuild resumes from the last checkpoint when called again
+    with same worker arguments.
+    :param worker: zero-based number of the worker
+    :param workers: number of workers the rebuild is split across
+    :param resume: whether to commit checkpoints and resume from them
+    :returns: the number of objects indexed
+    """
+    if worker < 0 or worker >= workers:
+        raise ValueError("Worker must be between 0 and {}".format(workers - 1))
+
+    if not resume:
+        if get_checkpoint(catalog, worker, workers) is not None:
+            set_checkpoint(catalog, None, worker, workers)
+        return _rebuild(catalog, worker, workers, batch_size)
+
+    attempts = 0
+    while True:
+        try:
+            return _rebuild(catalog, worker, workers, batch_size, resume=True)
+        except ConflictError:
+            transaction.abort()
+            attempts += 1
+            if attempts >= MAX_CONFLICT_RETRIES:
+                raise
+            logger.warn("Conflict while rebuilding catalog '{}'. Resuming "
+                        "from last checkpoint".format(catalog.id))
+
+
+def _rebuild(catalog, worker, workers, batch_size, resume=False):
+    """Rebuilds the catalog. If resume is True, the rebuild resumes from the
+    last checkpoint if any and commits a checkpoint after each batch
+    """
+    checkpoint = None
+    if resume:
+        checkpoint = get_checkpoint(catalog, worker, workers)
+
+    if checkpoint is None:
+        logger.info("Cleaning catalog '{}' ({}/{}) ..."
+                    .format(catalog.id, worker + 1, workers))
+        clear(catalog, worker, workers)
+        if resume:
+            set_checkpoint(catalog, "", worker, workers)
+            transaction.commit()
+    elif checkpoint:
+        logger.info("Resuming rebuild of catalog '{}' ({}/{}) from {}"
+                    .format(catalog.id, worker + 1, workers, checkpoint))
+
+    idxs = list(catalog.indexes())
+    mapped_types = catalog.get_mapped_types()
+    portal_types = set(mapped_types + get_multiplexed_types(catalog))
+    containers = get_container_types(portal_types)
+
+    portal = api.get_portal()
+    checkpoint = get_path_key(checkpoint) if checkpoint else None
+    count = 0
+    for obj in walk(portal, portal_types, containers, checkpoint):
+        uid = api.get_uid(obj)
+        if not in_partition(uid, worker, workers):
+            continue
+        if not catalog.is_indexable(obj):
+            continue
+        portal_type = catalog.get_portal_type(obj)
+        if portal_type not in mapped_types and \
+                not is_multiplexed(catalog, obj):
+            continue
+
+        catalog._reindexObject(obj, idxs=idxs)  # bypass queue
+        count += 1
+        if count % batch_size == 0:
+            if resume:
+                set_checkpoint(catalog, api.get_path(obj), worker, workers)
+                transaction.commit()
+            else:
+                transaction.savepoint(optimistic=True)
+            logger.info("Progress: {} objects have been cataloged for {} "
+                        "({}/{})".format(count, catalog.id, worker + 1,
+                                         workers))
+        obj._p_deactivate()
+
+    if resume:
+        set_checkpoint(catalog, None, worker, workers)
+        transaction.commit()
+    logger.info("Catalog '{}' ({}/{}) cleaned and rebuilt: {} objects"
+                .format(catalog.id, worker + 1, workers, count))
+    return count
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import gzip
+import zlib
+from io import BytesIO
+
+from senaite.referral import logger
+from zExceptions import BadRequest
+
+# Path of senaite.jsonapi's push endpoint, where notifications are received
+PUSH_PATH = "@@API/senaite/v1/push"
+
+# Maximum size in bytes of a decompressed request body
+MAX_DECOMPRESSED_SIZE = 100 * 1024 * 1024
+
+
+def is_push_request(request):
+    """Returns whether the request passed-in is a push notification
+    """
+    path = request.get("PATH_INFO", "") or ""
+    return path.rstrip("/").endswith(PUSH_PATH)
+
+
+def decompress(data):
+    """Returns the gzip-compressed bytestring passed-in decompressed. Raises
+    a ValueError if the data is not valid or too big once decompressed
+    """
+    try:
+        with gzip.GzipFile(fileobj=BytesIO(data), mode="rb") as f:
+            out = f.read(MAX_DECOMPRESSED_SIZE + 1)
+    except (IOError, EOFError, zlib.error) as e:
+        raise ValueError("Non-valid gzip body: {}".format(e))
+    if len(out) > MAX_DECOMPRESSED_SIZE:
+        raise ValueError("Decompressed body is too big")
+    return out
+
+
+def on_publication_start(event):
+    """Event handler for the start of the publication of a request. Tells the
+    referring laboratories that gzip-encoded push notifications are accepted
+    (RFC 7694) and decompresses the body of those that are gzip-encoded, so
+    senaite.jsonapi reads the plain JSON as usual. Requests with a body that
+    cannot be decompressed are rejected with a 400 Bad Request
+    """
+    request = event.request
+    if not is_push_request(request):
+        return
+
+    response = request.response
+    response.setHeader("Accept-Encoding", "gzip")
+
+    encoding = request.environ.get("HTTP_CONTENT_ENCODING", "")
+    encoding = encoding.strip().lower()
+    if not encoding or encoding == "identity":
+        return
+
+    if encoding != "gzip":
+        logger.warn("Content-Encoding not supported: {}".format(encoding))
+        return
+
+    request.stdin.seek(0)
+    try:
+        body = decompress(request.stdin.read())
+    except ValueError as e:
+        # Reject the request, the notification cannot be processed
+        logger.error(str(e))
+        raise BadRequest(str(e))
+
+    # Replace the body with the decompressed data
+    request.stdin = BytesIO(body)
+    request.environ["CONTENT_LENGTH"] = str(len(body))
+    del request.environ["HTTP_CONTENT_ENCODING"]
@@ -18,60 +18,45 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
-import copy
-
-import json
+import transaction
 from plone.memoize.instance import memoize
 from senaite.jsonapi.interfaces import IPushConsumer
+from senaite.referral import logger
 from senaite.referral import utils
 from senaite.referral.catalog import SHIPMENT_CATALOG
+from senaite.referral.jsonapi.idempotency import idempotent
+from senaite.referral.jsonapi.payload import BaseConsumer
+from senaite.referral.jsonapi.schema import compile_schema
+from senaite.referral.jsonapi.schema import Field
+from senaite.referral.jsonapi.schema import validate
+from senaite.referral.notifications import save_received
+from senaite.referral.tasks import add_task
+from senaite.referral.tasks import register_task
 from senaite.referral.workflow import change_workflow_state
 from zope.interface import implementer
+from ZODB.POSException import ConflictError
 
 from bika.lims import api
 from bika.lims.catalog import CATALOG_ANALYSIS_REQUEST_LISTING
 from bika.lims.workflow import doActionFor
 from bika.lims.workflow import isTransitionAllowed
 
-_marker = object()
-
-
-class BaseConsumer(object):
+# Types of the shipments the items of a notification can refer to
+SHIPMENT_TYPES = ["InboundSampleShipment", "OutboundSampleShipment"]
 
-    _data = None
-
-    def __init__(self, data):
-        self.raw_data = data
-
-    @property
-    def data(self):
-        if self._data is None:
-            self._data = {}
-            for key in self.raw_data.keys():
-                self._data[key] = self.get_record(self.raw_data, key)
-        return self._data
-
-    def get_record(self, payload, id):
-        record = payload.get(id)
-        if isinstance(record, (list, tuple, list, dict)):
-            return copy.deepcopy(record)
-        try:
-            return json.loads(record)
-        except:
-            return record
+# Validator of the items of the payload
+ITEM_SCHEMA = compile_schema([
+    ("portal_type", Field(required=True)),
+])
 
-    def get_value(self, item, field_name, default=_marker):
-        if field_name not in item:
-            if default is _marker:
-                raise ValueError("Field is missing: '{}'".format(field_name))
-            return default
+# Validator of the payload
+PAYLOAD_SCHEMA = compile_schema([
+    ("lab_code", Field(required=True)),
+    ("items", Field(required=True, records=ITEM_SCHEMA)),
+])
 
-        value = item.get(field_name)
-        if not value:
-            if default is _marker:
-                raise ValueError("Field is empty: '{}'".format(field_name))
-            return default
-        return value
+# Name of the task for the processing of the items of a notification
+PROCESS_ITEMS_TASK = "senaite.referral.process_consumer_items"
 
 
 @implementer(IPushConsumer)
@@ -79,6 +64,10 @@ class ReferralConsumer(BaseConsumer):
     """Handles push requests for name senaite.referral.consumer
     """
 
+    # Brains of the samples and shipments the items refer to, keyed by
+    # (portal_type, id) tuples
+    _resolved = None
+
     @property
     def items(self):
         return self.get_value(self.data, "items")
@@ -96,12 +85,13 @@ class ReferralConsumer(BaseConsumer):
         """
         return utils.get_by_code("ExternalLaboratory", self.lab_code)
 
+    @idempotent
     def process(self):
         """Processes the data sent via POST in accordance with the value for
         'action' parameter of the POST request
         """
-        if not self.lab_code:
-            raise ValueError("No lab_code defined")
+        # Validate the data passed-in, items included
+        validate(PAYLOAD_SCHEMA, self.data)
 
         laboratory = self.get_laboratory()
         if not laboratory:
@@ -114,33 +104,71 @@ class ReferralConsumer(BaseConsumer):
         # We need to bypass the guard's check for current context!
         api.get_request().set("lab_code", self.lab_code)
 
+        # Validate the items before processing any of them
+        items = self.get_items()
+
+        # Process the items in the background if too many
+        threshold = utils.get_consumer_async_threshold()
+        if threshold and len(items) > threshold:
+            self.queue_items(items)
+            api.get_request().response.setStatus(202)
+            return True
+
+        # Search the samples and shipments of all items at once
+        self.resolve(items)
+
+        # Iterate through items and process them
+        for item in items:
+            self.process_item(item)
+
+        return True
+
+    def get_items(self):
+        """Returns the items to process, with the action to perform for each
+        one set. Raises a ValueError if the action is missing for any item
+        """
         # backwards compatibility
         # see https://github.com/senaite/senaite.referral/pull/21
         default_action = self.get_value(self.data, "action", default=None)
 
-        # Iterate through items and process them
+        items = []
+        errors = []
         for item in self.items:
-
-            # Try to delegate to an existing function
-            portal_type = self.get_value(item, "portal_type").lower()
             action = self.get_value(item, "action", default=default_action)
             if not action:
-                raise ValueError("No action defined: %s" % repr(item))
-
-            func_name = "do_{}_{}".format(portal_type, action)
-            func = getattr(self, func_name, None)
-            if func:
-                func(item)
-            else:
-                # Rely on default 'do_action'
-                self.do_action(item, action)
-
-        return True
+                errors.append("No action defined: %s" % repr(item))
+            items.append(dict(item, action=action))
+        if errors:
+            raise ValueError("; ".join(errors))
+        return items
+
+    def process_item(self, item):
+        """Performs the action set for the item passed-in
+        """
+        # Try to delegate to an existing function
+        portal_type = self.get_value(item, "portal_type").lower()
+        action = self.get_value(item, "action")
+        func_name = "do_{}_{}".format(portal_type, action)
+        func = getattr(self, func_name, None)
+        if func:
+            func(item)
+        else:
+            # Rely on default 'do_action'
+            self.do_action(item, action)
+
+    def queue_items(self, items):
+        """Adds tasks for the items passed-in to be processed in background.
+        Consecutive items with same action are processed in chunks of the
+        size set for the action
+        """
+        laboratory = self.get_laboratory()
+        for chunk in get_chunks(items):
+            add_task(PROCESS_ITEMS_TASK, laboratory, lab_code=self.lab_code,
+                     items=chunk)
 
     def do_analysisrequest_reject(self, item):
         """Rejects a referred sample
         """
-        # TODO Performance - convert to queue task
         rejection_reasons = self.get_value(item, "RejectionReasons")
         obj = self.get_object_for(item)
         obj.setRejectionReasons(rejection_reasons)
@@ -158,7 +186,6 @@ class ReferralConsumer(BaseConsumer):
     def do_action(self, item_or_object, action):
         """Performs an action against the given object
         """
-        # TODO Performance - convert to queue task
         # Get the object counterpart
         obj = self.get_object_for(item_or_object)
 
@@ -214,7 +241,7 @@ class ReferralConsumer(BaseConsumer):
         portal_type = self.get_counterpart_type(item_type)
 
         # do the search
-        if portal_type in ["OutboundSampleShipment", "InboundSampleShipment"]:
+        if portal_type in SHIPMENT_TYPES:
             return self.get_shipment_for(item)
 
         elif portal_type == "AnalysisRequest":
@@ -222,6 +249,60 @@ class ReferralConsumer(BaseConsumer):
 
         raise ValueError("Type is not supported: {}".format(item_type))
 
+    def resolve(self, items):
+        """Searches the samples and shipments the items passed-in refer to,
+        with a single catalog query per type, so they are not searched one
+        by one when the items are processed afterwards
+        """
+        sample_ids = set()
+        shipment_types = set()
+        shipment_ids = set()
+        for item in items:
+            item_type = self.get_value(item, "portal_type", default=None)
+            portal_type = self.get_counterpart_type(item_type)
+            if portal_type == "AnalysisRequest":
+                sample_ids.add(self.get_original_id(item))
+            elif portal_type in SHIPMENT_TYPES:
+                shipment_types.add(portal_type)
+                shipment_ids.add(self.get_value(item, "shipment_id",
+                                                default=None))
+
+        resolved = {}
+        sample_ids = filter(None, sample_ids)
+        if sample_ids:
+            for sample_id in sample_ids:
+                resolved[("AnalysisRequest", sample_id)] = []
+            query = {"portal_type": "AnalysisRequest", "id": sample_ids}
+            for brain in api.search(query, CATALOG_ANALYSIS_REQUEST_LISTING):
+                key = ("AnalysisRequest", brain.getId)
+                resolved.setdefault(key, []).append(brain)
+
+        shipment_ids = filter(None, shipment_ids)
+        if shipment_ids:
+            for portal_type in shipment_types:
+                for shipment_id in shipment_ids:
+                    resolved[(portal_type, shipment_id)] = []
+            laboratory = self.get_laboratory()
+            query = {
+                "portal_type": list(shipment_types),
+                "shipment_id": shipment_ids,
+                "laboratory_uid": api.get_uid(laboratory),
+            }
+            for brain in api.search(query, SHIPMENT_CATALOG):
+                key = (brain.portal_type, brain.shipment_id)
+                resolved.setdefault(key, []).append(brain)
+
+        self._resolved = resolved
+
+    def search(self, key, query, catalog):
+        """Returns the brains resolved beforehand for the given key, if any.
+        Otherwise, does the search with the query and catalog passed-in
+        """
+        resolved = self._resolved or {}
+        if key in resolved:
+            return resolved[key]
+        return api.search(query, catalog)
+
     def get_shipment_for(self, item):
         """Returns the InboundSampleShipment or OutboundSampleShipment object
         from current instance that is related with the information provided in
@@ -241,18 +322,24 @@ class ReferralConsumer(BaseConsumer):
             "shipment_id": shipment_id,
             "laboratory_uid": api.get_uid(laboratory),
         }
-        brains = api.search(query, SHIPMENT_CATALOG)
+        key = (portal_type, shipment_id)
+        brains = self.search(key, query, SHIPMENT_CATALOG)
         if len(brains) != 1:
             raise ValueError("No Shipment found for {}".format(shipment_id))
 
         return api.get_object(brains[0])
 
+    def get_original_id(self, item):
+        """Returns the id of the sample at current instance the item refers to
+        """
+        original_id = self.get_value(item, "ClientSampleID", default=None)
+        return self.get_value(item, "referring_id", default=original_id)
+
     def get_sample_for(self, item):
         """Returns the AnalysisRequest object from current instance that is
         related with the information provided in the item passed-in, if any
         """
-        original_id = self.get_value(item, "ClientSampleID", default=None)
-        original_id = self.get_value(item, "referring_id", default=original_id)
+        original_id = self.get_original_id(item)
         if not original_id:
             raise ValueError("No ClientSampleID or referring_id")
 
@@ -260,24 +347,99 @@ class ReferralConsumer(BaseConsumer):
             "portal_type": "AnalysisRequest",
             "id": original_id
         }
-        brains = api.search(query, CATALOG_ANALYSIS_REQUEST_LISTING)
+        key = ("AnalysisRequest", original_id)
+        brains = self.search(key, query, CATALOG_ANALYSIS_REQUEST_LISTING)
         # TODO Check whether the inferred sample is the expected one
         if len(brains) != 1:
             raise ValueError("No Sample found for {}".format(original_id))
 
-        sample = api.get_object(brains[0])
-
-        # If the sample is invalidated, return the retest instead
-        while self.is_invalidated(sample):
-            sample = sample.getRetest()
-            if not sample:
+        # If the sample is invalidated, return the retest instead. Walk
+        # through brains, so only the last sample of the chain is woken up
+        brain = brains[0]
+        while self.is_invalidated(brain):
+            brain = self.get_retest_brain(brain)
+            if not brain:
                 raise ValueError("No retest found for '%s'" % original_id)
 
-        return sample
+        return api.get_object(brain)
+
+    def get_retest_brain(self, brain):
+        """Returns the catalog brain of the retest of the sample passed-in, if
+        any
+        """
+        query = {
+            "portal_type": "AnalysisRequest",
+            "getRawInvalidated": api.get_uid(brain),
+        }
+        brains = api.search(query, CATALOG_ANALYSIS_REQUEST_LISTING)
+        return brains[0] if brains else None
 
     def is_invalidated(self, sample):
-        """Returns whether the sample was invalidated in present laboratory
-        or at reference laboratory
+        """Returns whether the sample or brain was invalidated in present
+        laboratory or at reference laboratory
         """
         statuses = ["invalid", "invalidated_at_reference"]
         return api.get_review_status(sample) in statuses
+
+
+def get_chunks(items):
+    """Splits the items passed-in in chunks of consecutive items with the same
+    action, of up to the chunk size set for the action
+    """
+    chunks = []
+    for item in items:
+        action = item.get("action")
+        chunk_size = utils.get_chunk_size_for(action)
+        chunk = chunks and chunks[-1] or None
+        if not chunk or chunk[-1].get("action") != action or (
+                0 < chunk_size <= len(chunk)):
+            chunk = []
+            chunks.append(chunk)
+        chunk.append(item)
+    return chunks
+
+
+def get_outcome(item, error=None):
+    """Returns a dict with the outcome of the processing of the item
+    """
+    identifier = item.get("shipment_id") or item.get("referring_id") or \
+        item.get("ClientSampleID")
+    return {
+        "item": identifier,
+        "portal_type": item.get("portal_type"),
+        "action": item.get("action"),
+        "success": error is None,
+        "message": str(error) if error else "",
+    }
+
+
+@register_task(PROCESS_ITEMS_TASK)
+def process_items(laboratory, task):
+    """Processes the task with the items of a notification from a remote
+    laboratory. Items that fail do not prevent the rest from being processed,
+    and the outcome of each one is stored in the laboratory
+    """
+    payload = task["kwargs"]
+    consumer = ReferralConsumer(payload)
+
+    # We need to bypass the guard's check for current context!
+    api.get_request().set("lab_code", consumer.lab_code)
+
+    # Search the samples and shipments of all items at once
+    items = consumer.items
+    consumer.resolve(items)
+
+    outcomes = []
+    for item in items:
+        savepoint = transaction.savepoint()
+        try:
+            consumer.process_item(item)
+            outcomes.append(get_outcome(item))
+        except ConflictError:
+            raise
+        except Exception as e:
+            savepoint.rollback()
+            logger.error("Cannot process {}: {}".format(repr(item), e))
+            outcomes.append(get_outcome(item, error=e))
+
+    save_received(laboratory, payload, outcomes)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import functools
+import time
+
+from BTrees.Length import Length
+from BTrees.OOBTree import OOBTree
+from persistent.mapping import PersistentMapping
+from senaite.referral import logger
+from zope.annotation.interfaces import IAnnotations
+
+from bika.lims import api
+
+IDEMPOTENCY_STORAGE = "senaite.referral.idempotency"
+
+# Storage of the idempotency keys from all laboratories, no longer used
+LEGACY_IDEMPOTENCY_STORAGE = "senaite.referral.idempotency_keys"
+
+# Name of the payload parameter with the idempotency key
+IDEMPOTENCY_KEY = "idempotency_key"
+
+# Number of seconds the idempotency keys of processed notifications are kept
+IDEMPOTENCY_KEYS_TTL = 7 * 24 * 60 * 60
+
+# Maximum number of idempotency keys of processed notifications kept for
+# each laboratory
+MAX_IDEMPOTENCY_KEYS = 10000
+
+
+def get_storage(lab_code, portal=None):
+    """Returns the storage of the idempotency keys of the notifications from
+    the laboratory with the given code that have been processed already, so
+    notifications from different laboratories do not write the same objects.
+    It is a mapping with the following keys:
+    - keys: OOBTree of idempotency key -> (timestamp, result, status)
+    - by_time: OOBTree of (timestamp, idempotency key) -> None, for eviction
+    - length: number of keys stored
+    """
+    portal = portal or api.get_portal()
+    annotation = IAnnotations(portal)
+    labs = annotation.get(IDEMPOTENCY_STORAGE)
+    if labs is None:
+        labs = OOBTree()
+        annotation[IDEMPOTENCY_STORAGE] = labs
+    storage = labs.get(lab_code)
+    if storage is None:
+        storage = PersistentMapping()
+        storage["keys"] = OOBTree()
+        storage["by_time"] = OOBTree()
+        storage["length"] = Length()
+        labs[lab_code] = storage
+    return storage
+
+
+def get_lab_code(payload):
+    """Returns the code of the laboratory that sent the notification payload
+    passed-in, or an empty string
+    """
+    return payload.get("lab_code") or ""
+
+
+def get_idempotency_key(payload):
+    """Returns the idempotency key of the notification payload passed-in, or
+    None
+    """
+    return payload.get(IDEMPOTENCY_KEY) or None
+
+
+def get_response_status():
+    """Returns the status of the response to the current request, or None
+    """
+    response = getattr(api.get_request(), "response", None)
+    if response is None:
+        return None
+    return response.getStatus()
+
+
+def set_response_status(status):
+    """Sets the status of the response to the current request
+    """
+    response = getattr(api.get_request(), "response", None)
+    if response is None or not status:
+        return
+    response.setStatus(status)
+
+
+def get_processed(lab_code, key, now=None):
+    """Returns a tuple (timestamp, result, status) if a notification with the
+    given idempotency key has been processed already for the laboratory and is
+    not expired. Returns None otherwise
+    """
+    processed = get_storage(lab_code)["keys"].get(key)
+    if not processed:
+        return None
+    now = now or time.time()
+    if now - processed[0] > IDEMPOTENCY_KEYS_TTL:
+        return None
+    # Keys stored before the status of the response was kept have no status
+    status = processed[2] if len(processed) > 2 else None
+    return processed[0], processed[1], status
+
+
+def set_processed(lab_code, key, result, status=None, now=None):
+    """Stores the idempotency key of a processed notification from the
+    laboratory, together with the result of the processing and the status of
+    the response. Keys that expired or exceed the maximum number of keys are
+    removed, oldest first
+    """
+    now = now or time.time()
+    storage = get_storage(lab_code)
+    keys = storage["keys"]
+    by_time = storage["by_time"]
+    length = storage["length"]
+
+    existing = keys.get(key)
+    if existing:
+        by_time.pop((existing[0], key), None)
+        length.change(-1)
+
+    keys[key] = (now, result, status)
+    by_time[(now, key)] = None
+    length.change(1)
+
+    # Evict the oldest keys
+    while length() > 0:
+        oldest = by_time.minKey()
+        expired = now - oldest[0] > IDEMPOTENCY_KEYS_TTL
+        if not expired and length() <= MAX_IDEMPOTENCY_KEYS:
+            break
+        del by_time[oldest]
+        keys.pop(oldest[1], None)
+        length.change(-1)
+
+
+def idempotent(func):
+    """Decorator for the `process` function of push consumers. If the
+    notification has an idempotency key and has been processed already, the
+    response of the previous processing (result and status) is returned
+    straight-away. Otherwise, the key is stored together with the response,
+    within the same transaction
+    """
+    @functools.wraps(func)
+    def decorator(self, *args, **kwargs):
+        payload = getattr(self, "raw_data", None) or self.data
+        key = get_idempotency_key(payload)
+        if not key:
+            return func(self, *args, **kwargs)
+
+        lab_code = get_lab_code(payload)
+        processed = get_processed(lab_code, key)
+        if processed:
+            logger.info("Notification {}:{} processed already"
+                        .format(lab_code, key))
+            set_response_status(processed[2])
+            return processed[1]
+
+        result = func(self, *args, **kwargs)
+        set_processed(lab_code, key, result, status=get_response_status())
+        return result
+
+    return decorator
@@ -27,42 +27,54 @@ from senaite.jsonapi.interfaces import IPushConsumer
 from senaite.jsonapi.request import is_json_deserializable
 from senaite.referral import utils
 from senaite.referral.catalog import SHIPMENT_CATALOG
+from senaite.referral.core.catalog.deferred import deferred_indexing
+from senaite.referral.jsonapi.idempotency import idempotent
+from senaite.referral.jsonapi.payload import BaseConsumer
+from senaite.referral.jsonapi.schema import compile_schema
+from senaite.referral.jsonapi.schema import Field
+from senaite.referral.jsonapi.schema import validate
+from senaite.referral.tasks import add_task
+from senaite.referral.tasks import register_task
 from zope.annotation.interfaces import IAnnotations
 from zope.interface import implementer
 
 from bika.lims import api
 from bika.lims.api.security import revoke_permission_for
 
+# Name of the task for the import of the inbound samples of a shipment
+IMPORT_SAMPLES_TASK = "senaite.referral.import_inbound_samples"
+
+# Validator of the sample records of an inbound shipment
+SAMPLE_SCHEMA = compile_schema([
+    ("id", Field(required=True)),
+    ("date_sampled", Field(required=True)),
+    ("sample_type", Field(required=True)),
+])
+
+# Validator and sanitizer of the inbound shipment payload
+PAYLOAD_SCHEMA = compile_schema([
+    ("lab_code", Field(required=True)),
+    ("shipment_id", Field(required=True)),
+    ("dispatched", Field(required=True)),
+    ("samples", Field(required=True, records=SAMPLE_SCHEMA)),
+], sanitize=True)
+
 
 @implementer(IPushConsumer)
-class InboundShipmentConsumer(object):
+class InboundShipmentConsumer(BaseConsumer):
     """Handles push requests for name senaite.referral.inbound_shipment
     Receives samples dispatched by a referring laboratory and creates the
     inbound shipment in accordance
     """
 
-    def __init__(self, data):
-        self.data = data
-
+    @idempotent
     def process(self):
         """Processes the data sent via POST. Imports the inbound shipment by
         creating the necessary samples and analyses
         """
-        # Sanitize the data first
-        self.sanitize(self.data)
-
-        # Validate the data passed-in
-        required_fields = ["lab_code", "shipment_id", "dispatched", "samples"]
-        self.validate(self.data, required=required_fields)
-
-        # Ensure the samples passed-in are compliant
-        required_fields = ["id", "date_sampled", "sample_type"]
-        sample_records = self.data.get("samples")
-        if isinstance(sample_records, six.string_types):
-            if not is_json_deserializable(sample_records):
-                raise ValueError("Value for 'samples' is not a valid JSON")
-            sample_records = json.loads(sample_records)
-        self.validate(sample_records, required=required_fields)
+        # Sanitize and validate the data passed-in, samples included
+        validate(PAYLOAD_SCHEMA, self.data)
+        sample_records = self.get_sample_records()
 
         # XXX translate sample info (e.g. SampleType) to UIDs
 
@@ -82,8 +94,7 @@ class InboundShipmentConsumer(object):
             raise ValueError("Inbound shipment already exists: {}"
                              .format(shipment_id))
 
-        # Create the Inbound Shipment and the Inbound Samples
-        # TODO Performance - convert to queue task
+        # Create the Inbound Shipment
         comments = self.data.get("comments", "")
         values = {
             "shipment_id": str(shipment_id),
@@ -94,15 +105,30 @@ class InboundShipmentConsumer(object):
             "samples": sample_records,
         }
         shipment = api.create(lab, "InboundSampleShipment", **values)
-        for record in sample_records:
-            self.create_inbound_sample(shipment, record)
 
-        # Disallow the "Add portal content" permission so no more InboundSample
-        # objects can be added (and the "Add new..." menu item is not displayed)
-        revoke_permission_for(shipment, AddPortalContent, [])
+        # Create the Inbound Samples. Large shipments are imported in the
+        # background, so the referring laboratory does not have to wait
+        threshold = utils.get_inbound_shipment_async_threshold()
+        if threshold and len(sample_records) > threshold:
+            add_task(IMPORT_SAMPLES_TASK, shipment, records=sample_records)
+            api.get_request().response.setStatus(202)
+            return True
 
+        create_inbound_samples(shipment, sample_records)
         return True
 
+    def get_sample_records(self):
+        """Returns the sample records from the data passed-in
+        """
+        sample_records = self.data.get("samples")
+        if isinstance(sample_records, six.string_types):
+            if not is_json_deserializable(sample_records):
+                raise ValueError("Value for 'samples' is not a valid JSON")
+            sample_records = json.loads(sample_records)
+        if isinstance(sample_records, dict):
+            sample_records = [sample_records]
+        return sample_records
+
     def get_inbound_shipment(self, shipment_id, laboratory, full_object=False):
         """Returns the InboundSampleShipment for the shipment id and laboratory
         passed-in, if any. Returns None otherwise
@@ -121,41 +147,6 @@ class InboundShipmentConsumer(object):
             return api.get_object(brains[0])
         return brains[0]
 
-    def sanitize(self, dict_obj):
-        """Sanitize the dict obj to ensure that all strings are stripped
-        """
-        def get_value(dict_obj, key):
-            val = dict_obj.get(key, "")
-            if isinstance(val, six.string_types):
-                val = val.strip()
-            elif isinstance(val, (list, tuple)):
-                val = filter(None, val)
-            return val
-
-        keys = dict_obj.keys()
-        for key in keys:
-            value = get_value(dict_obj, key)
-            if isinstance(value, dict):
-                self.sanitize(value)
-            dict_obj.update({key: value})
-
-    def validate(self, record, required=None):
-        """Checks the sample record(s) passed in has a valid format and with all
-        the compulsory information available. Raises a ValueError exception if
-        not compliant
-        """
-        if not required:
-            return
-
-        if isinstance(record, (list, tuple)):
-            map(lambda rec: self.validate(rec, required=required), record)
-            return
-
-        for field in required:
-            val = record.get(field)
-            if not val:
-                raise ValueError("Field is missing or empty: {}".format(field))
-
     def get_external_laboratory(self, code):
         lab = utils.get_by_code("ExternalLaboratory", code)
         if not lab:
@@ -172,22 +163,48 @@ class InboundShipmentConsumer(object):
 
         return lab
 
-    def create_inbound_sample(self, shipment, record):
-        """Creates an inbound sample inside the shipment with the information
-        provided
-        """
-        date_sampled = api.to_date(record.get("date_sampled"))
-        values = {
-            "referring_id": record.get("id"),
-            "date_sampled": date_sampled,
-            "sample_type": record.get("sample_type"),
-            "priority": record.get("priority", ""),
-            "analyses": record.get("analyses"),
-        }
-        inbound_sample = api.create(shipment, "InboundSample", **values)
 
-        # Store original data in annotations
-        annotation = IAnnotations(inbound_sample)
-        annotation["__original__"] = json.dumps(record)
+def create_inbound_sample(shipment, record):
+    """Creates an inbound sample inside the shipment with the information
+    provided
+    """
+    date_sampled = api.to_date(record.get("date_sampled"))
+    values = {
+        "referring_id": record.get("id"),
+        "date_sampled": date_sampled,
+        "sample_type": record.get("sample_type"),
+        "priority": record.get("priority", ""),
+        "analyses": record.get("analyses"),
+    }
+    inbound_sample = api.create(shipment, "InboundSample", **values)
+
+    # Store original data in annotations
+    annotation = IAnnotations(inbound_sample)
+    annotation["__original__"] = json.dumps(record)
+
+    return inbound_sample
+
+
+def create_inbound_samples(shipment, records):
+    """Creates the inbound samples inside the shipment for the records
+    provided. The samples are indexed all together, once created
+    """
+    with deferred_indexing():
+        samples = map(lambda rec: create_inbound_sample(shipment, rec),
+                      records)
+
+        # Update the number of samples from catalog metadata
+        utils.reindex_metadata(shipment)
+
+    # Disallow the "Add portal content" permission so no more InboundSample
+    # objects can be added (and the "Add new..." menu item is not displayed)
+    revoke_permission_for(shipment, AddPortalContent, [])
+    return samples
 
-        return inbound_sample
+
+@register_task(IMPORT_SAMPLES_TASK)
+def import_inbound_samples(shipment, task):
+    """Processes the task for the import of the inbound samples of a shipment
+    """
+    records = task["kwargs"].get("records") or []
+    create_inbound_samples(shipment, records)
@@ -18,46 +18,86 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
-import copy
-import json
 from datetime import datetime
 
 from senaite.jsonapi.exceptions import APIError
 from senaite.jsonapi.interfaces import IPushConsumer
+from senaite.referral.jsonapi.idempotency import idempotent
+from senaite.referral.jsonapi.payload import BaseConsumer
+from senaite.referral.jsonapi.schema import BLANK
+from senaite.referral.jsonapi.schema import compile_schema
+from senaite.referral.jsonapi.schema import Field
 from senaite.referral.utils import get_create_reference_analyses
 from senaite.referral.utils import get_services_mapping
+from senaite.referral.workflow import set_workflow_state
 from zope.interface import alsoProvides
 from zope.interface import implementer
 
 from bika.lims import api
 from bika.lims.catalog import CATALOG_ANALYSIS_REQUEST_LISTING
 from bika.lims.interfaces import ISubmitted
-from bika.lims.utils import changeWorkflowState
+from bika.lims.interfaces import IVerified
 from bika.lims.utils.analysis import create_analysis
 from bika.lims.workflow import doActionFor
+from bika.lims.workflow import isTransitionAllowed
 from senaite.referral import logger
 
+# Indexes of the analyses that change when their results are set
+ANALYSIS_INDEXES = [
+    "allowedRolesAndUsers",
+    "getPointOfCapture",
+    "getResultCaptureDate",
+    "is_active",
+    "review_state",
+]
+
+# Validator of the analysis records of a sample
+ANALYSIS_SCHEMA = compile_schema([
+    ("keyword", Field(required=True, empty=BLANK)),
+    ("formatted_result", Field(required=True, empty=BLANK)),
+])
+
+# Validator of the sample records of the payload
+SAMPLE_SCHEMA = compile_schema([
+    ("referring_id", Field(required=True, empty=BLANK)),
+    ("analyses", Field(required=True, empty=BLANK, records=ANALYSIS_SCHEMA)),
+    ("shipment_id", Field(required=True, empty=BLANK)),
+])
+
 
 @implementer(IPushConsumer)
-class OutboundSampleConsumer(object):
+class OutboundSampleConsumer(BaseConsumer):
     """Handles push requests for name senaite.referral.outbound_sample
     Receives information from a sample that was dispatched to a reference
     laboratory and updates the analyses results in accordance
     """
 
-    def __init__(self, data):
-        self.data = data
-
+    @idempotent
     def process(self):
         """Processes the data sent via POST. Look for sample and updates their
         analyses in accordance with the received data
         """
         # Validate data first
-        data = self.get_data()
+        data = self.data
         self.validate(data)
 
+        # Update the samples, either a single one or a batch of them
+        for sample_record in self.get_sample_records(data):
+            self.process_sample(sample_record)
+
+        return True
+
+    def get_sample_records(self, payload):
+        """Returns the list of sample records from the payload passed-in
+        """
+        if "samples" in payload:
+            return payload.get("samples") or []
+        return [payload.get("sample")]
+
+    def process_sample(self, sample_record):
+        """Updates the analyses of the sample for the record passed-in
+        """
         # Find the sample with the given referring id
-        sample_record = data.get("sample")
         sample_id = sample_record.get("referring_id")
         sample = self.get_sample(sample_id)
 
@@ -82,7 +122,7 @@ class OutboundSampleConsumer(object):
             # updated earlier, but the reference lab got a timeout error and
             # the remote user is now retrying the notification
             # TODO Keep track of the incoming notifications in current object
-            return True
+            return
 
         # TODO Performance - convert to queue task
 
@@ -96,7 +136,8 @@ class OutboundSampleConsumer(object):
         create_missing = get_create_reference_analyses()
         services = get_services_mapping() if create_missing else {}
 
-        # Update the analyses passed-in
+        # Collect the analyses to update with their records
+        updates = []
         analysis_records = sample_record.get("analyses")
         for analysis_record in analysis_records:
             keyword = analysis_record.get("keyword")
@@ -115,15 +156,67 @@ class OutboundSampleConsumer(object):
                 status = api.get_review_status(analysis)
                 if not statuses.get(status, False):
                     continue
+                updates.append((analysis, analysis_record))
 
-                # update the analysis
-                try:
-                    self.update_analysis(analysis, analysis_record)
-                except Exception as e:
-                    raise APIError(500, "{}: {}".format(
-                        type(e).__name__, str(e)))
-
-        return True
+        # Update the analyses all together
+        try:
+            self.apply_results(sample, updates)
+        except Exception as e:
+            raise APIError(500, "{}: {}".format(type(e).__name__, str(e)))
+
+    def apply_results(self, sample, updates):
+        """Sets the results to the analyses, submits and verifies them in a
+        single pass and reindexes each one only once. The transitions are not
+        promoted to the dependencies, worksheets and sample until all
+        analyses are processed, so they are only promoted once
+        :param updates: list of (analysis, analysis record) tuples
+        """
+        analyses = {}
+        dependencies = {}
+        worksheets = {}
+        wf_id = "bika_analysis_workflow"
+        for analysis, record in updates:
+            self.set_result(analysis, record)
+
+            # Do a manual transition to overcome core's default guards. For
+            # instance system won't allow the submission of an analysis if
+            # the setting "Allow to submit analysis if not assigned" from
+            # setup is set to False. Obviously, this analysis is not assigned
+            # to a Worksheet, cause is processed externally.
+            # TODO 2.x Do not do manual transition
+            alsoProvides(analysis, ISubmitted)
+            set_workflow_state(analysis, wf_id, "to_be_verified",
+                               action="submit")
+
+            # Auto-verify the analysis, if the verify guard allows it
+            analysis.setSelfVerification(1)
+            analysis.setNumberOfRequiredVerifications(1)
+            if isTransitionAllowed(analysis, "verify"):
+                set_workflow_state(analysis, wf_id, "verified",
+                                   action="verify")
+                alsoProvides(analysis, IVerified)
+
+            # Reindex the analysis, only once
+            analysis.reindexObject(idxs=ANALYSIS_INDEXES)
+
+            analyses[api.get_uid(analysis)] = analysis
+            for dependency in analysis.getDependencies():
+                dependencies[api.get_uid(dependency)] = dependency
+            worksheet = analysis.getWorksheet()
+            if worksheet:
+                worksheets[api.get_uid(worksheet)] = worksheet
+
+        # Promote the transitions to the dependencies, worksheets and sample
+        dependencies = [dependency for uid, dependency in dependencies.items()
+                        if uid not in analyses]
+        for obj in dependencies + worksheets.values():
+            doActionFor(obj, "submit")
+            doActionFor(obj, "verify")
+
+        submitted, message = doActionFor(sample, "submit")
+        verified, message = doActionFor(sample, "verify")
+        if updates and not any([submitted, verified]):
+            sample.reindexObject()
 
     def get_analyses_by_keyword(self, sample):
         """Returns the analyses of the sample grouped by keyword
@@ -135,52 +228,22 @@ class OutboundSampleConsumer(object):
             groups.setdefault(keyword, []).append(analysis)
         return groups
 
-    def get_data(self):
-        out = {}
-        for key in self.data.keys():
-            out[key] = self.get_record(self.data, key)
-        return out
-
-    def get_record(self, payload, id):
-        record = payload.get(id)
-        if isinstance(record, (list, tuple, list, dict)):
-            return copy.deepcopy(record)
-        try:
-            return json.loads(record)
-        except:
-            return record
-
     def validate(self, payload):
         """Validates that the payload passed-in is meets the expected format
         """
-        field_names = ["referring_id", "analyses", "shipment_id"]
-        sample_record = payload.get("sample")
-        self.validate_nonempty(field_names, sample_record)
-
-        field_names = ["keyword", "formatted_result"]
-        analysis_records = sample_record.get("analyses")
-        self.validate_nonempty(field_names, analysis_records)
-
-    def validate_nonempty(self, field_name, record):
-        """Validates if the value for the attr_name from the record passed-in
-        is empty or missing
-        """
-        if isinstance(field_name, (list, tuple)):
-            for fn in field_name:
-                self.validate_nonempty(fn, record)
-            return
-
-        if isinstance(record, (list, tuple)):
-            for rec in record:
-                self.validate_nonempty(field_name, rec)
-            return
-
-        if field_name not in record:
-            raise ValueError("Field is missing: '{}'".format(field_name))
-
-        value = record.get(field_name)
-        if not str(value):
-            raise ValueError("Field is empty: '{}'".format(field_name))
+        sample_records = self.get_sample_records(payload)
+        if not sample_records:
+            raise ValueError("No samples found")
+
+        errors = []
+        for num, sample_record in enumerate(sample_records):
+            path = "samples[{}].".format(num)
+            if not isinstance(sample_record, dict):
+                errors.append("Not a record: '{}'".format(path[:-1]))
+                continue
+            errors.extend(SAMPLE_SCHEMA(sample_record, path=path))
+        if errors:
+            raise ValueError("; ".join(errors))
 
     def get_sample(self, sample_id):
         """Returns the sample for the given ID, if any
@@ -195,10 +258,10 @@ class OutboundSampleConsumer(object):
         # Get the sample object
         return api.get_object(brains[0])
 
-    def update_analysis(self, analysis, record):
-        if not analysis:
-            return
-
+    def set_result(self, analysis, record):
+        """Sets the result and the rest of values from the record passed-in
+        to the analysis, without reindexing
+        """
         # Set the formatted result, cause we do not know if the configuration
         # of the analysis in the reference lab is the same
         result = record.get("formatted_result")
@@ -238,25 +301,6 @@ class OutboundSampleConsumer(object):
         verifiers = record.get("verifiers")
         analysis.setReferenceVerifiers(verifiers)
 
-        # Do a manual transition to overcome core's default guards. For
-        # instance system won't allow the submission of an analysis if the
-        # setting "Allow to submit analysis if not assigned" from setup is set
-        # to False. Obviously, this analysis is not assigned to a Worksheet,
-        # cause is processed externally.
-        # TODO 2.x Do not do manual transition, fix getAllowToSubmitNotAssigned
-        alsoProvides(analysis, ISubmitted)
-        wf_id = "bika_analysis_workflow"
-        wf_state = {"action": "submit"}
-        changeWorkflowState(analysis, wf_id, "to_be_verified", **wf_state)
-
-        # Auto-verify the analysis
-        analysis.setSelfVerification(1)
-        analysis.setNumberOfRequiredVerifications(1)
-        doActionFor(analysis, "verify")
-
-        # Reindex the analysis
-        analysis.reindexObject()
-
     def is_invalidated(self, sample):
         """Returns whether the sample was invalidated in present laboratory
         or at reference laboratory
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import json
+
+import six
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+_marker = object()
+
+
+def decode(value):
+    """Returns the JSON list or dict the value passed-in represents, if any.
+    Returns the value as-is otherwise
+    """
+    if not isinstance(value, six.string_types):
+        return value
+    if not value.lstrip()[:1] in ("[", "{"):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class LazyPayload(MutableMapping):
+    """Mapping-like view of the payload of a push request. The value of each
+    top-level key is decoded from JSON at most once, when accessed. Values are
+    not copied, so consumers must not modify them in place unless they own the
+    payload. Values set are kept in this view, the raw payload is left intact
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._decoded = {}
+        self._deleted = set()
+
+    def __getitem__(self, key):
+        if key in self._deleted:
+            raise KeyError(key)
+        if key not in self._decoded:
+            self._decoded[key] = decode(self.raw[key])
+        return self._decoded[key]
+
+    def __setitem__(self, key, value):
+        self._deleted.discard(key)
+        self._decoded[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._decoded.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._deleted:
+            return False
+        return key in self._decoded or key in self.raw
+
+    def __iter__(self):
+        for key in self.raw.keys():
+            if key not in self._deleted:
+                yield key
+        for key in self._decoded.keys():
+            if key not in self.raw and key not in self._deleted:
+                yield key
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def keys(self):
+        return list(iter(self))
+
+
+class BaseConsumer(object):
+    """Base class for push consumers. The payload is accessible through `data`
+    as a LazyPayload and as-is through `raw_data`
+    """
+
+    _data = None
+
+    def __init__(self, data):
+        self.raw_data = data
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = LazyPayload(self.raw_data)
+        return self._data
+
+    def get_value(self, item, field_name, default=_marker):
+        if field_name not in item:
+            if default is _marker:
+                raise ValueError("Field is missing: '{}'".format(field_name))
+            return default
+
+        value = item.get(field_name)
+        if not value:
+            if default is _marker:
+                raise ValueError("Field is empty: '{}'".format(field_name))
+            return default
+        return value
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import six
+
+# Values considered empty for required fields
+FALSY = "falsy"  # any value that evaluates to False
+BLANK = "blank"  # empty strings only
+
+
+class Field(object):
+    """Declaration of a field of a payload record
+    :param required: whether the field must be present and non-empty
+    :param empty: the values considered as empty, either FALSY or BLANK
+    :param records: validator of the records the value of the field is a list
+        of, as returned by `compile_schema`
+    """
+
+    def __init__(self, required=False, empty=FALSY, records=None):
+        self.required = required
+        self.empty = empty
+        self.records = records
+
+
+def is_empty(value, empty=FALSY):
+    """Returns whether the value is empty in accordance with the criteria
+    """
+    if empty == BLANK:
+        return isinstance(value, six.string_types) and not value
+    return not value
+
+
+def sanitize_value(value):
+    """Returns the value with strings stripped and empties removed from lists.
+    Dicts are sanitized in place
+    """
+    if isinstance(value, six.string_types):
+        return value.strip()
+    elif isinstance(value, (list, tuple)):
+        return filter(None, value)
+    elif isinstance(value, dict):
+        sanitize_record(value)
+    return value
+
+
+def sanitize_record(record):
+    """Strips the strings and removes empties from the lists of the record
+    passed-in, in place
+    """
+    for key in list(record.keys()):
+        record[key] = sanitize_value(record.get(key, ""))
+
+
+def compile_schema(fields, sanitize=False):
+    """Returns a function that validates a record against the fields passed-in
+    in a single pass. The function returns the list of errors found, with the
+    path of the offending field. If sanitize is True, the record is sanitized
+    in place while validated
+    :param fields: list of (field name, Field) tuples
+    """
+    fields = tuple(fields)
+    required = tuple(filter(lambda field: field[1].required, fields))
+    nested = tuple(filter(lambda field: field[1].records, fields))
+
+    def validate(record, path=""):
+        if sanitize:
+            sanitize_record(record)
+
+        errors = []
+        for name, field in required:
+            if name not in record:
+                errors.append("Field is missing: '{}{}'".format(path, name))
+            elif is_empty(record.get(name), field.empty):
+                errors.append("Field is empty: '{}{}'".format(path, name))
+
+        for name, field in nested:
+            value = record.get(name)
+            if not value:
+                continue
+            if isinstance(value, dict):
+                value = [value]
+            elif not isinstance(value, (list, tuple)):
+                errors.append("Not a list of records: '{}{}'".format(path,
+                                                                      name))
+                continue
+            for num, item in enumerate(value):
+                item_path = "{}{}[{}].".format(path, name, num)
+                if not isinstance(item, dict):
+                    errors.append("Not a record: '{}'".format(item_path[:-1]))
+                    continue
+                errors.extend(field.records(item, path=item_path))
+
+        return errors
+
+    return validate
+
+
+def validate(validator, record):
+    """Validates the record with the validator passed-in. Raises a ValueError
+    with all the errors found, if any
+    """
+    errors = validator(record)
+    if errors:
+        raise ValueError("; ".join(errors))
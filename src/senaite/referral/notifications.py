@@ -18,46 +18,176 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import copy
 import json
 from datetime import datetime
-from persistent.list import PersistentList
+
+from persistent import Persistent
 from requests import Response
 from senaite.referral.utils import is_true
 from zope.annotation.interfaces import IAnnotations
 
+from bika.lims import api
+from bika.lims.interfaces import IAnalysisRequest
+
+# Legacy storage, a PersistentList with the JSON of all posts. Migrated to the
+# posts history when a new post is saved for the object
 POSTS_STORAGE = "senaite.referral.http_posts"
 
+# Storage of the most recent posts, as a PostsHistory object
+POSTS_HISTORY_STORAGE = "senaite.referral.posts_history"
+
+# Storage of the summary of the last post, as a dict
+LAST_POST_STORAGE = "senaite.referral.last_post"
+
+# Storage of the notification waiting in the outbox to be sent, as a dict
+PENDING_POST_STORAGE = "senaite.referral.pending_post"
+
+# Storage of the outcomes of the notifications received from a laboratory
+# and processed in the background, as a PostsHistory object
+RECEIVED_HISTORY_STORAGE = "senaite.referral.received_history"
+
+# Catalog indexes with the status of the notifications
+NOTIFICATION_INDEXES = [
+    "notification_date",
+    "notification_lab",
+    "notification_status",
+]
+
+# Statuses of the last notification sent for an object
+STATUS_SUCCESS = "success"
+STATUS_ERROR = "error"
+STATUS_DEFERRED = "deferred"
+STATUS_PENDING = "pending"
+
+# Maximum number of posts kept in the history of an object
+MAX_POSTS = 10
+
+# Maximum number of characters of the response content kept in the history
+MAX_CONTENT_LENGTH = 1000
+
+# Keys of a post that are kept in the summary of the last post
+SUMMARY_KEYS = ["url", "status", "reason", "message", "success", "datetime",
+                "deferred", "remote_lab"]
+
+
+class PostPayload(Persistent):
+    """Payload of a post, stored in a record of its own so it is only loaded
+    from the database when needed
+    """
+
+    def __init__(self, payload):
+        self.data = json.dumps(payload)
+
+    def get(self):
+        return json.loads(self.data)
+
+
+class PostsHistory(Persistent):
+    """Fixed-size history of the most recent posts sent for an object
+    """
+
+    def __init__(self, size=MAX_POSTS):
+        self.size = size
+        self.posts = []
 
-def get_posts_storage(obj):
-    """Returns the storage with the list of notifications (POST requests) sent
-    to a target laboratory for the given object
+    def append(self, post):
+        """Adds the post to the history, discarding the oldest posts if the
+        maximum size is exceeded
+        """
+        self.posts = (self.posts + [post])[-self.size:]
+
+    def drop_payloads(self):
+        """Removes the payloads of all posts from the history
+        """
+        self.posts = [dict(post, payload=None) for post in self.posts]
+
+    def __len__(self):
+        return len(self.posts)
+
+    def __iter__(self):
+        return iter(self.posts)
+
+
+def get_posts_history(obj, create=False):
+    """Returns the history of the most recent notifications (POST requests)
+    sent to a target laboratory for the given object
     :param obj: Content object
-    :returns: PersistentList
+    :param create: whether the history has to be created if does not exist
+    :returns: PostsHistory or None
     """
     annotation = IAnnotations(obj)
-    if annotation.get(POSTS_STORAGE) is None:
-        annotation[POSTS_STORAGE] = PersistentList()
-    return annotation[POSTS_STORAGE]
+    history = annotation.get(POSTS_HISTORY_STORAGE)
+    if history is None and create:
+        history = PostsHistory()
+        # Migrate the posts from the legacy storage
+        legacy_posts = annotation.pop(POSTS_STORAGE, None) or []
+        for post in map(json.loads, legacy_posts[-MAX_POSTS:]):
+            history.append(to_history_record(post, post.get("payload")))
+        annotation[POSTS_HISTORY_STORAGE] = history
+    return history
+
+
+def to_history_record(post, payload):
+    """Returns the post passed-in, with the response content truncated and
+    the payload as a PostPayload, suitable for the history of posts
+    """
+    record = dict(post)
+    record.pop("content_json", None)
+    content = record.get("content") or ""
+    record["content"] = content[:MAX_CONTENT_LENGTH]
+    record["payload"] = PostPayload(payload) if payload else None
+    return record
+
+
+def from_history_record(record):
+    """Returns the record of the history passed-in as a post dict
+    """
+    post = copy.deepcopy(dict(record, payload=None))
+    payload = record.get("payload")
+    post["payload"] = payload.get() if payload else None
+    return post
 
 
 def get_posts(obj):
-    """Returns all the posts sent to a target laboratory for the given object,
-    sorted from oldest to newest
+    """Returns the most recent posts sent to a target laboratory for the given
+    object, sorted from oldest to newest
     :param obj: object the POST is about
     :returns: list of dicts
     """
-    posts = get_posts_storage(obj)
-    return map(json.loads, posts)
+    history = get_posts_history(obj)
+    if history is None:
+        # Not migrated yet
+        posts = IAnnotations(obj).get(POSTS_STORAGE) or []
+        return map(json.loads, posts[-MAX_POSTS:])
+    return map(from_history_record, history)
 
 
-def get_last_post(obj):
-    """Returns the last post sent to a remote laboratory about the given object
-    or None otherwise
+def get_last_post(obj, payload=False):
+    """Returns the summary of the last post sent to a remote laboratory about
+    the given object or None otherwise. Neither the history of posts nor the
+    payload are loaded from the database, unless payload is True
+    :param obj: object the POST is about
+    :param payload: whether to include the payload of the post
+    :returns: dict
     """
-    posts = get_posts(obj)
-    if posts:
-        return posts[-1]
-    return None
+    annotation = IAnnotations(obj)
+    summary = annotation.get(LAST_POST_STORAGE)
+    if summary is None:
+        # Not migrated yet, only the last post is decoded
+        posts = annotation.get(POSTS_STORAGE)
+        if not posts:
+            return None
+        post = json.loads(posts[-1])
+        if not payload:
+            post.pop("payload", None)
+        return post
+
+    post = dict(summary)
+    payload_obj = post.pop("payload", None)
+    if payload:
+        post["payload"] = payload_obj.get() if payload_obj else None
+    return post
 
 
 def is_error(post):
@@ -128,7 +258,8 @@ def get_post_info(response):
 
 def save_post(obj, payload, data_or_response):
     """Stores the notification (POST request) sent to a target laboratory for
-    the given obj with the specified payload and remote response
+    the given obj with the specified payload and remote response. The payload
+    is only kept while the notification is not successful
     """
     data = data_or_response
     if isinstance(data_or_response, Response):
@@ -137,13 +268,157 @@ def save_post(obj, payload, data_or_response):
     if not isinstance(data, dict):
         raise ValueError("Type not supported: {}".format(repr(data)))
 
+    # Payloads are no longer needed once the remote laboratory succeeds
+    success = not is_error(data)
+    history = get_posts_history(obj, create=True)
+    if success:
+        history.drop_payloads()
+
+    # Add the post to the history
+    record = to_history_record(data, None if success else payload)
+    history.append(record)
+
+    # Store the summary of the last post
+    summary = dict([(key, record.get(key)) for key in SUMMARY_KEYS])
+    summary["payload"] = record["payload"]
+    if isinstance(payload, dict):
+        summary["remote_lab"] = payload.get("remote_lab")
+    annotation = IAnnotations(obj)
+    annotation[LAST_POST_STORAGE] = summary
+
+    # The notification is no longer pending
+    if annotation.get(PENDING_POST_STORAGE):
+        del annotation[PENDING_POST_STORAGE]
+
+    reindex_notification_status(obj)
+
+
+def set_pending_post(obj, laboratory):
+    """Flags the object as having a notification to the given laboratory that
+    is waiting to be sent
+    """
+    annotation = IAnnotations(obj)
+    annotation[PENDING_POST_STORAGE] = {
+        "remote_lab": api.get_uid(laboratory),
+        "datetime": datetime.now().isoformat(),
+    }
+    reindex_notification_status(obj)
+
+
+def get_pending_post(obj):
+    """Returns a dict with the information of the notification about the
+    given object that is waiting to be sent, if any. Returns None otherwise
+    """
+    pending = IAnnotations(obj).get(PENDING_POST_STORAGE)
+    return dict(pending) if pending else None
+
+
+def get_notification_status(obj):
+    """Returns the status of the last notification about the given object:
+    'pending', 'deferred', 'error' or 'success'. Returns None if no
+    notifications were sent for the object
+    """
+    if get_pending_post(obj):
+        return STATUS_PENDING
+    post = get_last_post(obj)
+    if not post:
+        return None
+    if post.get("deferred"):
+        return STATUS_DEFERRED
+    if is_error(post):
+        return STATUS_ERROR
+    return STATUS_SUCCESS
+
+
+def get_last_notification(obj):
+    """Returns a dict with the success, status and message of the last post
+    sent about the given object, suitable to be stored as catalog metadata.
+    Returns None if no notifications were sent for the object
+    """
+    post = get_last_post(obj)
+    if not post:
+        return None
+    return {
+        "success": not is_error(post),
+        "status": post.get("status"),
+        "message": post.get("message"),
+    }
+
+
+def get_notification_info(obj):
+    """Returns the pending notification or the summary of the last post sent
+    for the object passed-in, if any. Returns None otherwise
+    """
+    return get_pending_post(obj) or get_last_post(obj)
+
+
+def get_notification_date(obj):
+    """Returns the date time of the pending notification or of the last post
+    sent for the object passed-in, if any. Returns None otherwise
+    """
+    info = get_notification_info(obj) or {}
+    return api.to_date(info.get("datetime"), default=None)
+
+
+def get_notification_lab(obj):
+    """Returns the UID of the laboratory the pending notification or the last
+    post for the object passed-in is addressed to, if any
+    """
+    info = get_notification_info(obj) or {}
+    return info.get("remote_lab")
+
+
+def reindex_notification_status(obj):
+    """Reindexes the notification indexes of the object passed-in. The
+    notifications about samples are indexed in their inbound sample
+    """
+    if IAnalysisRequest.providedBy(obj):
+        getter = getattr(obj, "getInboundSample", None)
+        obj = getter() if getter else None
+    if not obj:
+        return
+    obj.reindexObject(idxs=NOTIFICATION_INDEXES)
+
+
+def save_received(laboratory, payload, outcomes):
+    """Stores the outcomes of the items from a notification received from the
+    given laboratory that was processed in the background. The payload is
+    only kept if the processing of some of the items failed
+    :param outcomes: list of dicts with the outcome of each item, with the
+        keys 'item', 'action', 'success' and 'message' at least
+    """
+    failed = filter(lambda outcome: not outcome.get("success"), outcomes)
+    data = get_post_base_info()
     data.update({
-        "payload": payload,
+        "status": 500 if failed else 200,
+        "content": json.dumps(outcomes),
+        "message": "{} items processed, {} failed".format(len(outcomes),
+                                                           len(failed)),
+        "success": not failed,
     })
 
-    # json-ify
-    data = json.dumps(data)
+    annotation = IAnnotations(laboratory)
+    history = annotation.get(RECEIVED_HISTORY_STORAGE)
+    if history is None:
+        history = PostsHistory()
+        annotation[RECEIVED_HISTORY_STORAGE] = history
 
-    # Get the storage and append this post
-    storage = get_posts_storage(obj)
-    storage.append(data)
+    # Keep the whole outcome of each item, regardless of its length
+    record = to_history_record(data, payload if failed else None)
+    record["content"] = data["content"]
+    history.append(record)
+
+
+def get_received(laboratory):
+    """Returns the outcomes of the most recent notifications received from
+    the given laboratory and processed in the background, sorted from oldest
+    to newest
+    :returns: list of dicts
+    """
+    history = IAnnotations(laboratory).get(RECEIVED_HISTORY_STORAGE)
+    if history is None:
+        return []
+    received = map(from_history_record, history)
+    for record in received:
+        record["outcomes"] = json.loads(record.get("content") or "[]")
+    return received
@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import random
+import time
+from uuid import uuid4
+
+import transaction
+from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
+from senaite.referral import circuitbreaker
+from senaite.referral import logger
+from senaite.referral.concurrency import run_concurrently
+from senaite.referral.notifications import get_post_base_info
+from senaite.referral.notifications import get_post_info
+from senaite.referral.notifications import is_error
+from senaite.referral.notifications import save_post
+from senaite.referral.notifications import set_pending_post
+from senaite.referral.utils import get_notification_concurrency
+from senaite.referral.utils import get_notification_max_attempts
+from senaite.referral.utils import get_notification_max_retry_delay
+from senaite.referral.utils import get_notification_retry_delay
+from senaite.referral.utils import to_uids
+from senaite.referral.worker import register_job
+from senaite.referral.worker import wake_worker_after_commit
+from zope.annotation.interfaces import IAnnotations
+from ZODB.POSException import ConflictError
+
+from bika.lims import api
+
+OUTBOX_STORAGE = "senaite.referral.outbox"
+
+# Keys of the outbox entries, by UID of the remote laboratory
+OUTBOX_LABS_STORAGE = "senaite.referral.outbox_labs"
+
+# Tuples of (next attempt, key) of the outbox entries that did not fail
+OUTBOX_SCHEDULE_STORAGE = "senaite.referral.outbox_schedule"
+
+# Maximum number of entries claimed and sent at once by a dispatcher
+DISPATCH_BATCH_SIZE = 50
+
+# Minimum number of seconds an entry is kept claimed by a dispatcher before
+# another dispatcher is allowed to pick it up again
+CLAIM_TIMEOUT = 60
+
+
+def get_outbox(portal=None):
+    """Returns the persistent storage of notifications that are waiting to be
+    sent to remote laboratories, sorted from oldest to newest
+    :returns: OOBTree
+    """
+    portal = portal or api.get_portal()
+    annotation = IAnnotations(portal)
+    if annotation.get(OUTBOX_STORAGE) is None:
+        annotation[OUTBOX_STORAGE] = OOBTree()
+    return annotation[OUTBOX_STORAGE]
+
+
+def get_labs_index(portal=None):
+    """Returns the persistent storage of the keys of the outbox entries, by
+    UID of the laboratory they are sent to
+    :returns: OOBTree of laboratory UID -> OOTreeSet of keys
+    """
+    portal = portal or api.get_portal()
+    build_indexes(portal)
+    return IAnnotations(portal)[OUTBOX_LABS_STORAGE]
+
+
+def get_schedule(portal=None):
+    """Returns the persistent storage of the outbox entries that are waiting
+    to be sent, sorted by the time of their next attempt
+    :returns: OOTreeSet of (next attempt, key) tuples
+    """
+    portal = portal or api.get_portal()
+    build_indexes(portal)
+    return IAnnotations(portal)[OUTBOX_SCHEDULE_STORAGE]
+
+
+def build_indexes(portal):
+    """Builds the indexes of the outbox from its entries, if they do not exist
+    """
+    annotation = IAnnotations(portal)
+    storages = [OUTBOX_LABS_STORAGE, OUTBOX_SCHEDULE_STORAGE]
+    if all(map(lambda name: annotation.get(name) is not None, storages)):
+        return
+    labs = OOBTree()
+    schedule = OOTreeSet()
+    for key, entry in get_outbox(portal).items():
+        index_lab(labs, entry.get("remote_lab"), key)
+        if not entry.get("failed"):
+            schedule.insert(get_schedule_key(entry))
+    annotation[OUTBOX_LABS_STORAGE] = labs
+    annotation[OUTBOX_SCHEDULE_STORAGE] = schedule
+
+
+def index_lab(index, lab_uid, key):
+    """Adds the key of an outbox entry to the index, for the laboratory with
+    the UID
+    """
+    keys = index.get(lab_uid)
+    if keys is None:
+        keys = OOTreeSet()
+        index[lab_uid] = keys
+    keys.insert(key)
+
+
+def get_schedule_key(entry):
+    """Returns the key of the outbox entry in the schedule
+    """
+    return entry.get("next_attempt") or 0, entry["key"]
+
+
+def set_entry(entry, portal=None):
+    """Stores the outbox entry passed-in and updates the indexes
+    """
+    portal = portal or api.get_portal()
+    key = entry["key"]
+    outbox = get_outbox(portal)
+    previous = outbox.get(key)
+    outbox[key] = entry
+
+    if not previous:
+        index_lab(get_labs_index(portal), entry.get("remote_lab"), key)
+
+    # Only update the schedule if the next attempt changed
+    before = None
+    if previous and not previous.get("failed"):
+        before = get_schedule_key(previous)
+    after = None if entry.get("failed") else get_schedule_key(entry)
+    if before == after:
+        return
+    schedule = get_schedule(portal)
+    if before is not None and before in schedule:
+        schedule.remove(before)
+    if after is not None:
+        schedule.insert(after)
+
+
+def remove_entry(key, portal=None):
+    """Removes the outbox entry with the given key and updates the indexes
+    """
+    portal = portal or api.get_portal()
+    entry = get_outbox(portal).pop(key, None)
+    if not entry:
+        return
+
+    schedule = get_schedule(portal)
+    schedule_key = get_schedule_key(entry)
+    if schedule_key in schedule:
+        schedule.remove(schedule_key)
+
+    labs = get_labs_index(portal)
+    lab_uid = entry.get("remote_lab")
+    keys = labs.get(lab_uid)
+    if keys is None:
+        return
+    if key in keys:
+        keys.remove(key)
+    if not len(keys):
+        del labs[lab_uid]
+
+
+def enqueue(objects, laboratory, payload, timeout=5):
+    """Adds a notification for the given object/s to the outbox. The entry is
+    only persisted if the current transaction is committed. The background
+    worker is woken up after the commit to send the notification
+    :param objects: object or list of objects the notification is about
+    :param laboratory: the ExternalLaboratory to send the notification to
+    :param payload: dict with the data to POST
+    :param timeout: timeout in seconds of the POST request
+    :returns: the key of the outbox entry
+    """
+    portal = api.get_portal()
+    key = "{:017.6f}-{}".format(time.time(), uuid4().hex)
+    set_entry({
+        "key": key,
+        "uids": to_uids(objects),
+        "remote_lab": api.get_uid(laboratory),
+        "payload": payload,
+        "timeout": timeout,
+        "created": time.time(),
+        "claimed": 0,
+        "attempts": 0,
+        "next_attempt": 0,
+        "failed": False,
+    }, portal=portal)
+    for obj in objects if isinstance(objects, (list, tuple)) else [objects]:
+        set_pending_post(obj, laboratory)
+    wake_worker_after_commit(api.get_path(portal))
+    return key
+
+
+def is_claimed(entry, now=None):
+    """Returns whether the outbox entry is being sent by a dispatcher
+    """
+    claimed = entry.get("claimed") or 0
+    if not claimed:
+        return False
+    now = now or time.time()
+    expires = max(entry.get("timeout", 5) * 4, CLAIM_TIMEOUT)
+    return now - claimed < expires
+
+
+def commit():
+    """Commits the current transaction. Returns False if the transaction
+    could not be committed because of a conflict
+    """
+    try:
+        transaction.commit()
+        return True
+    except ConflictError:
+        transaction.abort()
+        return False
+
+
+def is_due(entry, now=None):
+    """Returns whether the outbox entry is waiting to be sent and its time
+    for the next attempt has come
+    """
+    if entry.get("failed"):
+        return False
+    now = now or time.time()
+    return entry.get("next_attempt", 0) <= now
+
+
+def get_retry_delay(attempts):
+    """Returns the number of seconds to wait before the next attempt of a
+    notification that failed the given number of times. The delay grows
+    exponentially and is randomized, so notifications for a same laboratory
+    that failed at once are not sent again all together
+    """
+    base = get_notification_retry_delay()
+    max_delay = get_notification_max_retry_delay()
+    delay = min(base * 2 ** max(attempts - 1, 0), max_delay)
+    # equal jitter: between half and the whole delay
+    return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+
+def get_entries(laboratory=None, failed=None, portal=None):
+    """Returns the entries from the outbox, sorted from oldest to newest
+    :param laboratory: if set, only entries for this laboratory are returned
+    :param failed: if set, only entries with this failed status are returned
+    """
+    outbox = get_outbox(portal)
+    if laboratory:
+        keys = get_labs_index(portal).get(api.get_uid(laboratory)) or []
+        entries = filter(None, [outbox.get(key) for key in keys])
+    else:
+        entries = outbox.values()
+    if failed is not None:
+        entries = filter(lambda e: bool(e.get("failed")) == failed, entries)
+    return list(entries)
+
+
+def retry(laboratory, portal=None):
+    """Resets the attempts of the notifications for the given laboratory that
+    are waiting to be sent or that failed permanently, so they are sent again
+    by the background worker as soon as the transaction is committed
+    :returns: the number of notifications to be sent again
+    """
+    portal = portal or api.get_portal()
+    entries = get_entries(laboratory, portal=portal)
+    for entry in entries:
+        entry = dict(entry, attempts=0, next_attempt=0, failed=False)
+        set_entry(entry, portal=portal)
+    if entries:
+        wake_worker_after_commit(api.get_path(portal))
+    return len(entries)
+
+
+def claim(portal, exclude=None, per_lab=1, limit=DISPATCH_BATCH_SIZE):
+    """Claims up to `limit` entries from the outbox that are due, in a
+    transaction of its own, so other dispatchers (e.g. from other ZEO clients)
+    do not send them too. Returns the claimed entries
+    :param exclude: UIDs of the laboratories whose entries must be skipped
+    :param per_lab: maximum number of entries to claim for each laboratory
+    """
+    exclude = exclude or set()
+    now = time.time()
+    outbox = get_outbox(portal)
+    entries = []
+    counts = {}
+    for next_attempt, key in get_schedule(portal):
+        if len(entries) >= limit or next_attempt > now:
+            # entries are sorted by the time of their next attempt
+            break
+
+        entry = outbox.get(key)
+        if not entry or is_claimed(entry, now) or not is_due(entry, now):
+            continue
+
+        # Skip laboratories that failed or are known to be unavailable
+        lab_uid = entry.get("remote_lab")
+        state = circuitbreaker.get_state(lab_uid, now)
+        if lab_uid in exclude or state == circuitbreaker.OPEN:
+            continue
+
+        # Do not claim more entries than the ones that can be sent at once.
+        # A single trial is allowed while the circuit is half-open
+        max_entries = per_lab if state == circuitbreaker.CLOSED else 1
+        if counts.get(lab_uid, 0) >= max_entries:
+            continue
+        counts[lab_uid] = counts.get(lab_uid, 0) + 1
+        entries.append(dict(entry, claimed=now))
+
+    # Store the claimed entries once the schedule is no longer iterated
+    for entry in entries:
+        set_entry(entry, portal=portal)
+
+    if entries and not commit():
+        return []
+    return entries
+
+
+@register_job
+def dispatch(portal):
+    """Sends the notifications from the outbox. Entries are claimed in
+    batches and sent concurrently, in parallel for different laboratories
+    and with a limited number of requests at once for a same laboratory.
+    Entries that fail are kept in the outbox and sent again later, with an
+    exponential backoff, until the maximum number of attempts is reached
+    """
+    # Laboratories that failed or were not available during this run.
+    # Remaining entries for these laboratories are not sent until next run
+    failed_labs = set()
+    limit = get_notification_concurrency()
+    outbox = get_outbox(portal)
+    while True:
+        entries = claim(portal, exclude=failed_labs, per_lab=limit)
+        if not entries:
+            break
+
+        # Resolve the objects and connections before the requests are sent,
+        # cause the threads that send them cannot access the database
+        deliveries = map(prepare, entries)
+        tasks = []
+        for entry, delivery in zip(entries, deliveries):
+            tasks.append((entry.get("remote_lab"), post, (entry, delivery)))
+        responses = run_concurrently(tasks, limit=limit)
+
+        # Store the responses back and update the outbox
+        for entry, delivery, response in zip(entries, deliveries, responses):
+            key = entry["key"]
+            if is_held_back(delivery):
+                # Not sent, the circuit breaker did not allow the request.
+                # Release the entry without counting the attempt
+                failed_labs.add(entry.get("remote_lab"))
+                if key in outbox:
+                    set_entry(dict(entry, claimed=0), portal=portal)
+                continue
+
+            try:
+                success = receive(entry, delivery, response)
+            except Exception as e:
+                logger.error("Cannot deliver {}: {}".format(key, e))
+                success = False
+
+            if success:
+                # Remove the entry from the outbox
+                remove_entry(key, portal=portal)
+            elif key in outbox:
+                # Schedule the next attempt
+                failed_labs.add(entry.get("remote_lab"))
+                set_entry(get_retry_entry(entry), portal=portal)
+
+        if not commit():
+            break
+
+
+def get_retry_entry(entry):
+    """Returns a copy of the entry passed-in for the next attempt, flagged as
+    failed if the maximum number of attempts has been reached
+    """
+    attempts = entry.get("attempts", 0) + 1
+    max_attempts = get_notification_max_attempts()
+    failed = max_attempts and attempts >= max_attempts
+    if failed:
+        logger.warn("Notification {} failed {} times. Giving up".format(
+            entry["key"], attempts))
+    next_attempt = time.time() + get_retry_delay(attempts)
+    return dict(entry, claimed=0, attempts=attempts, failed=bool(failed),
+                next_attempt=next_attempt)
+
+
+def prepare(entry):
+    """Returns a dict with the remote laboratory connection and the objects
+    the outbox entry passed-in is about, and whether the notification can be
+    sent to the remote laboratory at this moment
+    """
+    # Prevent circular imports
+    from senaite.referral.remotelab import get_remote_connection
+
+    uids = entry.get("uids") or []
+    objects = [api.get_object_by_uid(uid, default=None) for uid in uids]
+    laboratory = api.get_object_by_uid(entry.get("remote_lab"), default=None)
+    remote_lab = get_remote_connection(laboratory)
+    return {
+        "objects": filter(None, objects),
+        "remote_lab": remote_lab,
+        "allowed": remote_lab.can_send() if remote_lab else False,
+    }
+
+
+def is_held_back(delivery):
+    """Returns whether the notification was not sent because the circuit
+    breaker of the remote laboratory did not allow the request
+    """
+    return bool(delivery.get("remote_lab")) and not delivery.get("allowed")
+
+
+def post(entry, delivery):
+    """Sends the notification from the outbox entry passed-in and returns the
+    response. Returns None if the notification cannot be sent
+    """
+    if not delivery.get("allowed"):
+        return None
+    remote_lab = delivery["remote_lab"]
+    timeout = entry.get("timeout", 5)
+    return remote_lab.post(entry.get("payload"), timeout=timeout)
+
+
+def receive(entry, delivery, response):
+    """Stores the response of the notification from the outbox entry to the
+    objects the notification is about. Returns whether the notification was
+    successfully received by the remote laboratory
+    """
+    objects = delivery.get("objects")
+    payload = entry.get("payload")
+    remote_lab = delivery.get("remote_lab")
+    if not remote_lab:
+        response = get_post_base_info()
+        response.update({
+            "status": 500,
+            "reason": "ConnectionError",
+            "message": "Cannot connect to remote laboratory",
+            "success": False,
+        })
+        for obj in objects:
+            save_post(obj, payload, dict(response))
+        return False
+
+    response = remote_lab.receive(objects, payload, response)
+    if not isinstance(response, dict):
+        response = get_post_info(response)
+    return not is_error(response)
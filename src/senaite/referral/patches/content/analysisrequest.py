@@ -18,6 +18,7 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+from senaite.referral.catalog import INBOUND_SAMPLE_CATALOG
 from senaite.referral.interfaces import IInboundSampleShipment
 from senaite.referral.interfaces import IOutboundSampleShipment
 
@@ -89,14 +90,13 @@ def hasOutboundShipment(self):
 def getInboundSample(self):
     """Returns the Inbound Sample this sample was generated from, if any
     """
-    # TODO 2.x Replace by get_backreferences
-    shipment = self.getInboundShipment()
-    if not shipment:
+    if not self.hasInboundShipment():
         return None
 
+    # Look-up the inbound sample through the sample_uid index
     uid = api.get_uid(self)
-    for inbound_sample in shipment.getInboundSamples():
-        if inbound_sample.getRawSample() == uid:
-            return inbound_sample
-
-    return None
+    query = {"portal_type": "InboundSample", "sample_uid": uid}
+    brains = api.search(query, INBOUND_SAMPLE_CATALOG)
+    if not brains:
+        return None
+    return api.get_object(brains[0])
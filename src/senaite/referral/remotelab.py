@@ -18,14 +18,26 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import collections
 import math
+from uuid import uuid4
+
+import transaction
 from requests.auth import HTTPBasicAuth
 from senaite.core.supermodel import SuperModel
+from senaite.referral import circuitbreaker
 from senaite.referral import logger
 from senaite.referral.interfaces import IExternalLaboratory
+from senaite.referral.jsonapi.idempotency import IDEMPOTENCY_KEY
+from senaite.referral.outbox import enqueue
 from senaite.referral.notifications import get_post_base_info
 from senaite.referral.notifications import save_post
+from senaite.referral.utils import get_compress_notifications
+from senaite.referral.utils import get_connection_idle_timeout
+from senaite.referral.utils import get_connection_pool_size
 from senaite.referral.utils import get_lab_code
+from senaite.referral.utils import get_max_payload_size
+from senaite.referral.utils import get_notification_batch_size
 from senaite.referral.utils import get_notify_all_analyses
 from senaite.referral.utils import get_user_info
 from senaite.referral.utils import is_valid_url
@@ -34,6 +46,7 @@ from bika.lims import api
 from bika.lims.interfaces import IAnalysisRequest
 from bika.lims.utils import format_supsub
 from bika.lims.utils.analysis import format_uncertainty
+from remotesession import encode_payload
 from remotesession import RemoteSession
 
 
@@ -94,6 +107,76 @@ def skip_post_action_for(obj):
     return uid in uids
 
 
+def split_by_size(items, max_size):
+    """Splits the list of items passed-in in chunks, so the size of each
+    chunk, once serialized, does not exceed max_size bytes. Items that are
+    bigger than max_size are returned in a chunk of their own
+    """
+    if not max_size:
+        return [items]
+
+    chunks = []
+    chunk = []
+    chunk_size = 0
+    for item in items:
+        # length of the item serialized, plus the separator
+        item_size = len(encode_payload(item)) + 1
+        if chunk and chunk_size + item_size > max_size:
+            chunks.append(chunk)
+            chunk = []
+            chunk_size = 0
+        chunk.append(item)
+        chunk_size += item_size
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def get_analyses_batch(laboratory):
+    """Returns the batch of samples to notify about to the given laboratory
+    when the current transaction is about to be committed
+    """
+    txn = transaction.get()
+    batches = None
+    for hook, args, kwargs in txn.getBeforeCommitHooks():
+        if hook == send_analyses_batches:
+            batches = args[0]
+            break
+
+    if batches is None:
+        batches = {}
+        txn.addBeforeCommitHook(send_analyses_batches, args=(batches,))
+
+    lab_uid = api.get_uid(laboratory)
+    if lab_uid not in batches:
+        batches[lab_uid] = {
+            "laboratory": laboratory,
+            "samples": collections.OrderedDict(),
+        }
+    return batches[lab_uid]
+
+
+def send_analyses_batches(batches):
+    """Before commit hook that sends a notification per remote laboratory
+    with the analyses of the samples coalesced in the batch, split in chunks
+    of the notification batch size
+    """
+    batch_size = get_notification_batch_size()
+    for batch in batches.values():
+        remote_lab = get_remote_connection(batch["laboratory"])
+        if not remote_lab:
+            continue
+
+        samples = batch["samples"].values()
+        for num in range(0, len(samples), batch_size):
+            chunk = samples[num:num+batch_size]
+            # infer the timeout based on the number of samples
+            timeout = math.ceil((math.log(len(chunk))+1)*5)
+            timeout = max(batch.get("timeout", 0), timeout)
+            remote_lab.send_analyses(chunk, timeout=timeout)
+
+
 class RemoteLab(object):
 
     _session = None
@@ -111,7 +194,13 @@ class RemoteLab(object):
             username = self.laboratory.getUsername()
             password = self.laboratory.getPassword()
             auth = HTTPBasicAuth(username, password)
-            self._session = RemoteSession(self.laboratory_url, auth)
+            # The underlying HTTP session is pooled process-wide, so keep-alive
+            # connections are reused across requests and threads
+            self._session = RemoteSession(
+                self.laboratory_url, auth,
+                pool_size=get_connection_pool_size(),
+                idle_timeout=get_connection_idle_timeout(),
+                compress=get_compress_notifications())
         return self._session
 
     def do_action(self, obj, action, timeout=5):
@@ -140,16 +229,18 @@ class RemoteLab(object):
         if not items:
             return
 
-        timeout = api.to_int(timeout, default=0)
-        if timeout < 1:
-            # infer the timeout based on the number of items
-            timeout = math.ceil((math.log(len(items))+1)*5)
+        # Split the items so the payloads do not exceed the maximum size
+        for chunk in split_by_size(items, get_max_payload_size()):
+            chunk_timeout = api.to_int(timeout, default=0)
+            if chunk_timeout < 1:
+                # infer the timeout based on the number of items
+                chunk_timeout = math.ceil((math.log(len(chunk))+1)*5)
 
-        payload = {
-            "consumer": "senaite.referral.consumer",
-            "items": items,
-        }
-        self.notify(context, payload, timeout=timeout)
+            payload = {
+                "consumer": "senaite.referral.consumer",
+                "items": chunk,
+            }
+            self.notify(context, payload, timeout=chunk_timeout)
 
     def create_inbound_shipment(self, shipment, timeout=5):
         """Creates an Inbound Shipment counterpart object for the shipment
@@ -186,7 +277,37 @@ class RemoteLab(object):
 
     def update_analyses(self, sample, timeout=5):
         """Update the analyses from the remote laboratory with the information
-        provided with the sample passed-in
+        provided with the sample passed-in. Samples are coalesced per remote
+        laboratory and notified all together when the current transaction is
+        about to be committed
+        """
+        batch = get_analyses_batch(self.laboratory)
+        batch["samples"][api.get_uid(sample)] = sample
+        batch["timeout"] = max(batch.get("timeout", 0), timeout)
+
+    def send_analyses(self, samples, timeout=5):
+        """Sends a single notification to the remote laboratory for the update
+        of the analyses with the information provided with the samples
+        passed-in
+        """
+        samples_info = [self.get_sample_info(sample) for sample in samples]
+        if len(samples_info) == 1:
+            # Single-sample payload, supported by all versions
+            payload = {
+                "consumer": "senaite.referral.outbound_sample",
+                "sample": samples_info[0],
+            }
+        else:
+            payload = {
+                "consumer": "senaite.referral.outbound_sample",
+                "samples": samples_info,
+            }
+        self.notify(samples, payload, timeout=timeout)
+
+    def get_sample_info(self, sample):
+        """Returns a dict with the information of the sample passed-in and its
+        valid analyses, suitable for the update of the analyses from the
+        remote laboratory
         """
 
         def get_valid_analyses(sample):
@@ -313,15 +434,11 @@ class RemoteLab(object):
                 return api.get_title(method)
             return None
 
-        payload = {
-            "consumer": "senaite.referral.outbound_sample",
-            "sample": get_sample_info(sample),
-        }
-        self.notify(sample, payload, timeout=timeout)
+        return get_sample_info(sample)
 
-    def notify(self, obj, payload, timeout=5):
-        """Sends a post for the given payload and stores the response to the
-        object passed-in
+    def get_payload(self, payload):
+        """Returns the payload to be sent to the remote laboratory, with the
+        basics and reserved parameters in place
         """
         # Be sure we have the basics in place in the payload
         data = {"consumer": "senaite.referral.consumer"}
@@ -333,21 +450,104 @@ class RemoteLab(object):
             "lab_code": get_lab_code()
         })
 
+        # Key the remote laboratory relies on to identify repeated deliveries.
+        # Payloads that are sent again keep the key they were sent with
+        if not data.get(IDEMPOTENCY_KEY):
+            data[IDEMPOTENCY_KEY] = uuid4().hex
+        return data
+
+    def notify(self, obj, payload, timeout=5):
+        """Adds a notification with the given payload about the object/s
+        passed-in to the outbox. The notification is sent asynchronously once
+        the current transaction is committed and the response is stored to the
+        object/s afterwards. If the remote laboratory is not available, the
+        notification is stored as deferred to the object/s straight away
+        """
+        data = self.get_payload(payload)
+        enqueue(obj, self.laboratory, data, timeout=timeout)
+        if circuitbreaker.is_open(api.get_uid(self.laboratory)):
+            self.save_posts(obj, data, self.get_deferred_response())
+
+    def send(self, obj, payload, timeout=5):
+        """Sends a post for the given payload and stores the response to the
+        object/s passed-in. No request is sent if the remote laboratory is
+        not available, but a deferred response is stored instead
+        """
+        if not self.can_send():
+            response = self.get_deferred_response()
+            self.save_posts(obj, payload, response)
+            return response
+
         # Do the POST request and store the response for later use if required
         try:
-            response = self.session.post("push", data, timeout=timeout)
+            response = self.post(payload, timeout=timeout)
         except Exception as e:
+            response = e
+        return self.receive(obj, payload, response)
+
+    def can_send(self):
+        """Returns whether a notification can be sent to the remote laboratory
+        at this moment. Once called, the session is ready for `post` to be
+        called from other threads
+        """
+        self.session
+        return circuitbreaker.allow_request(api.get_uid(self.laboratory))
+
+    def post(self, payload, timeout=5):
+        """Sends a POST request with the given payload to the remote
+        laboratory and returns the response. It does not access the database,
+        so it can be called from other threads after `can_send`
+        """
+        return self.session.post("push", payload, timeout=timeout)
+
+    def receive(self, obj, payload, response):
+        """Stores the response (or the exception raised) of a POST request to
+        the object/s passed-in and keeps track of the remote laboratory
+        availability. Returns the response
+        """
+        lab_uid = api.get_uid(self.laboratory)
+        if isinstance(response, Exception):
+            circuitbreaker.record_failure(lab_uid)
+            logger.error(str(response))
             # Dummy response
+            error = response
             response = get_post_base_info()
             response.update({
                 "url": self.session.get_api_url("push"),
                 "status": 500,
-                "reason": type(e).__name__,
-                "message": str(e),
+                "reason": type(error).__name__,
+                "message": str(error),
                 "success": False,
             })
-            logger.error(str(e))
+        elif response.status_code >= 500:
+            circuitbreaker.record_failure(lab_uid)
+        else:
+            circuitbreaker.record_success(lab_uid)
+
+        # Store the response, so we can keep track of the POSTs made for the
+        # given objects and retry if necessary
+        self.save_posts(obj, payload, response)
+        return response
+
+    def save_posts(self, obj, payload, response):
+        """Stores the response to the object/s passed-in
+        """
+        objects = obj if isinstance(obj, (list, tuple)) else [obj]
+        for obj in objects:
+            save_post(obj, payload, response)
 
-        # Store the response, so we can keep track of the POSTs made for this
-        # given object and retry if necessary
-        save_post(obj, data, response)
+    def get_deferred_response(self):
+        """Returns a dummy response for notifications that are not sent
+        because the remote laboratory is not available
+        """
+        response = get_post_base_info()
+        response.update({
+            "url": self.session.get_api_url("push"),
+            "status": 503,
+            "reason": "Service Unavailable",
+            "message": "Remote laboratory is not available. The "
+                       "notification will be sent once it is back",
+            "success": False,
+            "deferred": True,
+        })
+        return response
@@ -18,20 +18,154 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import gzip
+import hashlib
 import json
+import threading
+import time
+from io import BytesIO
 
 import requests
+from requests.adapters import HTTPAdapter
 from senaite.referral import logger
-from six import string_types
 
+# Default number of connections kept alive per remote laboratory
+DEFAULT_POOL_SIZE = 10
 
-class RemoteSession(object):
+# Default number of seconds an unused session is kept alive
+DEFAULT_IDLE_TIMEOUT = 300
+
+# Payloads smaller than this number of bytes are never compressed
+MIN_COMPRESS_SIZE = 1024
+
+# Process-wide pool of sessions, keyed by host and credentials
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Whether the remote hosts accept gzip-encoded request bodies, as advertised
+# by the Accept-Encoding header of their responses (RFC 7694)
+_accept_gzip = {}
+
+
+class PooledSession(object):
+    """Wrapper of a requests.Session that keeps track of its last usage
+    """
+
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self.last_used = time.time()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def is_idle(self, idle_timeout, now=None):
+        """Returns whether the session has not been used for more than the
+        idle timeout (in seconds) passed-in
+        """
+        now = now or time.time()
+        return now - self.last_used > idle_timeout
+
+    def close(self):
+        self.session.close()
+
+
+def get_session_key(host, auth):
+    """Returns the key that identifies the pooled session for the given host
+    and credentials. Password is hashed so it is not kept in clear in the key
+    """
+    username = getattr(auth, "username", "") or ""
+    password = getattr(auth, "password", "") or ""
+    if not isinstance(password, bytes):
+        password = password.encode("utf-8")
+    return host, username, hashlib.sha1(password).hexdigest()
+
+
+def get_session(host, auth, pool_size=DEFAULT_POOL_SIZE,
+                idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Returns the requests.Session from the process-wide pool for the given
+    host and credentials. A new session is created if no session exists yet
+    or if the existing session was created with a different pool size.
+    Sessions that have been idle for longer than idle_timeout seconds are
+    closed and evicted from the pool
+    """
+    key = get_session_key(host, auth)
+    with _sessions_lock:
+        now = time.time()
+
+        # Evict idle sessions
+        for session_key, pooled in list(_sessions.items()):
+            if pooled.is_idle(idle_timeout, now=now):
+                logger.info("Closing idle session for {}".format(
+                    session_key[0]))
+                pooled.close()
+                del _sessions[session_key]
+
+        pooled = _sessions.get(key)
+        if pooled and pooled.pool_size != pool_size:
+            pooled.close()
+            pooled = None
+
+        if pooled is None:
+            pooled = PooledSession(pool_size)
+            _sessions[key] = pooled
+
+        pooled.last_used = now
+        return pooled.session
 
-    session = None
 
-    def __init__(self, host, auth):
+def encode_payload(payload):
+    """Returns the payload passed-in serialized as a JSON bytestring. Nested
+    values are serialized together with the payload in a single pass
+    """
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def compress(data):
+    """Returns the bytestring passed-in compressed with gzip
+    """
+    out = BytesIO()
+    with gzip.GzipFile(fileobj=out, mode="wb") as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def accepts_gzip(response):
+    """Returns whether the response passed-in advertises that the remote host
+    accepts gzip-encoded request bodies
+    """
+    accept_encoding = response.headers.get("Accept-Encoding", "")
+    encodings = [enc.split(";")[0].strip().lower()
+                 for enc in accept_encoding.split(",")]
+    return "gzip" in encodings
+
+
+def close_sessions():
+    """Closes all sessions from the pool
+    """
+    with _sessions_lock:
+        for pooled in _sessions.values():
+            pooled.close()
+        _sessions.clear()
+
+
+class RemoteSession(object):
+
+    def __init__(self, host, auth, pool_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, compress=True):
         self.host = host
         self.auth = auth
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.compress = compress
+
+    @property
+    def session(self):
+        """Returns the pooled requests.Session for this host and credentials,
+        so connections to the remote instance are kept alive and reused
+        """
+        return get_session(self.host, self.auth, pool_size=self.pool_size,
+                           idle_timeout=self.idle_timeout)
 
     def get_api_url(self, endpoint):
         """Returns the API url of the remote instance and endpoint
@@ -41,24 +175,34 @@ class RemoteSession(object):
             endpoint = "{}/{}/{}".format(self.host, api_slug, endpoint)
         return endpoint
 
-    def jsonify(self, data):
-        """Returns a JSONifed dict suitable for POST requests
-        """
-        output = {}
-        for key, value in data.items():
-            if not isinstance(value, string_types):
-                value = json.dumps(value)
-            output[key] = value
-        return output
-
     def post(self, endpoint, payload, timeout=5):
         url = self.get_api_url(endpoint)
-        payload = self.jsonify(payload)
+        data = encode_payload(payload)
+        headers = {"Content-Type": "application/json"}
+
+        # Compress the body if the remote host told us it supports it
+        compressed = False
+        if self.compress and len(data) >= MIN_COMPRESS_SIZE \
+                and _accept_gzip.get(self.host):
+            headers["Content-Encoding"] = "gzip"
+            data = compress(data)
+            compressed = True
 
         # Send the POST request
-        logger.info("[POST] {}".format(url))
-        logger.info("[POST PAYLOAD] {}".format(repr(payload)))
-        resp = requests.post(url, json=payload, auth=self.auth, timeout=timeout)
+        logger.info("[POST] {} ({} bytes{})".format(
+            url, len(data), ", gzip" if compressed else ""))
+        logger.debug("[POST PAYLOAD] {}".format(repr(payload)))
+        resp = self.session.post(url, data=data, headers=headers,
+                                 auth=self.auth, timeout=timeout)
+
+        # Keep track of the encodings the remote host accepts
+        _accept_gzip[self.host] = accepts_gzip(resp)
+
+        if compressed and resp.status_code == 415:
+            # Unsupported Media Type. Remote host does not accept gzip
+            logger.warn("{} does not accept gzip bodies".format(self.host))
+            _accept_gzip[self.host] = False
+            return self.post(endpoint, payload, timeout=timeout)
 
         # Return the response
         return resp
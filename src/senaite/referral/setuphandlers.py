@@ -34,6 +34,14 @@ CATALOGS = (
     ShipmentCatalog,
 )
 
+# Tuples of (catalog_id, index_id, indexed attribute, index type) to add to
+# catalogs not provided by this add-on
+CATALOG_INDEXES = [
+    ("portal_catalog", "laboratory_code", "", "FieldIndex"),
+    ("bika_catalog_analysisrequest_listing", "getRawInvalidated", "",
+     "FieldIndex"),
+]
+
 # Tuples of (folder_id, folder_name, type)
 PORTAL_FOLDERS = [
     ("external_labs", "External laboratories", "ExternalLaboratoryFolder"),
@@ -547,6 +555,12 @@ def setup_catalogs(portal):
                 logger.info("*** Mapped catalog '%s' for type '%s'"
                             % (catalog_id, portal_type))
 
+    # indexes for catalogs not provided by this add-on
+    for catalog_id, idx_id, idx_attr, idx_type in CATALOG_INDEXES:
+        catalog = api.get_tool(catalog_id)
+        if add_catalog_index(catalog, idx_id, idx_attr, idx_type):
+            to_reindex.append((catalog, idx_id))
+
     # reindex new indexes
     for catalog, idx_id in to_reindex:
         reindex_catalog_index(catalog, idx_id)
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import itertools
+import time
+import traceback
+from uuid import uuid4
+
+import transaction
+from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
+from senaite.referral import logger
+from senaite.referral.outbox import commit
+from senaite.referral.worker import register_job
+from senaite.referral.worker import wake_worker_after_commit
+from zope.annotation.interfaces import IAnnotations
+from ZODB.POSException import ConflictError
+
+from bika.lims import api
+
+TASKS_STORAGE = "senaite.referral.tasks"
+
+# Keys of the tasks, by UID of their context
+TASKS_BY_CONTEXT_STORAGE = "senaite.referral.tasks_by_context"
+
+# Tasks that reached the maximum number of attempts, kept apart so they are
+# not walked through when claiming the tasks to process
+TASKS_FAILED_STORAGE = "senaite.referral.tasks_failed"
+
+# Keys of the tasks waiting to be processed, by the time they can be claimed
+TASKS_SCHEDULE_STORAGE = "senaite.referral.tasks_schedule"
+
+# Number of seconds a task is kept claimed by a worker before another worker
+# is allowed to pick it up again
+TASK_CLAIM_TIMEOUT = 1800
+
+# Maximum number of times a task is processed before giving up
+MAX_TASK_ATTEMPTS = 3
+
+# Functions that process the tasks, keyed by task name. Modules register
+# their processors with `register_task`
+_processors = {}
+
+# Sequence that keeps the order of the tasks added within a same microsecond
+_sequence = itertools.count()
+
+
+def register_task(name):
+    """Decorator that registers a function as the processor of the tasks with
+    the given name. The function is called by the background worker with the
+    context of the task and the task itself as arguments
+    """
+    def decorator(func):
+        _processors[name] = func
+        return func
+    return decorator
+
+
+def get_tasks(portal=None):
+    """Returns the persistent storage of tasks that are waiting to be
+    processed by the background worker, sorted from oldest to newest
+    :returns: OOBTree
+    """
+    portal = portal or api.get_portal()
+    annotation = IAnnotations(portal)
+    if annotation.get(TASKS_STORAGE) is None:
+        annotation[TASKS_STORAGE] = OOBTree()
+    return annotation[TASKS_STORAGE]
+
+
+def get_failed_tasks(portal=None):
+    """Returns the persistent storage of tasks that reached the maximum
+    number of attempts, sorted from oldest to newest
+    :returns: OOBTree
+    """
+    portal = portal or api.get_portal()
+    build_schedule(portal)
+    return IAnnotations(portal)[TASKS_FAILED_STORAGE]
+
+
+def get_schedule(portal=None):
+    """Returns the persistent storage of the tasks that are waiting to be
+    processed, sorted by the time they can be claimed by a worker
+    :returns: OOTreeSet of (claimable time, key) tuples
+    """
+    portal = portal or api.get_portal()
+    build_schedule(portal)
+    return IAnnotations(portal)[TASKS_SCHEDULE_STORAGE]
+
+
+def build_schedule(portal):
+    """Builds the schedule of the tasks and moves the tasks that failed to
+    their own storage, if they do not exist
+    """
+    annotation = IAnnotations(portal)
+    storages = [TASKS_FAILED_STORAGE, TASKS_SCHEDULE_STORAGE]
+    if all(map(lambda name: annotation.get(name) is not None, storages)):
+        return
+    tasks = get_tasks(portal)
+    failed = OOBTree()
+    schedule = OOTreeSet()
+    for key, task in list(tasks.items()):
+        if task.get("failed"):
+            failed[key] = tasks.pop(key)
+        else:
+            schedule.insert(get_schedule_key(task))
+    annotation[TASKS_FAILED_STORAGE] = failed
+    annotation[TASKS_SCHEDULE_STORAGE] = schedule
+
+
+def get_schedule_key(task):
+    """Returns the key of the task in the schedule. Tasks that are not
+    claimed can be claimed right away
+    """
+    claimed = task.get("claimed") or 0
+    claimable = claimed + TASK_CLAIM_TIMEOUT if claimed else 0
+    return claimable, task["key"]
+
+
+def get_tasks_index(portal=None):
+    """Returns the persistent storage of the keys of the tasks, by UID of the
+    context they are about. The index is built from the tasks the first time
+    :returns: OOBTree of context UID -> OOTreeSet of task keys
+    """
+    portal = portal or api.get_portal()
+    annotation = IAnnotations(portal)
+    if annotation.get(TASKS_BY_CONTEXT_STORAGE) is None:
+        index = OOBTree()
+        tasks = itertools.chain(get_tasks(portal).items(),
+                                get_failed_tasks(portal).items())
+        for key, task in tasks:
+            index_task(index, task.get("context_uid"), key)
+        annotation[TASKS_BY_CONTEXT_STORAGE] = index
+    return annotation[TASKS_BY_CONTEXT_STORAGE]
+
+
+def index_task(index, uid, key):
+    """Adds the key of a task to the index, for the context with the UID
+    """
+    keys = index.get(uid)
+    if keys is None:
+        keys = OOTreeSet()
+        index[uid] = keys
+    keys.insert(key)
+
+
+def set_task(task, portal=None):
+    """Stores the task passed-in and updates the schedule. Tasks that failed
+    are moved to the storage of failed tasks
+    """
+    portal = portal or api.get_portal()
+    key = task["key"]
+    tasks = get_tasks(portal)
+    previous = tasks.get(key)
+    schedule = get_schedule(portal)
+    if previous:
+        schedule_key = get_schedule_key(previous)
+        if schedule_key in schedule:
+            schedule.remove(schedule_key)
+
+    if task.get("failed"):
+        tasks.pop(key, None)
+        get_failed_tasks(portal)[key] = task
+        return
+
+    tasks[key] = task
+    schedule.insert(get_schedule_key(task))
+
+
+def remove_task(key, portal=None):
+    """Removes the task with the given key from the storage and the indexes
+    """
+    task = get_tasks(portal).pop(key, None)
+    if task:
+        schedule = get_schedule(portal)
+        schedule_key = get_schedule_key(task)
+        if schedule_key in schedule:
+            schedule.remove(schedule_key)
+    else:
+        task = get_failed_tasks(portal).pop(key, None)
+    if not task:
+        return
+    index = get_tasks_index(portal)
+    uid = task.get("context_uid")
+    keys = index.get(uid)
+    if keys is None:
+        return
+    if key in keys:
+        keys.remove(key)
+    if not len(keys):
+        del index[uid]
+
+
+def add_task(name, context, **kwargs):
+    """Adds a task to be processed by the background worker for the given
+    context. The task is only persisted if the current transaction is
+    committed. The worker is woken up after the commit
+    :param name: name the task processor was registered with
+    :param context: the object the task is about
+    :param kwargs: additional data the task processor requires
+    :returns: the key of the task
+    """
+    if name not in _processors:
+        raise ValueError("No processor registered for task {}".format(name))
+    portal = api.get_portal()
+    key = "{:017.6f}-{:010d}-{}".format(time.time(), next(_sequence),
+                                        uuid4().hex)
+    uid = api.get_uid(context)
+    set_task({
+        "key": key,
+        "name": name,
+        "context_uid": uid,
+        "kwargs": kwargs,
+        "created": time.time(),
+        "claimed": 0,
+        "attempts": 0,
+        "failed": False,
+        "error": "",
+    }, portal=portal)
+    index_task(get_tasks_index(portal), uid, key)
+    wake_worker_after_commit(api.get_path(portal))
+    return key
+
+
+def get_context_tasks(context, portal=None):
+    """Returns the tasks for the given context, sorted from oldest to newest
+    """
+    uid = api.get_uid(context)
+    keys = get_tasks_index(portal).get(uid) or []
+    tasks = get_tasks(portal)
+    failed = get_failed_tasks(portal)
+    return filter(None, [tasks.get(key) or failed.get(key) for key in keys])
+
+
+def is_queued(context, portal=None):
+    """Returns whether the given context has tasks that are waiting to be
+    processed or being processed by the background worker
+    """
+    tasks = get_context_tasks(context, portal=portal)
+    return any(map(lambda task: not task.get("failed"), tasks))
+
+
+def is_claimed(task, now=None):
+    """Returns whether the task is being processed by a worker
+    """
+    claimed = task.get("claimed") or 0
+    if not claimed:
+        return False
+    now = now or time.time()
+    return now - claimed < TASK_CLAIM_TIMEOUT
+
+
+def claim(portal):
+    """Claims the oldest task that is waiting to be processed, in a
+    transaction of its own, so other workers (e.g. from other ZEO clients) do
+    not process it too. Returns None if there are no tasks to process
+    """
+    now = time.time()
+    tasks = get_tasks(portal)
+    task = None
+    for claimable, key in get_schedule(portal):
+        if claimable > now:
+            # tasks are sorted by the time they can be claimed
+            break
+        task = tasks.get(key)
+        if task and not is_claimed(task, now):
+            break
+        task = None
+
+    if not task:
+        return None
+
+    # Store the claimed task once the schedule is no longer iterated
+    task = dict(task, claimed=now)
+    set_task(task, portal=portal)
+    if not commit():
+        return None
+    return task
+
+
+@register_job
+def process_tasks(portal):
+    """Processes the tasks waiting in the storage, one transaction per task.
+    Tasks that fail are processed again until the maximum number of attempts
+    is reached
+    """
+    tasks = get_tasks(portal)
+    while True:
+        task = claim(portal)
+        if not task:
+            break
+
+        key = task["key"]
+        conflict = False
+        try:
+            process(task)
+            remove_task(key, portal)
+            transaction.commit()
+            continue
+        except ConflictError:
+            transaction.abort()
+            logger.warn("Conflict while processing task {}".format(key))
+            conflict = True
+            task = dict(task, claimed=0)
+        except Exception as e:
+            transaction.abort()
+            logger.error("Task {} failed: {}".format(key, e))
+            attempts = task.get("attempts", 0) + 1
+            failed = attempts >= MAX_TASK_ATTEMPTS
+            task = dict(task, claimed=0, attempts=attempts, failed=failed,
+                        error=traceback.format_exc())
+
+        # Release the task, so it can be processed again
+        if key in tasks:
+            set_task(task, portal=portal)
+        if not commit() or conflict:
+            # try again on next run
+            break
+
+
+def process(task):
+    """Processes the task passed-in with its registered processor
+    """
+    name = task.get("name")
+    processor = _processors.get(name)
+    if not processor:
+        raise ValueError("No processor registered for task {}".format(name))
+
+    uid = task.get("context_uid")
+    context = api.get_object_by_uid(uid, default=None)
+    if context is None:
+        logger.warn("Object {} for task {} not found. Skipping"
+                    .format(uid, task["key"]))
+        return
+
+    processor(context, task)
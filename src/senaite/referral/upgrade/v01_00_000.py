@@ -24,9 +24,17 @@ from senaite.referral import logger
 from senaite.referral.catalog import INBOUND_SAMPLE_CATALOG
 from senaite.referral.catalog import SHIPMENT_CATALOG
 from senaite.referral.config import PRODUCT_NAME as product
+from senaite.referral.jsonapi.idempotency import LEGACY_IDEMPOTENCY_STORAGE
+from senaite.referral.jsonapi.idempotency import set_processed
+from senaite.referral.notifications import NOTIFICATION_INDEXES
+from senaite.referral.outbox import build_indexes
 from senaite.referral.setuphandlers import setup_catalogs
 from senaite.referral.setuphandlers import setup_workflows
+from senaite.referral.tasks import build_schedule
+from senaite.referral.tasks import get_tasks_index
 from senaite.referral.utils import get_services_mapping
+from senaite.referral.utils import reindex_metadata
+from zope.annotation.interfaces import IAnnotations
 
 from bika.lims import api
 from bika.lims.utils import changeWorkflowState
@@ -268,3 +276,244 @@ def setup_results_notification(tool):
     setup = portal.portal_setup
     setup.runImportStepFromProfile(profile, "plone.app.registry")
     logger.info("Setup results notification settings [DONE]")
+
+
+def setup_connection_pool(tool):
+    logger.info("Setup connection pool settings ...")
+    portal = tool.aq_inner.aq_parent
+    setup = portal.portal_setup
+    setup.runImportStepFromProfile(profile, "plone.app.registry")
+    logger.info("Setup connection pool settings [DONE]")
+
+
+def setup_notification_batch_size(tool):
+    logger.info("Setup notification batch size settings ...")
+    portal = tool.aq_inner.aq_parent
+    setup = portal.portal_setup
+    setup.runImportStepFromProfile(profile, "plone.app.registry")
+    logger.info("Setup notification batch size settings [DONE]")
+
+
+def setup_notification_retry(tool):
+    logger.info("Setup notification retry settings ...")
+    portal = tool.aq_inner.aq_parent
+    setup = portal.portal_setup
+    setup.runImportStepFromProfile(profile, "plone.app.registry")
+    logger.info("Setup notification retry settings [DONE]")
+
+
+def setup_circuit_breaker(tool):
+    logger.info("Setup circuit breaker settings ...")
+    portal = tool.aq_inner.aq_parent
+    setup = portal.portal_setup
+    setup.runImportStepFromProfile(profile, "plone.app.registry")
+    logger.info("Setup circuit breaker settings [DONE]")
+
+
+def setup_payload_encoding(tool):
+    logger.info("Setup payload encoding settings ...")
+    portal = tool.aq_inner.aq_parent
+    setup = portal.portal_setup
+    setup.runImportStepFromProfile(profile, "plone.app.registry")
+    logger.info("Setup payload encoding settings [DONE]")
+
+
+def setup_notification_concurrency(tool):
+    logger.info("Setup notification concurrency settings ...")
+    portal = tool.aq_inner.aq_parent
+    setup = portal.portal_setup
+    setup.runImportStepFromProfile(profile, "plone.app.registry")
+    logger.info("Setup notification concurrency settings [DONE]")
+
+
+def setup_notification_indexes(tool):
+    logger.info("Setup notification indexes ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Setup catalogs
+    setup_catalogs(portal)
+
+    # Reindex the notification indexes and metadata of shipments and inbound
+    # samples
+    for catalog_id in [SHIPMENT_CATALOG, INBOUND_SAMPLE_CATALOG]:
+        brains = api.search({}, catalog_id)
+        total = len(brains)
+        for num, brain in enumerate(brains):
+            if num and num % 100 == 0:
+                logger.info("Reindexing notification indexes {}/{}"
+                            .format(num, total))
+            if num and num % 1000 == 0:
+                commit_transaction()
+            obj = api.get_object(brain, default=None)
+            if not obj:
+                continue
+            obj.reindexObject(idxs=NOTIFICATION_INDEXES)
+            obj._p_deactivate()
+
+    logger.info("Setup notification indexes [DONE]")
+
+
+def setup_laboratory_code_index(tool):
+    logger.info("Setup laboratory code index ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Setup catalogs. The new index is reindexed automatically
+    setup_catalogs(portal)
+
+    logger.info("Setup laboratory code index [DONE]")
+
+
+def setup_inbound_shipment_async_threshold(tool):
+    logger.info("Setup inbound shipment async threshold ...")
+    portal = tool.aq_inner.aq_parent
+    setup = portal.portal_setup
+
+    # Import registry, with the new setting
+    setup.runImportStepFromProfile(profile, "plone.app.registry")
+
+    logger.info("Setup inbound shipment async threshold [DONE]")
+
+
+def setup_consumer_async_threshold(tool):
+    logger.info("Setup consumer async threshold ...")
+    portal = tool.aq_inner.aq_parent
+    setup = portal.portal_setup
+
+    # Import registry, with the new setting
+    setup.runImportStepFromProfile(profile, "plone.app.registry")
+
+    logger.info("Setup consumer async threshold [DONE]")
+
+
+def backfill_inbound_sample_references(tool):
+    logger.info("Backfill inbound sample references ...")
+
+    # Reindex the sample indexes of inbound samples with a counterpart sample,
+    # so samples can resolve their inbound sample through the catalog
+    query = {"portal_type": "InboundSample"}
+    brains = api.search(query, INBOUND_SAMPLE_CATALOG)
+    total = len(brains)
+    for num, brain in enumerate(brains):
+        if num and num % 100 == 0:
+            logger.info("Backfill inbound sample references {}/{}"
+                        .format(num, total))
+        if num and num % 1000 == 0:
+            commit_transaction()
+        obj = api.get_object(brain, default=None)
+        if not obj:
+            continue
+        if obj.getRawSample():
+            obj.reindexObject(idxs=["sample_id", "sample_uid"])
+        obj._p_deactivate()
+
+    logger.info("Backfill inbound sample references [DONE]")
+
+
+def setup_shipment_listing_columns(tool):
+    logger.info("Setup shipment listing columns ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Setup catalogs, with the new metadata columns
+    setup_catalogs(portal)
+
+    # Update the metadata of shipments
+    brains = api.search({}, SHIPMENT_CATALOG)
+    total = len(brains)
+    for num, brain in enumerate(brains):
+        if num and num % 100 == 0:
+            logger.info("Updating shipment metadata {}/{}"
+                        .format(num, total))
+        if num and num % 1000 == 0:
+            commit_transaction()
+        obj = api.get_object(brain, default=None)
+        if not obj:
+            continue
+        reindex_metadata(obj)
+        obj._p_deactivate()
+
+    logger.info("Setup shipment listing columns [DONE]")
+
+
+def setup_inbound_sample_listing_columns(tool):
+    logger.info("Setup inbound sample listing columns ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Setup catalogs, with the new metadata columns
+    setup_catalogs(portal)
+
+    # Update the metadata of inbound samples
+    brains = api.search({}, INBOUND_SAMPLE_CATALOG)
+    total = len(brains)
+    for num, brain in enumerate(brains):
+        if num and num % 100 == 0:
+            logger.info("Updating inbound sample metadata {}/{}"
+                        .format(num, total))
+        if num and num % 1000 == 0:
+            commit_transaction()
+        obj = api.get_object(brain, default=None)
+        if not obj:
+            continue
+        reindex_metadata(obj)
+        obj._p_deactivate()
+
+    logger.info("Setup inbound sample listing columns [DONE]")
+
+
+def setup_tasks_index(tool):
+    logger.info("Setup tasks index ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Build the index of tasks by context from the existing tasks
+    get_tasks_index(portal)
+
+    logger.info("Setup tasks index [DONE]")
+
+
+def setup_outbox_indexes(tool):
+    logger.info("Setup outbox indexes ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Build the indexes by laboratory and next attempt from the entries
+    build_indexes(portal)
+
+    logger.info("Setup outbox indexes [DONE]")
+
+
+def setup_retest_index(tool):
+    logger.info("Setup retest index ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Setup catalogs, with the index of invalidated samples
+    setup_catalogs(portal)
+
+    logger.info("Setup retest index [DONE]")
+
+
+def setup_idempotency_storage(tool):
+    logger.info("Setup idempotency storage ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Move the idempotency keys to the storage of their laboratory, oldest
+    # first. Legacy keys are prefixed with the code of the laboratory
+    annotation = IAnnotations(portal)
+    legacy = annotation.get(LEGACY_IDEMPOTENCY_STORAGE)
+    if legacy is not None:
+        for timestamp, legacy_key in legacy["by_time"].keys():
+            processed = legacy["keys"].get(legacy_key)
+            if not processed:
+                continue
+            lab_code, _, key = legacy_key.partition(":")
+            set_processed(lab_code, key, processed[1], now=processed[0])
+        del annotation[LEGACY_IDEMPOTENCY_STORAGE]
+
+    logger.info("Setup idempotency storage [DONE]")
+
+
+def setup_tasks_schedule(tool):
+    logger.info("Setup tasks schedule ...")
+    portal = tool.aq_inner.aq_parent
+
+    # Move the failed tasks apart and schedule the ones waiting
+    build_schedule(portal)
+
+    logger.info("Setup tasks schedule [DONE]")
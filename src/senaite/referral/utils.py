@@ -39,6 +39,20 @@ from bika.lims.catalog import SETUP_CATALOG
 
 _marker = object()
 
+# Indexes to use for filtering objects by a given key, keyed by tuples of
+# (portal_type, key). Index with same name as key is used otherwise, if any
+INDEXED_FILTERS = {
+    ("ExternalLaboratory", "code"): "laboratory_code",
+}
+
+# Cache of object UIDs, keyed by tuples of (portal path, portal_type,
+# catalog, code)
+_codes_cache = {}
+
+# Cache of mappings built from catalog searches, keyed by tuples of
+# (portal path, mapping name). Values are tuples of (catalog counter, mapping)
+_mappings_cache = {}
+
 RESPONSES_ATTR_NAME = "_referal_post_responses"
 
 
@@ -92,21 +106,64 @@ def get_by_code(portal_type, code, catalog="portal_catalog"):
     """
     if not code:
         return None
+
+    # Try with the UID from the cache first, but check the object still
+    # matches, cause the cache might be outdated (e.g. other ZEO clients)
+    key = (api.get_path(api.get_portal()), portal_type, catalog, code)
+    uid = _codes_cache.get(key)
+    if uid:
+        obj = api.get_object_by_uid(uid, default=None)
+        if obj and api.get_portal_type(obj) == portal_type \
+                and get_field_value(obj, "code") == code:
+            return obj
+        _codes_cache.pop(key, None)
+
     query = {
         "portal_type": portal_type,
         "filters": {
             "code": code,
         }
     }
-    return search_with_filters(query, catalog, first_only=True)
+    obj = search_with_filters(query, catalog, first_only=True)
+    if obj:
+        _codes_cache[key] = api.get_uid(obj)
+    return obj
+
+
+def invalidate_codes_cache():
+    """Removes all entries from the cache of objects by code
+    """
+    _codes_cache.clear()
+
+
+def get_filter_index(catalog, portal_type, key):
+    """Returns the name of the index from the catalog that can be used to
+    filter objects of the given portal type by the key passed-in, if any
+    """
+    index = INDEXED_FILTERS.get((portal_type, key), key)
+    if index in catalog.indexes():
+        return index
+    return None
 
 
 def search_with_filters(query, catalog, first_only=False):
-    """Returns the objects for the code passed-in, if any
+    """Returns the objects for the code passed-in, if any. Filters for which
+    an index exists in the catalog are translated to index queries, the rest
+    are checked against the objects
     """
     qry = copy.deepcopy(query)
     filters = qry.pop("filters", {})
 
+    # Move the filters for which there is an index to the query
+    catalog_tool = api.get_tool(catalog)
+    portal_type = qry.get("portal_type")
+    if not isinstance(portal_type, string_types):
+        portal_type = None
+    for key in list(filters.keys()):
+        index = get_filter_index(catalog_tool, portal_type, key)
+        if index:
+            qry[index] = filters.pop(key)
+
     def is_match(obj):
         for key, value in filters.items():
             obj_value = get_field_value(obj, key)
@@ -157,6 +214,13 @@ def get_action_date(obj, action, default=_marker):
     return action_date
 
 
+def reindex_metadata(obj):
+    """Updates the catalog metadata of the object passed-in. Only the UID
+    index is reindexed, that is cheap and never changes
+    """
+    obj.reindexObject(idxs=["UID"])
+
+
 def get_image(name, **kwargs):
     """Returns a well-formed image
     :param name: file name of the image
@@ -178,6 +242,27 @@ def get_image_url(name):
         .format(portal_url, name)
 
 
+def get_registry_record(name, default=None):
+    """Returns the value of the registry record from this add-on with the
+    given name, or the default if the record does not exist or is not set
+    """
+    key = "{}.{}".format(PRODUCT_NAME, name)
+    try:
+        value = api.get_registry_record(key, default=default)
+    except InvalidParameterError:
+        return default
+    return default if value is None else value
+
+
+def get_int_registry_record(name, default, minimum=0):
+    """Returns the integer value of the registry record from this add-on with
+    the given name, or the default if not set. The value returned is never
+    below the minimum
+    """
+    value = api.to_int(get_registry_record(name), default)
+    return max(value, minimum)
+
+
 def get_lab_code():
     """Returns the code of the current lab instance
     """
@@ -195,12 +280,8 @@ def is_manual_inbound_shipment_permitted():
 def get_chunk_size_for(action):
     """Returns the chunk_size for the given action
     """
-    try:
-        key = "{}.chunk_size_{}".format(PRODUCT_NAME, action)
-        chunk_size = api.get_registry_record(key, default=5)
-    except InvalidParameterError:
-        chunk_size = 5
-    return api.to_int(chunk_size, 5)
+    name = "chunk_size_{}".format(action)
+    return api.to_int(get_registry_record(name), 5)
 
 
 def to_uids(value):
@@ -285,11 +366,44 @@ def get_user_info(user_or_username, default=_marker):
     return properties
 
 
+def get_catalog_counter(catalog):
+    """Returns a value that changes whenever the catalog passed-in changes.
+    The serial of the counter is included, so the value of a counter that was
+    increased in a transaction that was aborted is not mistaken by the same
+    value after a different change is committed
+    """
+    catalog = api.get_tool(catalog)
+    counter = getattr(catalog._catalog, "_counter", None)
+    serial = getattr(counter, "_p_serial", None)
+    return catalog.getCounter(), serial
+
+
+def get_cached_mapping(name, catalog, builder):
+    """Returns the mapping with the given name from the cache, if the catalog
+    did not change since the mapping was built. Otherwise, builds the mapping
+    with the builder function passed-in and stores it in the cache
+    """
+    counter = get_catalog_counter(catalog)
+    key = (api.get_path(api.get_portal()), name)
+    cached = _mappings_cache.get(key)
+    if not cached or cached[0] != counter:
+        cached = (counter, builder())
+        _mappings_cache[key] = cached
+    return dict(cached[1])
+
+
 def get_sample_types_mapping():
     """Returns a dict with sample type titles, ids and prefixes as keys and
     values as sample type UIDs to facilitate the retrieval by id, prefix or
     title
     """
+    return get_cached_mapping("sample_types", SETUP_CATALOG,
+                              build_sample_types_mapping)
+
+
+def build_sample_types_mapping():
+    """Builds the mapping of sample types from the setup catalog
+    """
     sample_types = dict()
     query = {"portal_type": "SampleType", "is_active": True}
     brains = api.search(query, SETUP_CATALOG)
@@ -311,6 +425,13 @@ def get_services_mapping():
     as service UIDs to facilitate the retrieval of services by title, keyword
     or by id
     """
+    return get_cached_mapping("services", SETUP_CATALOG,
+                              build_services_mapping)
+
+
+def build_services_mapping():
+    """Builds the mapping of services from the setup catalog
+    """
     services = dict()
     query = {"portal_type": "AnalysisService", "is_active": True}
     brains = api.search(query, SETUP_CATALOG)
@@ -340,3 +461,96 @@ def get_create_reference_analyses():
     """
     key = "{}.create_reference_analyses".format(PRODUCT_NAME)
     return api.get_registry_record(key, default=False)
+
+
+def get_connection_pool_size():
+    """Returns the maximum number of connections to keep alive per remote
+    laboratory
+    """
+    return get_int_registry_record("connection_pool_size", 10, minimum=1)
+
+
+def get_connection_idle_timeout():
+    """Returns the number of seconds a connection to a remote laboratory is
+    kept alive without being used
+    """
+    return get_int_registry_record("connection_idle_timeout", 300)
+
+
+def get_notification_batch_size():
+    """Returns the maximum number of samples to notify about to a remote
+    laboratory within a single notification
+    """
+    return get_int_registry_record("notification_batch_size", 50, minimum=1)
+
+
+def get_notification_max_attempts():
+    """Returns the maximum number of times a notification is sent to a remote
+    laboratory before giving up. Returns 0 if there is no limit
+    """
+    return get_int_registry_record("notification_max_attempts", 10)
+
+
+def get_notification_retry_delay():
+    """Returns the number of seconds to wait before sending again a
+    notification that failed for the first time
+    """
+    return get_int_registry_record("notification_retry_delay", 60)
+
+
+def get_notification_max_retry_delay():
+    """Returns the maximum number of seconds to wait before sending again a
+    notification that failed
+    """
+    return get_int_registry_record("notification_max_retry_delay", 3600)
+
+
+def get_circuit_breaker_threshold():
+    """Returns the number of consecutive failed requests to a remote laboratory
+    after which no more requests are sent to it for a while. Returns 0 if the
+    circuit breaker is disabled
+    """
+    return get_int_registry_record("circuit_breaker_threshold", 5)
+
+
+def get_circuit_breaker_reset_timeout():
+    """Returns the number of seconds to wait before a request is sent again
+    to a remote laboratory that was considered unavailable
+    """
+    return get_int_registry_record("circuit_breaker_reset_timeout", 60)
+
+
+def get_compress_notifications():
+    """Returns whether the notifications to remote laboratories have to be
+    compressed when supported by the remote laboratory
+    """
+    return get_registry_record("compress_notifications", default=True)
+
+
+def get_max_payload_size():
+    """Returns the maximum size in bytes of the payload of a notification to
+    a remote laboratory. Returns 0 if there is no limit
+    """
+    return get_int_registry_record("max_payload_size", 1024) * 1024
+
+
+def get_notification_concurrency():
+    """Returns the maximum number of notifications that are sent at once to a
+    same remote laboratory
+    """
+    return get_int_registry_record("notification_concurrency", 4, minimum=1)
+
+
+def get_inbound_shipment_async_threshold():
+    """Returns the maximum number of samples of an inbound shipment that are
+    imported within the push request. Returns 0 if there is no limit
+    """
+    return get_int_registry_record("inbound_shipment_async_threshold", 50)
+
+
+def get_consumer_async_threshold():
+    """Returns the maximum number of items of a notification received from a
+    remote laboratory that are processed within the push request. Returns 0
+    if there is no limit
+    """
+    return get_int_registry_record("consumer_async_threshold", 20)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.REFERRAL.
+#
+# SENAITE.REFERRAL is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2021-2022 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import threading
+from contextlib import contextmanager
+
+import transaction
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from AccessControl.users import UnrestrictedUser
+from senaite.referral import logger
+from senaite.referral.interfaces import ISenaiteReferralLayer
+from zope.component.hooks import setSite
+from zope.globalrequest import clearRequest
+from zope.globalrequest import setRequest
+from zope.interface import alsoProvides
+
+# Number of seconds the worker waits between runs when not woken up
+POLL_INTERVAL = 60
+
+# Id of the user the worker acts as
+WORKER_USER_ID = "senaite.referral.worker"
+
+# Functions to be called by the worker on each run, with the portal as the
+# only argument. Modules register their jobs with `register_job`
+_jobs = []
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def register_job(func):
+    """Registers a function to be called by the background worker on each run
+    with the portal object as the sole argument. Can be used as a decorator
+    """
+    if func not in _jobs:
+        _jobs.append(func)
+    return func
+
+
+@contextmanager
+def site_context(portal_path):
+    """Opens a new ZODB connection, sets the site hook, a request with the
+    referral layer and an unrestricted user, and yields the portal object.
+    Changes are not committed unless explicitly done inside the context
+    """
+    import Zope2
+    from Testing.makerequest import makerequest
+
+    app = makerequest(Zope2.app())
+    request = app.REQUEST
+    try:
+        portal = app.unrestrictedTraverse(portal_path)
+        setSite(portal)
+        alsoProvides(request, ISenaiteReferralLayer)
+        setRequest(request)
+        user = UnrestrictedUser(WORKER_USER_ID, "", ["Manager"], [])
+        newSecurityManager(request, user.__of__(portal.acl_users))
+        yield portal
+    finally:
+        transaction.abort()
+        noSecurityManager()
+        setSite(None)
+        clearRequest()
+        app._p_jar.close()
+
+
+class Worker(threading.Thread):
+    """Daemon thread that runs the registered jobs for the portals it has been
+    woken up for, either on demand or every POLL_INTERVAL seconds
+    """
+
+    def __init__(self):
+        super(Worker, self).__init__(name="senaite.referral.worker")
+        self.daemon = True
+        self.portal_paths = set()
+        self.event = threading.Event()
+
+    def wake(self, portal_path):
+        """Tells the worker to run the jobs for the given portal
+        """
+        self.portal_paths.add(portal_path)
+        self.event.set()
+
+    def run(self):
+        while True:
+            self.event.wait(POLL_INTERVAL)
+            self.event.clear()
+            for portal_path in list(self.portal_paths):
+                self.process(portal_path)
+
+    def process(self, portal_path):
+        """Runs the registered jobs for the portal with the given path
+        """
+        try:
+            with site_context(portal_path) as portal:
+                for job in list(_jobs):
+                    job(portal)
+        except Exception as e:
+            logger.error("Worker failed for {}: {}".format(portal_path, e))
+
+
+def get_worker():
+    """Returns the background worker of this process, started
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = Worker()
+            _worker.start()
+        return _worker
+
+
+def wake_worker(portal_path):
+    """Wakes up the background worker of this process for the given portal
+    """
+    get_worker().wake(portal_path)
+
+
+def _wake_after_commit(status, portal_path):
+    """After commit hook that wakes up the worker if the transaction succeeded
+    """
+    if status:
+        wake_worker(portal_path)
+
+
+def wake_worker_after_commit(portal_path):
+    """Wakes up the background worker for the given portal as soon as the
+    current transaction is successfully committed
+    """
+    txn = transaction.get()
+    for hook, args, kwargs in txn.getAfterCommitHooks():
+        if hook == _wake_after_commit and args == (portal_path,):
+            return
+    txn.addAfterCommitHook(_wake_after_commit, args=(portal_path,))
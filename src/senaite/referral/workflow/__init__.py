@@ -122,6 +122,15 @@ def restore_referred_sample(sample):
     sample.reindexObject()
 
 
+def can_queue(action, chunk_size=None):
+    """Returns whether the queue is available for the given action
+    """
+    if not callable(is_queue_ready) or not is_queue_ready():
+        return False
+    chunk_size = api.to_int(chunk_size, default=get_chunk_size_for(action))
+    return chunk_size > 0
+
+
 def do_queue_or_action_for(objects, action, **kwargs):
     """Adds and returns a queue action task for the object/s and action if the
     queue is available. Otherwise, does the action as usual and returns None
@@ -133,30 +142,31 @@ def do_queue_or_action_for(objects, action, **kwargs):
     if not objects:
         return
 
-    if callable(is_queue_ready) and is_queue_ready():
+    chunk_size = kwargs.pop("chunk_size", None)
+    if can_queue(action, chunk_size=chunk_size):
         # queue is installed and ready
         kwargs["delay"] = kwargs.get("delay", 10)
         context = kwargs.pop("context", objects[0])
-        chunk_size = kwargs.pop("chunk_size", None)
         chunk_size = api.to_int(chunk_size, default=get_chunk_size_for(action))
-        if chunk_size > 0:
-            kwargs["chunk_size"] = chunk_size
-            context = api.get_object(context)
-            return add_action_task(objects, action, context=context, **kwargs)
+        kwargs["chunk_size"] = chunk_size
+        context = api.get_object(context)
+        return add_action_task(objects, action, context=context, **kwargs)
 
     # perform the workflow action
     for obj in objects:
         doActionFor(obj, action)
 
 
-def change_workflow_state(content, wf_id, state_id, **kwargs):
-    """Changes the workflow status manually
+def set_workflow_state(content, wf_id, state_id, **kwargs):
+    """Sets the workflow status manually and updates the role mappings of the
+    object accordingly. Neither notifies nor reindexes the object. Returns a
+    tuple (workflow, old_state, new_state, wf_state) or None
     """
     portal_workflow = api.get_tool("portal_workflow")
     workflow = portal_workflow.getWorkflowById(wf_id)
     if not workflow:
         logger.error("%s: Cannot find workflow id %s" % (content, wf_id))
-        return False
+        return None
 
     action = kwargs.get("action", None)
     wf_state = {
@@ -177,12 +187,29 @@ def change_workflow_state(content, wf_id, state_id, **kwargs):
     # Change status and update permissions
     portal_workflow.setStatusOf(wf_id, content, wf_state)
     workflow.updateRoleMappingsFor(content)
+    return workflow, old_state, new_state, wf_state
 
-    # Notify the object has been transitioned
-    transition = workflow.transitions.get(action)
+
+def notify_transition(content, changed):
+    """Notifies the AfterTransitionEvent for the change of workflow state
+    passed-in, as returned by set_workflow_state
+    """
+    workflow, old_state, new_state, wf_state = changed
+    transition = workflow.transitions.get(wf_state["action"])
     if transition:
         notify(AfterTransitionEvent(content, workflow, old_state, new_state,
                                     transition, wf_state, None))
 
+
+def change_workflow_state(content, wf_id, state_id, **kwargs):
+    """Changes the workflow status manually
+    """
+    changed = set_workflow_state(content, wf_id, state_id, **kwargs)
+    if not changed:
+        return False
+
+    # Notify the object has been transitioned
+    notify_transition(content, changed)
+
     # Map changes to catalog
     content.reindexObject()
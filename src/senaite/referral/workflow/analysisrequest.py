@@ -19,6 +19,7 @@
 # Some rights reserved, see README and LICENSE.
 
 from senaite.referral import check_installed
+from senaite.referral.content.analysisrequest import reindex_inbound_sample
 from senaite.referral.interfaces import IInboundSampleShipment
 from senaite.referral.interfaces import IOutboundSampleShipment
 from senaite.referral.remotelab import get_remote_connection
@@ -63,6 +64,9 @@ def AfterTransitionEventHandler(sample, event): # noqa lowercase
     if event.transition.id == "receive":
         after_receive(sample)
 
+    # Update the metadata of the inbound sample the sample comes from
+    reindex_inbound_sample(sample)
+
 
 def after_no_sampling_workflow(sample):
     """Automatically receive and ship samples for which an outbound shipment
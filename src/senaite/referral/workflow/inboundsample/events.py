@@ -18,6 +18,10 @@
 # Copyright 2021-2022 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import transaction
+from senaite.referral.core.catalog.deferred import deferred_indexing
+from senaite.referral.core.catalog.deferred import immediate_indexing
+from senaite.referral.utils import get_chunk_size_for
 from senaite.referral.utils import get_sample_types_mapping
 from senaite.referral.utils import get_services_mapping
 
@@ -25,6 +29,12 @@ from bika.lims import api
 from bika.lims.utils.analysisrequest import create_analysisrequest
 from bika.lims.workflow import doActionFor
 
+# Name of the request flag set while inbound samples are received in bulk
+BULK_RECEPTION = "senaite.referral.bulk_reception"
+
+# Indexes of InboundSample that depend on the counterpart sample
+SAMPLE_INDEXES = ["sample_id", "sample_uid"]
+
 
 def after_receive_inbound_sample(inbound_sample):
     """Event fired after a transition "receive_inbound_sample" for an
@@ -32,19 +42,66 @@ def after_receive_inbound_sample(inbound_sample):
     in current instance and tries to receive the whole inbound shipment
     afterwards
     """
+    if api.get_request().get(BULK_RECEPTION):
+        # The counterpart sample is created by `receive_inbound_samples`
+        return
+
+    # Create and receive the counterpart sample. The inbound sample is
+    # reindexed only once, with the indexes that depend on the sample
+    with deferred_indexing():
+        receive_sample(inbound_sample)
+
+    # Try with the whole shipment
+    shipment = inbound_sample.getInboundShipment()
+    doActionFor(shipment, "receive_inbound_shipment")
+
+
+def receive_inbound_samples(shipment, inbound_samples):
+    """Receives the inbound samples passed-in and creates their counterpart
+    samples, with a savepoint after each chunk. The mappings of services and
+    sample types are resolved once and the reception of the whole shipment is
+    only tried at the end, after all inbound samples are processed
+    """
+    services = get_services_mapping()
+    sample_types = get_sample_types_mapping()
+    chunk_size = get_chunk_size_for("receive_inbound_sample")
+
+    # Each inbound sample is indexed once, with the indexes modified by the
+    # transition and the creation of the counterpart sample only
+    request = api.get_request()
+    request.set(BULK_RECEPTION, True)
+    try:
+        with deferred_indexing():
+            for num, inbound_sample in enumerate(inbound_samples, start=1):
+                success, message = doActionFor(inbound_sample,
+                                               "receive_inbound_sample")
+                if success:
+                    receive_sample(inbound_sample, services=services,
+                                   sample_types=sample_types)
+                if chunk_size > 0 and num % chunk_size == 0:
+                    transaction.savepoint(optimistic=True)
+    finally:
+        request.set(BULK_RECEPTION, False)
+
+    # Try with the whole shipment
+    doActionFor(shipment, "receive_inbound_shipment")
+
+
+def receive_sample(inbound_sample, services=None, sample_types=None):
+    """Creates and receives the counterpart sample of the inbound sample
+    passed-in, if it does not exist yet. Returns the sample created, if any
+    """
     if inbound_sample.getRawSample():
         # There is a counterpart sample already
-        return
+        return None
 
     # Create the sample
-    sample = create_sample(inbound_sample)
+    sample = create_sample(inbound_sample, services=services,
+                           sample_types=sample_types)
 
     # Auto-receive the sample object
     doActionFor(sample, "receive")
-
-    # Try with the whole shipment
-    shipment = inbound_sample.getInboundShipment()
-    doActionFor(shipment, "receive_inbound_shipment")
+    return sample
 
 
 def after_reject_inbound_sample(inbound_sample):
@@ -62,8 +119,11 @@ def after_reject_inbound_sample(inbound_sample):
     doActionFor(shipment, "reject_inbound_shipment")
 
 
-def create_sample(inbound_sample):
+def create_sample(inbound_sample, services=None, sample_types=None):
     """Creates a counterpart sample for the inbound sample passed in
+    :param services: mapping of services, as returned by get_services_mapping
+    :param sample_types: mapping of sample types, as returned by
+        get_sample_types_mapping
     """
     # Get the shipment that contains this inbound sample
     shipment = inbound_sample.getInboundShipment()
@@ -73,8 +133,10 @@ def create_sample(inbound_sample):
     client = api.get_object(client)
 
     # Get baseline objects mappings
-    services = get_services_mapping()
-    sample_types = get_sample_types_mapping()
+    if services is None:
+        services = get_services_mapping()
+    if sample_types is None:
+        sample_types = get_sample_types_mapping()
 
     # Create the sample object
     sample_type = inbound_sample.getSampleType()
@@ -102,6 +164,11 @@ def create_sample(inbound_sample):
     request = api.get_request()
     sample = create_analysisrequest(client, request, values, services_uids)
 
-    # Associate this new Sample with the Inbound Sample
+    # Associate this new Sample with the Inbound Sample and reindex, so the
+    # back-reference from the sample can be resolved through the catalog.
+    # The reindex is not deferred, cause the inbound sample is looked up
+    # from the sample when received
     inbound_sample.setSample(sample)
+    with immediate_indexing():
+        inbound_sample.reindexObject(idxs=SAMPLE_INDEXES)
     return sample
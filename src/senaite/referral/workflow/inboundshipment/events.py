@@ -19,7 +19,10 @@
 # Some rights reserved, see README and LICENSE.
 
 from senaite.referral.remotelab import get_remote_connection
+from senaite.referral.workflow import can_queue
 from senaite.referral.workflow import do_queue_or_action_for
+from senaite.referral.workflow.inboundsample.events import \
+    receive_inbound_samples
 
 from bika.lims import api
 from bika.lims.workflow import doActionFor as do_action_for
@@ -33,7 +36,13 @@ def after_receive_inbound_samples(shipment):
     """
     # Try to receive (or queue the reception) of inbound samples
     samples = shipment.getInboundSamples()
-    do_queue_or_action_for(samples, "receive_inbound_sample", context=shipment)
+    if can_queue("receive_inbound_sample"):
+        do_queue_or_action_for(samples, "receive_inbound_sample",
+                               context=shipment)
+        return
+
+    # Receive all inbound samples at once
+    receive_inbound_samples(shipment, samples)
 
 
 def after_receive_inbound_shipment(shipment):